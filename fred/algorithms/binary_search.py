@@ -1,6 +1,13 @@
 from .. import fredutil
 from .. import freddebugger
 from .. import fredmanager
+from .. import fredhistory
+import math
+import re
+import time
+import cost_model
+import parallel_search
+import watch_search
 
 """
 This file contains all algorithms for performing binary search over a
@@ -11,6 +18,49 @@ instance of ReversibleDebugger, representing the debugger session on
 which to perform the binary search.
 """
 
+# How NEW_binary_search_history() chooses its probes:
+#   "bisect":   bisect the whole interval.
+#   "gallop":   first probe 1, 2, 4, 8, ... commands back from the end of the
+#               interval, then bisect the last gap.  Fewer evaluations of
+#               the expression when it changed only a few commands ago, but
+#               never fewer restarts, since half the bisection probes are
+#               ahead of the debugger and need none (see _ProbeBase).  For a
+#               history of 2000 'next's (fredbench.py -b history-search
+#               -n 2000), gallop evaluates the expression once where bisect
+#               does 11 times, with the same one restart, for a change 1
+#               command back.  For one 10 back, it evaluates it 8 times
+#               where bisect does 11, but restarts 6 times where bisect
+#               does 3.  For one 1000 back, it does worse on both (20
+#               evaluations and 18 restarts, against 10 and 10).  So it
+#               only pays for recent changes of expressions which are slow
+#               to evaluate (calling inferior functions, say).
+#   "forward":  first probe 1, 2, 4, 8, ... commands forward from the start
+#               of the interval, then bisect the last gap.  Only the first
+#               of these probes restarts.
+#   "linear":   probe each command forward from the start of the interval:
+#               one restart, but an evaluation per command.
+# gs_history_search may also be "auto":  the cheapest one for each search,
+# according to cost_model.py.  Most predicates searched for can change back
+# and forth over the history (a watched value going 5, 3, 5; a breakpoint in
+# a loop), and then each strategy may find a different change.  So "auto"
+# bisects those, and only chooses for searches declared monotone.
+GL_HISTORY_SEARCH_STRATEGIES = ["bisect", "gallop", "forward", "linear"]
+gs_history_search = "bisect"
+# How reverse-watch finds the command which last changed the expression:
+#   "bisect":  binary search over the history (NEW_binary_search_history()).
+#   "watch":   one replay with a counting watchpoint (see watch_search.py),
+#              falling back to "bisect" for expressions it cannot watch.
+GL_REVERSE_WATCH_ENGINES = ["bisect", "watch"]
+gs_reverse_watch_engine = "bisect"
+# A long NEW_binary_search_history() takes a temporary checkpoint at a
+# probe (and restarts the later probes from there) when the remaining
+# interval has at least GN_TEMP_CHECKPOINT_MIN_WIDTH commands, and the
+# replay it would save costs GF_TEMP_CHECKPOINT_PAYOFF times more than a
+# checkpoint, as measured in this session:
+gb_temporary_checkpoints = True
+GN_TEMP_CHECKPOINT_MIN_WIDTH = 8
+GF_TEMP_CHECKPOINT_PAYOFF = 2.0
+
 # This exception happens only for reverse_watch currently.
 class BinarySearchTooFarAtStartError(Exception):
     pass
@@ -18,6 +68,61 @@ class BinarySearchTooFarAtStartError(Exception):
 class BinarySearchFailedError(Exception):
     pass
 
+class ExpressionTest():
+    """A testIfTooFar() predicate: True once s_expr has value s_expr_val.
+    Unlike a lambda, it can also be answered from the debugger's cache of
+    expression values, for a position the debugger is not at."""
+    def __init__(self, dbg, s_expr, s_expr_val):
+        self.dbg = dbg
+        self.s_expr = s_expr
+        self.s_expr_val = s_expr_val
+
+    def __call__(self):
+        return self.dbg.test_expression(self.s_expr, self.s_expr_val)
+
+    def cached_at(self, key):
+        """Return the test result at the position with the given key, or
+        None if it is not cached."""
+        return self.dbg.cached_test_expression(key, self.s_expr,
+                                               self.s_expr_val)
+
+class ShallowerOrTest():
+    """A testIfTooFar() predicate: True once the stack is no deeper than
+    n_level, or testIfTooFar()."""
+    def __init__(self, dbg, n_level, testIfTooFar):
+        self.dbg = dbg
+        self.n_level = n_level
+        self.testIfTooFar = testIfTooFar
+
+    def __call__(self):
+        return self.dbg.state().level() <= self.n_level or \
+            self.testIfTooFar()
+
+def _is_side_effect_free_test(testIfTooFar):
+    """Return True if testIfTooFar() cannot change the program state, so
+    that replaying forward from a position where it was evaluated is the
+    same execution as replaying there after a restart.  Predicates other
+    than ExpressionTests only query the debugger (stack depth,
+    breakpoints)."""
+    if isinstance(testIfTooFar, ShallowerOrTest):
+        return _is_side_effect_free_test(testIfTooFar.testIfTooFar)
+    if isinstance(testIfTooFar, ExpressionTest):
+        return freddebugger._is_side_effect_free(testIfTooFar.s_expr)
+    return True
+
+def _cached_probe(dbg, testIfTooFar, key):
+    """Return 'not program_is_running() or testIfTooFar()' at the position
+    with the given key if the expression cache knows it, else None."""
+    if not isinstance(testIfTooFar, ExpressionTest):
+        return None
+    b_running = dbg.cached_expression_value(
+        key, freddebugger.GS_PROGRAM_IS_RUNNING_EXPR)
+    if b_running == None:
+        return None
+    if not b_running:
+        return True
+    return testIfTooFar.cached_at(key)
+
 def _binary_search_repeated_next(dbg, testIfTooFar):
     """Perform repeated 'next' commands until the expression changes."""
     if testIfTooFar():
@@ -42,8 +147,7 @@ def _binary_search_regular_next_expansion(dbg, testIfTooFar):
     l_history = dbg.copy_current_checkpoint_history()
     while l_history[-1].is_next():
         level = dbg.state().level()
-        testIfTooFar2 = \
-            lambda: dbg.state().level() <= level or testIfTooFar()
+        testIfTooFar2 = ShallowerOrTest(dbg, level, testIfTooFar)
         (l_history, n_min) = \
             NEW_binary_search_expand_next(dbg, l_history, testIfTooFar2)
         if len(l_history) - n_min > 1:
@@ -58,7 +162,9 @@ def _binary_search_regular_next_expansion(dbg, testIfTooFar):
 
 def binary_search_log_events(dbg, testIfTooFar):
     """Performs a binary search over log events (from the
-    record/replay log) using fred_command."""
+    record/replay log) using FReD log breakpoints.  Returns the index of
+    the log event during which the expression changed; the debugger is
+    left just before it."""
     # XXX: This hasn't been tested except with gdb, so I am
     # leaving this assertion until we test. -Tyler
     fredutil.fred_assert(dbg.personality_name() == "gdb")
@@ -67,42 +173,60 @@ def binary_search_log_events(dbg, testIfTooFar):
     n_count = n_max = fredmanager.get_total_entries()
     fredutil.fred_assert(n_max != None)
 
+    # The log event the debugger is stopped at (None: not a probe, or
+    # testIfTooFar() may have changed the program state there):
+    n_at = None
+    b_reuse_position = _is_side_effect_free_test(testIfTooFar)
     while n_max - n_min > 1:
         n_count = (n_min + n_max) / 2
-        dbg.do_restart(b_clear_history = True)
+        if b_reuse_position and n_at != None and n_at < n_count:
+            # Replay is deterministic:  just continue to the next probe.
+            freddebugger.gn_total_restarts_avoided += 1
+        else:
+            if n_at != None:
+                # Not strictly necessary (since we restart), but cleaner:
+                fredmanager.send_fred_continue()
+            dbg.do_restart(b_clear_history = True)
         dbg.set_log_breakpoint(n_count)
         dbg.do_log_continue()
+        n_at = n_count
         if not dbg.program_is_running() or testIfTooFar():
             fredutil.fred_debug("Setting max bound %d" % n_count)
             n_max = n_count
         else:
             fredutil.fred_debug("Setting min bound %d" % n_count)
             n_min = n_count
-        # Not strictly necessary (since we restart), but cleaner:
-        fredmanager.send_fred_continue()
-        
+    fredmanager.send_fred_continue()
+
     # As a "hint", upstream callers will start a round-robin search in
-    # the thread whose event preceded the expression changed. It may
-    # not be the correct thread, but it is a good place to start.        
-    # XXX: The hint thread is wrong -- it is the thread which owns the
-    # event *before* the min bound event.
-    n_hint_tid = fredmanager.get_current_thread()
-    fredutil.fred_debug("Expression changed with log event # %d "
-                        "in thread %d" % (n_count, n_hint_tid))
-    # At this point, we know the expression changes value at log
-    # event n_count. Restart and replay to the previous log event.
+    # the thread which owns log event n_min, the event performed while the
+    # expression changed. It may not be the correct thread, but it is a
+    # good place to start.  Without the log index, fall back on the
+    # thread of the event before it.
+    log_index = fredmanager.get_log_index()
+    if log_index != None and n_min < len(log_index):
+        n_hint_tid = log_index.clone_id(n_min)
+    else:
+        n_hint_tid = None
+    # At this point, we know the expression changes value between log
+    # events n_min and n_max. Restart and replay to n_min.
     dbg.do_restart(b_clear_history = True)
-    dbg.set_log_breakpoint(n_count - 1)
+    dbg.set_log_breakpoint(n_min)
     dbg.do_log_continue()
+    if n_hint_tid == None:
+        n_hint_tid = fredmanager.get_current_thread()
+    fredutil.fred_debug("Expression changed with log event # %d "
+                        "in thread %d" % (n_min, n_hint_tid))
     # Switch to the "culprit" thread.
     dbg.do_switch_to_thread(n_hint_tid)
+    return n_min
 
 def NEW_binary_search_since_last_checkpoint(dbg, l_history, n_min,
                                             s_expr, s_expr_val):
-    testIfTooFar = lambda: dbg.test_expression(s_expr, s_expr_val)
+    testIfTooFar = ExpressionTest(dbg, s_expr, s_expr_val)
     # After replaying l_history([0:n_min]), testIfTooFar() should be False
-    l_history = NEW_binary_search_history(dbg, l_history,
-                                          n_min, testIfTooFar)
+    l_history = _search_history_for_change(dbg, l_history,
+                                           n_min, testIfTooFar)
     # l_history[-1] now guaranteed to be 'c', 'n', or 's'
     #   and testIfTooFar changes upon executing l_history[-1]
     # Note that if we're at breakpoint and l_history[-1] == 'n',
@@ -121,8 +245,8 @@ def NEW_binary_search_since_last_checkpoint(dbg, l_history, n_min,
             NEW_binary_search_expand_continue(dbg, l_history, testIfTooFar)
         # l_history == l_history[0:n_min] + (len(l_history)-n_min)*['n']
         if len(l_history) - n_min > 1:
-            l_history = NEW_binary_search_history(dbg, l_history, n_min,
-                                                       testIfTooFar)
+            l_history = _search_history_for_change(dbg, l_history, n_min,
+                                                   testIfTooFar)
 
     fredutil.fred_assert(l_history[-1].is_step() or l_history[-1].is_next())
     while l_history[-1].is_next():
@@ -132,8 +256,7 @@ def NEW_binary_search_since_last_checkpoint(dbg, l_history, n_min,
         # Otherwise 'n' is at a fnc call; ['n'] expands to ['s', 'n', ...]
         # In all cases, testIfTooFar2 does the right thing.
         level = dbg.state().level()
-        testIfTooFar2 = \
-            lambda: dbg.state().level() <= level or testIfTooFar()
+        testIfTooFar2 = ShallowerOrTest(dbg, level, testIfTooFar)
         # TODO:  Last search was NEW_binary_search_history().
         #        This stopped before the final 'next'.
         #        So, NEW_binary_search_expand_next doesn't need to
@@ -154,47 +277,104 @@ def NEW_binary_search_since_last_checkpoint(dbg, l_history, n_min,
     dbg.replay_history(l_history)
     return l_history
 
+def _search_history_for_change(dbg, l_history, n_min, testIfTooFar):
+    """NEW_binary_search_history() for an ExpressionTest, done by the
+    reverse-watch engine selected by gs_reverse_watch_engine."""
+    global gs_reverse_watch_engine
+    if gs_reverse_watch_engine == "watch":
+        l_new_history = watch_search.watch_search_history(
+            dbg, l_history, n_min, testIfTooFar.s_expr)
+        if l_new_history != None:
+            return l_new_history
+        fredutil.fred_debug("Cannot watch '%s': bisecting instead." %
+                            testIfTooFar.s_expr)
+    return NEW_binary_search_history(dbg, l_history, n_min, testIfTooFar)
+
 def NEW_binary_search_history(dbg, l_history, n_min, testIfTooFar,
-                              itersToLive = -1):
+                              itersToLive = -1, s_strategy = None,
+                              b_monotone = False):
     """Perform binary search on given history to identify time where
     expression changed value.  Return l_history for that point in time,
     but current time will be one cmd earlier when testIfTooFar() == False.
-    If itersToLive is set, returns None if no convergence in those iters."""
+    If itersToLive is set, returns None if no convergence in those iters.
+    s_strategy overrides gs_history_search.  Set b_monotone if
+    testIfTooFar() stays True after the first command making it True:
+    only then may strategy "auto" choose another strategy than "bisect"."""
+    global gs_history_search, GL_HISTORY_SEARCH_STRATEGIES
     fredutil.fred_debug("Start binary search on history: %s" % str(l_history))
+    if s_strategy == None:
+        s_strategy = gs_history_search
+    if s_strategy == cost_model.GS_AUTO_STRATEGY and not b_monotone:
+        # Which change is found must not depend on the measured costs.
+        s_strategy = "bisect"
+    decision = None
+    if s_strategy == cost_model.GS_AUTO_STRATEGY:
+        decision = cost_model.choose_history_search(
+            dbg, l_history, n_min, GL_HISTORY_SEARCH_STRATEGIES)
+        s_strategy = decision.s_choice
+    base = _ProbeBase(dbg, _is_side_effect_free_test(testIfTooFar))
+    try:
+        return _binary_search_history_from(base, dbg, l_history, n_min,
+                                           testIfTooFar, itersToLive,
+                                           s_strategy)
+    finally:
+        base.finish()
+        if decision != None:
+            decision.finish()
+
+def _binary_search_history_from(base, dbg, l_history, n_min, testIfTooFar,
+                                itersToLive, s_strategy):
+    """NEW_binary_search_history(), with probes replayed from base, using
+    the given strategy (one of GL_HISTORY_SEARCH_STRATEGIES)."""
     n_min_orig = n_min
-    n_count = n_max = len(l_history)
+    n_count = n_max = n_max_orig = len(l_history)
+    # The probe the debugger is actually at (probes may come from the cache):
+    n_at = None
+    # Distance back from the end of the next galloping probe (0: bisect):
+    n_gallop = 1 if s_strategy == "gallop" else 0
+    # Distance forward from n_min_orig of the next probe (0: bisect):
+    n_forward = 1 if s_strategy in ["forward", "linear"] else 0
     # Invariant:  TestIfTooFar() is always True at n_max and False at n_min
     while n_max - n_min > 1:
         if (itersToLive == 0):
             return None
         else:
             itersToLive = itersToLive - 1
-        n_count = (n_min + n_max) / 2
-	# Gene - why do we need to clear the history here?
-        dbg.do_restart(b_clear_history = True)
-        dbg.replay_history(l_history, n_count)
-        # FIX ME:  testIfTooFar() may depend on local variables on stack.
-        # If stack is currently shallower, or if same function is not
-        # available at corresponding call frame, then possibly
-        # can declare this "not far enough" in logic below.
-        # But does this still do the right thing if testIfTooFar depends
-        # only on traditional global vars?
-        if not dbg.program_is_running() or testIfTooFar():
+        if n_gallop > 0:
+            n_count = max(len(l_history) - n_gallop, n_min + 1)
+            n_gallop *= 2
+        elif n_forward > 0:
+            n_count = min(n_min_orig + n_forward, n_max - 1)
+            n_forward = n_forward + 1 if s_strategy == "linear" \
+                        else n_forward * 2
+        else:
+            n_count = (n_min + n_max) / 2
+        (b_too_far, b_replayed) = \
+            _probe_history(dbg, l_history, n_count, testIfTooFar, base)
+        if b_replayed:
+            n_at = n_count
+        if b_too_far:
             fredutil.fred_debug("Setting max bound %d" % n_count)
             n_max = n_count
+            # The change is within the last gap: bisect it.
+            n_forward = 0
         else:
             fredutil.fred_debug("Setting min bound %d" % n_count)
             n_min = n_count
+            # The change is within the last gap: bisect it.
+            n_gallop = 0
+            if n_at == n_count:
+                base.consider_checkpoint(n_count, n_max - n_min)
     # XXX: deviate here
     fredutil.fred_assert(n_max - n_min == 1)
+    cost_model.record_change_distance(n_max_orig - n_max + 1)
     # Since TestIfTooFar() changes at l_history[1], following assert holds:
     fredutil.fred_assert(l_history[n_min].is_step() or \
 			     l_history[n_min].is_next() or \
 			     l_history[n_min].is_continue())
     l_history = l_history[:n_max]
-    if n_min != n_count:  # This was already done for n_min == n_count
-        dbg.do_restart(b_clear_history = True)
-        dbg.replay_history(l_history, n_min)
+    if n_min != n_at:  # This was already done for n_min == n_at
+        base.restart_and_replay(l_history, n_min)
     if n_min == n_min_orig and \
             (not dbg.program_is_running or testIfTooFar()):
         fredutil.fred_debug("testIfTooFar() true at n_min_orig on entry.")
@@ -203,6 +383,127 @@ def NEW_binary_search_history(dbg, l_history, n_min, testIfTooFar,
     fredutil.fred_debug("Done searching history.")
     return l_history
 
+def _probe_history(dbg, l_history, n_count, testIfTooFar, base=None):
+    """Return (b_too_far, b_replayed):  whether the program is no longer
+    running or testIfTooFar() after replaying l_history[:n_count], and
+    whether the debugger had to restart and replay to find out (as opposed
+    to answering from the cache).  The replay starts from base (a
+    _ProbeBase), if given."""
+    if base == None:
+        base = _ProbeBase(dbg, _is_side_effect_free_test(testIfTooFar))
+    b_too_far = _cached_probe(dbg, testIfTooFar,
+        dbg.replay_position_key(l_history.prefix(n_count), base.n_ckpt_orig))
+    if b_too_far != None:
+        fredutil.fred_debug("Probe %d answered from cache." % n_count)
+        return (b_too_far, False)
+    base.restart_and_replay(l_history, n_count)
+    # FIX ME:  testIfTooFar() may depend on local variables on stack.
+    # If stack is currently shallower, or if same function is not
+    # available at corresponding call frame, then possibly
+    # can declare this "not far enough" in logic below.
+    # But does this still do the right thing if testIfTooFar depends
+    # only on traditional global vars?
+    return (not dbg.program_is_running() or testIfTooFar(), True)
+
+class _ProbeBase():
+    """Where the probes of NEW_binary_search_history() restart from:  the
+    current checkpoint, until a long search takes a temporary checkpoint at
+    a probe (see consider_checkpoint()).  Later probes, which all come
+    after it, restart from there and replay less.  A probe ahead of the
+    position of the debugger needs no restart at all:  replay is
+    deterministic, so the commands in between are just executed (unless
+    b_reuse_position is False:  the search predicate may change the program
+    state at a probe, so every probe restarts).
+    finish() removes the temporary checkpoint, and makes the original
+    checkpoint current again, with the history it had and the debugger
+    where the search left it."""
+    def __init__(self, dbg, b_reuse_position=True):
+        self.dbg = dbg
+        self.b_reuse_position = b_reuse_position
+        # Position of the debugger in the history (None: unknown), and the
+        # history:
+        self.n_at = None
+        self.l_history = None
+        self.n_restarts_avoided = 0
+        # Index of the checkpoint the search started from (-1: current),
+        # and its history, once a temporary checkpoint is taken:
+        self.n_ckpt_orig = -1
+        self.ckpt_orig = None
+        self.h_orig = None
+        # The temporary checkpoint, and its position in the history:
+        self.n_temp_ckpt = -1
+        self.n_temp_pos = 0
+        # Measured replay cost:
+        self.f_replay_seconds = 0.0
+        self.n_replayed = 0
+
+    def restart_and_replay(self, l_history, n_count):
+        """Bring the debugger to l_history[:n_count]:  replay the commands
+        from its position if that is not beyond n_count, else restart (from
+        the temporary checkpoint if there is one) and replay."""
+        self.l_history = l_history
+        if self.b_reuse_position and self.n_at != None and \
+                self.n_at <= n_count:
+            self.n_restarts_avoided += 1
+        else:
+            # Gene - why do we need to clear the history here?
+            self.dbg.do_restart(self.n_temp_ckpt, b_clear_history = True)
+            self.n_at = self.n_temp_pos
+        if n_count > self.n_at:
+            f_start = time.time()
+            self.dbg.replay_history(l_history[self.n_at:n_count])
+            self.f_replay_seconds += time.time() - f_start
+            self.n_replayed += n_count - self.n_at
+        self.n_at = n_count
+
+    def consider_checkpoint(self, n_pos, n_width):
+        """The debugger is at l_history[:n_pos], and the search continues
+        over the next n_width commands.  Take a temporary checkpoint here if
+        the replay it saves the remaining probes (about log2(n_width) of
+        them) costs more than taking it."""
+        global gb_temporary_checkpoints, GN_TEMP_CHECKPOINT_MIN_WIDTH, \
+            GF_TEMP_CHECKPOINT_PAYOFF
+        if not gb_temporary_checkpoints or not self.b_reuse_position or \
+                self.n_replayed == 0 or \
+                n_width < GN_TEMP_CHECKPOINT_MIN_WIDTH or \
+                freddebugger.gn_total_checkpoints == 0:
+            return
+        f_per_command = self.f_replay_seconds / self.n_replayed
+        f_saved = math.log(n_width, 2) * (n_pos - self.n_temp_pos) * \
+            f_per_command
+        f_checkpoint = cost_model.current_costs(self.dbg).f_checkpoint
+        if f_saved < GF_TEMP_CHECKPOINT_PAYOFF * f_checkpoint:
+            return
+        fredutil.fred_debug("Temporary checkpoint at %d: saves %.3f s of "
+                            "replay, costs %.3f s." %
+                            (n_pos, f_saved, f_checkpoint))
+        if self.ckpt_orig == None:
+            self.ckpt_orig = self.dbg.current_checkpoint()
+            self.n_ckpt_orig = self.ckpt_orig.get_index()
+            self.h_orig = self.ckpt_orig.get_history().copy()
+        n_old_ckpt = self.n_temp_ckpt
+        self.n_temp_ckpt = self.dbg.do_temporary_checkpoint()
+        self.n_temp_pos = n_pos
+        if n_old_ckpt != -1:
+            # The previous one is interior now, and no longer needed.
+            self.dbg.remove_temporary_checkpoint(n_old_ckpt)
+            self.n_temp_ckpt -= 1
+
+    def finish(self):
+        """Remove the temporary checkpoint, if any."""
+        if self.n_restarts_avoided > 0:
+            fredutil.fred_debug("History search went forward without "
+                                "restarting %d times." %
+                                self.n_restarts_avoided)
+            freddebugger.gn_total_restarts_avoided += self.n_restarts_avoided
+        if self.n_temp_ckpt == -1:
+            return
+        self.dbg.remove_temporary_checkpoint(self.n_temp_ckpt)
+        self.dbg.branch.set_current_checkpoint(self.ckpt_orig)
+        self.ckpt_orig.set_history(self.h_orig)
+        self.dbg.assume_position(self.l_history[:self.n_at])
+        self.n_temp_ckpt = -1
+
 def NEW_binary_search_until(dbg, l_history, repeatCmd, testIfTooFar,
                             itersToLive = -1):
     """Let init_history = initial l_history on entry.
@@ -217,7 +518,7 @@ def NEW_binary_search_until(dbg, l_history, repeatCmd, testIfTooFar,
     fredutil.fred_debug("Starting expansion with '%s' on %s" % \
                             (str(repeatCmd), str(l_history)))
     n_min = len(l_history)
-    l_expanded_history = [repeatCmd]
+    l_expanded_history = fredhistory.History([repeatCmd])
     dbg.replay_history(l_expanded_history)
     l_history += l_expanded_history
     while dbg.program_is_running() and not testIfTooFar():
@@ -270,6 +571,57 @@ def NEW_binary_search_expand_next(dbg, l_history, testIfTooFar,
     return \
         NEW_binary_search_until(dbg, l_history, repeatNextCmd, testIfTooFar)
 
+def NEW_binary_search_next_to_breakpoint(dbg, l_history):
+    """On entry, current time is l_history, and repeated 'next' commands
+    reach a breakpoint (typically, l_history was a 'continue' that
+    stopped there, with the 'continue' replaced by a 'step').
+    Appends those 'next' commands to l_history, and returns l_history
+    with the debugger at the breakpoint (or at the end of the program).
+    Replays 'next', 'next 2', 'next 4', ... relying on gdb stopping a
+    'next N' at a breakpoint, and bisects the last of those."""
+    repeatNextCmd = dbg._p.get_personality_cmd(freddebugger.fred_next_cmd())
+    if not dbg.program_is_running() or dbg.at_breakpoint():
+        return l_history
+    if not dbg._p.b_has_count_commands or _breakpoint_on_for_statement(dbg):
+        # A 'next N' might run past the breakpoint: one 'next' at a time.
+        while dbg.program_is_running() and not dbg.at_breakpoint():
+            l_history += [repeatNextCmd]
+            dbg.replay_history([l_history[-1]])
+        return l_history
+    # A 'next N' stops at the breakpoint, so later positions are at the
+    # breakpoint too.  Besides the stop location, the hit counts catch a
+    # breakpoint the stop location does not match (e.g. on a function).
+    n_hits = _breakpoint_hits(dbg)
+    testIfTooFar = lambda: dbg.at_breakpoint() or \
+        _breakpoint_hits(dbg) > n_hits
+    (l_history, n_min) = NEW_binary_search_until(dbg, l_history,
+                                                 repeatNextCmd, testIfTooFar)
+    if len(l_history) - n_min > 1:
+        l_history = NEW_binary_search_history(dbg, l_history, n_min,
+                                              testIfTooFar)
+        dbg.replay_history(l_history[-1:])
+    return l_history
+
+def _breakpoint_hits(dbg):
+    """Return the total hit count of the breakpoints (not watchpoints)."""
+    return sum([bp.n_count for bp in dbg.refresh_breakpoints()
+                if bp.s_type == "breakpoint"])
+
+def _breakpoint_on_for_statement(dbg):
+    """Return True if an enabled breakpoint is on a line starting a 'for'
+    statement.  When a loop comes back to such a line, a 'next' ends on
+    that line, but a 'next N' does not stop there: the breakpoint is on the
+    address of the loop initialization, not of the loop test."""
+    for bp in dbg.get_breakpoints():
+        if bp.s_type != "breakpoint" or bp.s_enable != "y":
+            continue
+        s_line = dbg.source_line(bp.s_file, bp.n_line)
+        if s_line != None and re.match(r"\s*for\b", s_line):
+            fredutil.fred_debug("Breakpoint %d is on a 'for' statement." %
+                                bp.n_number)
+            return True
+    return False
+
 #END OF NEW:  Will replace other methods later
 #================================================================
 
@@ -287,6 +639,11 @@ def _binary_search_checkpoints(dbg, s_expr, s_expr_val):
         dbg.do_restart(n_right_ckpt)
         return
     n_left_ckpt = 0
+    decision = cost_model.choose_checkpoint_search(dbg, n_left_ckpt,
+                                                   n_right_ckpt)
+    if decision.s_choice == "parallel":
+        (n_left_ckpt, n_right_ckpt) = parallel_search.search_checkpoints(
+            dbg, s_expr, s_expr_val, n_left_ckpt, n_right_ckpt)
     # Repeat until the interval is 1 checkpoint long. That means the left
     # checkpoint has the "correct" value and the right one has the
     # "incorrect" value. "Incorrect" in this case means different
@@ -295,13 +652,18 @@ def _binary_search_checkpoints(dbg, s_expr, s_expr_val):
     while (n_right_ckpt - n_left_ckpt) != 1:
         n_diff = (n_right_ckpt - n_left_ckpt) / 2
         n_new_index = int(math.ceil(n_diff) + n_left_ckpt)
-        dbg.do_restart(n_new_index)
-        s_expr_new_val = dbg.evaluate_expression(s_expr)
+        s_expr_new_val = dbg.cached_expression_value(
+            dbg.replay_position_key(fredhistory.History(), n_new_index),
+            s_expr)
+        if s_expr_new_val == None:
+            dbg.do_restart(n_new_index)
+            s_expr_new_val = dbg.evaluate_expression(s_expr)
         if s_expr_new_val != s_expr_val:
             # correct
             n_left_ckpt = n_new_index
         else:
             n_right_ckpt = n_new_index
+    decision.finish()
     # Now n_left_ckpt contains index of the target checkpoint.
     # Restart and return.
     fredutil.fred_debug("Found checkpoint: %d" % n_left_ckpt)
@@ -383,7 +745,8 @@ def _binary_search_expand_history(dbg, l_history, s_expr, s_expr_val):
 def _binary_search_expand_with_next(dbg, l_history, s_expr, s_expr_val):
     fredutil.fred_debug("Starting expansion with next on %s" % str(l_history))
     n_min = len(l_history)
-    l_expanded_history = [dbg._p.get_personality_cmd(freddebugger.fred_next_cmd())]
+    l_expanded_history = fredhistory.History(
+        [dbg._p.get_personality_cmd(freddebugger.fred_next_cmd())])
     dbg.replay_history(l_expanded_history)
     l_history += l_expanded_history
     while dbg.program_is_running() and \
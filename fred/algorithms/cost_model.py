@@ -0,0 +1,246 @@
+from .. import fredutil
+from .. import freddebugger
+import math
+import time
+import parallel_search
+
+"""
+This file contains the cost model which chooses how the binary searches of
+binary_search.py probe, from the costs measured in this session:
+  - restart time, per checkpoint (freddebugger.gd_restart_times);
+  - replay time, per kind of command (ReversibleDebugger.command_times);
+  - evaluation time of the tested expressions;
+  - checkpoint time;
+  - wall time of the rounds of the parallel checkpoint search
+    (parallel_search.gl_round_seconds).
+Costs not measured yet take the GF_DEFAULT_* values.
+
+A monotone history search (NEW_binary_search_history() with strategy "auto"
+and b_monotone) chooses among:
+  "bisect":   bisect the interval.
+  "gallop":   probe 1, 2, 4, ... commands back from the end, then bisect.
+  "forward":  probe 1, 2, 4, ... commands forward from the start, then
+              bisect.  These probes need no restart.
+  "linear":   probe every command forward from the start:  one restart,
+              and an evaluation per command.
+The expected position of the change is taken from the last searches (see
+record_change_distance()), or the middle of the interval before any.
+
+A checkpoint search chooses between "bisect" and "parallel" (see
+parallel_search.py).
+
+Each choice is a Decision.  Its expected costs, and the time it actually
+took, are printed as debug messages and kept in gl_decisions for tuning.
+"""
+
+GS_AUTO_STRATEGY = "auto"
+# Costs assumed before they are measured, in seconds:
+GF_DEFAULT_RESTART_SECONDS = 0.5
+GF_DEFAULT_COMMAND_SECONDS = 0.01
+GF_DEFAULT_EVALUATION_SECONDS = 0.005
+GF_DEFAULT_CHECKPOINT_SECONDS = 0.5
+# Starting a search worker and its coordinator, on top of its restart:
+GF_DEFAULT_WORKER_SECONDS = 0.5
+# Evaluations per probe:  whether the program is running, and the test:
+GN_EVALUATIONS_PER_PROBE = 2
+# Number of recent change distances and decisions kept:
+GN_DISTANCE_SAMPLES = 16
+GN_DECISIONS_KEPT = 100
+
+# Distances back from the end of the searched interval at which the last
+# history searches found the change (1: the last command):
+gl_change_distances = []
+# The last Decisions taken:
+gl_decisions = []
+
+class Costs():
+    """The unit costs, in seconds, the strategies are compared with."""
+    def __init__(self, f_restart, f_evaluation, f_checkpoint,
+                 d_command_seconds, f_command):
+        self.f_restart = f_restart
+        self.f_evaluation = f_evaluation
+        self.f_checkpoint = f_checkpoint
+        # Command name => seconds, and seconds of any other command:
+        self.d_command_seconds = d_command_seconds
+        self.f_command = f_command
+
+    def command_seconds(self, cmd):
+        """Return the expected replay time of one logical command like cmd."""
+        return self.d_command_seconds.get(cmd.s_name, self.f_command)
+
+    def replay_seconds(self, l_history, n_first, n_last):
+        """Return the expected time to replay l_history[n_first:n_last]."""
+        f_seconds = 0.0
+        n_pos = 0
+        for (proto, n) in l_history.runs():
+            n_overlap = min(n_last, n_pos + n) - max(n_first, n_pos)
+            if n_overlap > 0 and not proto.b_ignore:
+                f_seconds += n_overlap * self.command_seconds(proto)
+            n_pos += n
+            if n_pos >= n_last:
+                break
+        return f_seconds
+
+    def probe_seconds(self):
+        """Return the expected time of the evaluations of one probe."""
+        global GN_EVALUATIONS_PER_PROBE
+        return GN_EVALUATIONS_PER_PROBE * self.f_evaluation
+
+def _average(f_total, n_count, f_default):
+    if n_count == 0:
+        return f_default
+    return f_total / n_count
+
+def restart_seconds(dbg, n_index=-1):
+    """Return the expected time to restart checkpoint n_index (default:
+    current) of the current branch:  as measured for it, or for all
+    checkpoints if it was never restarted."""
+    global GF_DEFAULT_RESTART_SECONDS
+    if n_index == -1:
+        n_index = dbg.current_checkpoint().get_index()
+    l_times = freddebugger.gd_restart_times.get((dbg.branch.get_name(),
+                                                 n_index))
+    if l_times != None:
+        return _average(l_times[0], l_times[1], GF_DEFAULT_RESTART_SECONDS)
+    return _average(freddebugger.gn_time_restarting,
+                    freddebugger.gn_total_restarts, GF_DEFAULT_RESTART_SECONDS)
+
+def current_costs(dbg):
+    """Return the Costs measured so far in the session of dbg."""
+    global GF_DEFAULT_EVALUATION_SECONDS, GF_DEFAULT_CHECKPOINT_SECONDS, \
+           GF_DEFAULT_COMMAND_SECONDS
+    d_command_seconds = {}
+    for s_name in dbg.command_times.d_kinds.keys():
+        d_command_seconds[s_name] = \
+            dbg.command_times.seconds_per_command(s_name)
+    f_command = dbg.command_times.seconds_per_command()
+    if f_command == None:
+        f_command = GF_DEFAULT_COMMAND_SECONDS
+    return Costs(restart_seconds(dbg),
+                 _average(freddebugger.gn_time_evaluating,
+                          freddebugger.gn_total_evaluations,
+                          GF_DEFAULT_EVALUATION_SECONDS),
+                 _average(freddebugger.gn_time_checkpointing,
+                          freddebugger.gn_total_checkpoints,
+                          GF_DEFAULT_CHECKPOINT_SECONDS),
+                 d_command_seconds, f_command)
+
+def _probes(n_width):
+    """Return the number of probes bisecting an interval of n_width
+    commands."""
+    if n_width <= 1:
+        return 0
+    return int(math.ceil(math.log(n_width, 2)))
+
+def expected_change_distance(n_width):
+    """Return the expected distance back from the end of an interval of
+    n_width commands at which the change will be found:  the median of the
+    last searches, or the middle of the interval."""
+    global gl_change_distances
+    if len(gl_change_distances) == 0:
+        return (n_width + 1) / 2
+    l_sorted = sorted(gl_change_distances)
+    return max(1, min(n_width, l_sorted[len(l_sorted) / 2]))
+
+def record_change_distance(n_distance):
+    """Record that a history search found the change n_distance commands
+    back from the end of its interval (1: the last command)."""
+    global gl_change_distances, GN_DISTANCE_SAMPLES
+    gl_change_distances.append(n_distance)
+    del gl_change_distances[:-GN_DISTANCE_SAMPLES]
+
+def history_search_costs(costs, l_history, n_min, n_back):
+    """Return a dict mapping each history search strategy to its expected
+    time, for a search of l_history between n_min and its end, when the
+    change is n_back commands back from the end.  Probes ahead of the
+    debugger replay forward instead of restarting (see
+    binary_search._ProbeBase), which about half of the bisection probes
+    are."""
+    n_max = len(l_history)
+    n_width = n_max - n_min
+    n_back = max(1, min(n_width, n_back))
+    n_ahead = n_width + 1 - n_back
+    f_prefix = costs.replay_seconds(l_history, 0, n_min)
+    f_command = costs.replay_seconds(l_history, n_min, n_max) / \
+                max(1, n_width)
+    f_probe = costs.probe_seconds()
+    def restart_to(n_offset):
+        """Restart and replay to n_offset commands after n_min."""
+        return costs.f_restart + f_prefix + f_command * n_offset
+    n_bisect = _probes(n_width)
+    n_gallop = _probes(n_back) + 1
+    n_gallop_bisect = _probes(n_back)
+    n_forward = _probes(n_ahead) + 1
+    n_forward_bisect = _probes(n_ahead)
+    return {
+        "bisect" : (1 + n_bisect / 2.0) * restart_to(n_width / 2.0) +
+                   n_bisect * f_probe,
+        "gallop" : (n_gallop + n_gallop_bisect / 2.0) * restart_to(n_width) +
+                   (n_gallop + n_gallop_bisect) * f_probe,
+        "forward" : restart_to(min(n_width, 2 * n_ahead)) +
+                    n_forward_bisect / 2.0 * restart_to(n_ahead) +
+                    (n_forward + n_forward_bisect) * f_probe,
+        "linear" : restart_to(n_ahead) + n_ahead * f_probe }
+
+def checkpoint_search_costs(dbg, costs, n_left_ckpt, n_right_ckpt):
+    """Return a dict mapping each checkpoint search strategy which can be
+    used to its expected time, for a search between the two checkpoints."""
+    global GF_DEFAULT_WORKER_SECONDS
+    n_width = n_right_ckpt - n_left_ckpt
+    l_restarts = [restart_seconds(dbg, n)
+                  for n in range(n_left_ckpt + 1, n_right_ckpt)]
+    f_restart = _average(sum(l_restarts), len(l_restarts), costs.f_restart)
+    d_costs = {"bisect" : _probes(n_width) *
+                          (f_restart + costs.f_evaluation)}
+    if parallel_search.use_parallel_search(dbg, n_left_ckpt, n_right_ckpt):
+        l_rounds = parallel_search.gl_round_seconds
+        if len(l_rounds) > 0:
+            f_round = sum(l_rounds) / len(l_rounds)
+        else:
+            f_round = GF_DEFAULT_WORKER_SECONDS + max(l_restarts) + \
+                      costs.f_evaluation
+        n_rounds = int(math.ceil(math.log(n_width) /
+                                 math.log(parallel_search.gn_search_workers
+                                          + 1)))
+        d_costs["parallel"] = n_rounds * f_round
+    return d_costs
+
+class Decision():
+    """The choice of a strategy for one search:  the cheapest of d_costs
+    (strategy => expected seconds), ties going to the first of l_order.
+    finish() records how long the search actually took."""
+    def __init__(self, s_search, d_costs, l_order):
+        self.s_search = s_search
+        self.d_costs = d_costs
+        self.s_choice = min([s for s in l_order if s in d_costs],
+                            key=lambda s: d_costs[s])
+        self.f_start = time.time()
+        self.f_seconds = None
+        fredutil.fred_debug("%s search: chose '%s' (expected %s)." %
+                            (s_search, self.s_choice,
+                             ", ".join(["%s %.3f s" % (s, d_costs[s])
+                                        for s in l_order if s in d_costs])))
+
+    def finish(self):
+        global gl_decisions, GN_DECISIONS_KEPT
+        self.f_seconds = time.time() - self.f_start
+        fredutil.fred_debug("%s search with '%s' took %.3f s (expected "
+                            "%.3f s)." % (self.s_search, self.s_choice,
+                                          self.f_seconds,
+                                          self.d_costs[self.s_choice]))
+        gl_decisions.append(self)
+        del gl_decisions[:-GN_DECISIONS_KEPT]
+
+def choose_history_search(dbg, l_history, n_min, l_strategies):
+    """Return the Decision among l_strategies for searching l_history
+    between n_min and its end."""
+    n_back = expected_change_distance(len(l_history) - n_min)
+    d_costs = history_search_costs(current_costs(dbg), l_history, n_min,
+                                   n_back)
+    return Decision("History", d_costs, l_strategies)
+
+def choose_checkpoint_search(dbg, n_left_ckpt, n_right_ckpt):
+    """Return the Decision for searching between the two checkpoints."""
+    d_costs = checkpoint_search_costs(dbg, current_costs(dbg),
+                                      n_left_ckpt, n_right_ckpt)
+    return Decision("Checkpoint", d_costs, ["bisect", "parallel"])
@@ -0,0 +1,156 @@
+from .. import fredutil
+from .. import fredhistory
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+"""
+This file contains the parallel search over checkpoints used by
+binary_search._binary_search_checkpoints() when more than one search worker
+is configured (fredapp.py --search-workers N).
+
+Each round restarts k checkpoints at once, each one in a separate worker
+process (fredworker.py) with its own DMTCP coordinator port, DMTCP_TMPDIR
+and fredio session, evaluates the expression in each, and narrows the
+checkpoint interval by a factor of k+1.
+"""
+
+# Number of concurrent search workers (1: search sequentially):
+gn_search_workers = 1
+# Wall times of the last GN_ROUND_SAMPLES search rounds (for cost_model.py):
+GN_ROUND_SAMPLES = 16
+gl_round_seconds = []
+# Worker script, next to fredapp.py:
+GS_WORKER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))), "fredworker.py")
+
+class SearchWorker():
+    """One worker process evaluating an expression at one checkpoint."""
+    def __init__(self, n_id, n_index, s_expr, s_debugger):
+        self.n_id = n_id
+        self.n_index = n_index
+        self.s_expr = s_expr
+        self.s_debugger = s_debugger
+        s_fred_tmpdir = os.path.dirname(os.environ["DMTCP_TMPDIR"])
+        self.s_tmpdir = os.path.join(s_fred_tmpdir, "search-worker-%d" % n_id)
+        self.s_result_path = self.s_tmpdir + ".json"
+        self.n_port = int(os.environ["DMTCP_PORT"]) + 1 + n_id
+        self.process = None
+
+    def start(self):
+        """Start the worker process (non-blocking)."""
+        global GS_WORKER_SCRIPT
+        shutil.rmtree(self.s_tmpdir, ignore_errors=True)
+        if os.path.exists(self.s_result_path):
+            os.remove(self.s_result_path)
+        l_cmd = [sys.executable, GS_WORKER_SCRIPT,
+                 "-p", str(self.n_port),
+                 "--tmpdir", self.s_tmpdir,
+                 "--checkpoint-dir",
+                 os.path.realpath(os.environ["DMTCP_TMPDIR"]),
+                 "--result", self.s_result_path]
+        if fredutil.GB_DEBUG:
+            l_cmd.append("--enable-debug")
+        l_cmd += [self.s_debugger, str(self.n_index), self.s_expr]
+        fredutil.fred_debug("Starting search worker: %s" % str(l_cmd))
+        f_null = open(os.devnull, "w")
+        self.process = subprocess.Popen(l_cmd, stdin=subprocess.PIPE,
+                                        stdout=f_null, stderr=f_null,
+                                        close_fds=True)
+        f_null.close()
+
+    def wait(self):
+        """Wait for the worker to finish.  Return (value, seconds) of the
+        evaluation, or None if the worker failed."""
+        self.process.stdin.close()
+        self.process.wait()
+        try:
+            f = open(self.s_result_path)
+            d_result = json.load(f)
+            f.close()
+            os.remove(self.s_result_path)
+            return (str(d_result["value"]), d_result["seconds"])
+        except (IOError, ValueError, KeyError):
+            fredutil.fred_warning("Search worker for checkpoint %d failed "
+                                  "(exit status %d)." %
+                                  (self.n_index, self.process.returncode))
+            return None
+
+def use_parallel_search(dbg, n_left_ckpt, n_right_ckpt):
+    """Return True if the checkpoint interval is worth searching with
+    several workers."""
+    global gn_search_workers
+    return gn_search_workers > 1 and n_right_ckpt - n_left_ckpt > 2
+
+def _probe_indexes(n_left_ckpt, n_right_ckpt, n_probes):
+    """Return n_probes checkpoint indexes evenly spaced strictly between
+    n_left_ckpt and n_right_ckpt."""
+    n_width = n_right_ckpt - n_left_ckpt
+    l_indexes = [n_left_ckpt + (i * n_width) / (n_probes + 1)
+                 for i in range(1, n_probes + 1)]
+    return sorted(set([x for x in l_indexes
+                       if n_left_ckpt < x < n_right_ckpt]))
+
+def search_checkpoints(dbg, s_expr, s_expr_val, n_left_ckpt, n_right_ckpt):
+    """Narrow the checkpoint interval (n_left_ckpt, n_right_ckpt) as
+    _binary_search_checkpoints() does, down to consecutive checkpoints,
+    evaluating the expression at up to gn_search_workers checkpoints per
+    round.  Returns the final (n_left_ckpt, n_right_ckpt)."""
+    global gn_search_workers, gl_round_seconds, GN_ROUND_SAMPLES
+    n_rounds = 0
+    f_wall_time = 0.0
+    f_worker_time = 0.0
+    while n_right_ckpt - n_left_ckpt > 1:
+        n_probes = min(gn_search_workers, n_right_ckpt - n_left_ckpt - 1)
+        l_indexes = _probe_indexes(n_left_ckpt, n_right_ckpt, n_probes)
+        d_values = {}
+        l_workers = []
+        for n_index in l_indexes:
+            s_val = dbg.cached_expression_value(
+                dbg.replay_position_key(fredhistory.History(), n_index),
+                s_expr)
+            if s_val != None:
+                d_values[n_index] = s_val
+            else:
+                l_workers.append(SearchWorker(len(l_workers), n_index, s_expr,
+                                              dbg.personality_name()))
+        f_start = time.time()
+        for worker in l_workers:
+            worker.start()
+        for worker in l_workers:
+            result = worker.wait()
+            if result == None:
+                # Fall back to evaluating it here.
+                dbg.do_restart(worker.n_index)
+                result = (dbg.evaluate_expression(s_expr), 0.0)
+            else:
+                dbg.cache_expression_value(
+                    dbg.replay_position_key(fredhistory.History(),
+                                            worker.n_index),
+                    s_expr, result[0])
+            d_values[worker.n_index] = result[0]
+            f_worker_time += result[1]
+        f_wall_time += time.time() - f_start
+        gl_round_seconds.append(time.time() - f_start)
+        del gl_round_seconds[:-GN_ROUND_SAMPLES]
+        n_rounds += 1
+        fredutil.fred_debug("Search round %d: values %s" %
+                            (n_rounds, str(d_values)))
+        # Keep the first probe which has the "incorrect" value:
+        for n_index in l_indexes:
+            if d_values[n_index] != s_expr_val:
+                n_left_ckpt = n_index
+            else:
+                n_right_ckpt = n_index
+                break
+    if f_wall_time > 0:
+        fredutil.fred_info("Parallel checkpoint search: %d rounds with %d "
+                           "workers took %.3f s, for %.3f s of restarts and "
+                           "evaluations (%.1fx faster)." %
+                           (n_rounds, gn_search_workers, f_wall_time,
+                            f_worker_time, f_worker_time / f_wall_time))
+    return (n_left_ckpt, n_right_ckpt)
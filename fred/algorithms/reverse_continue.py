@@ -1,43 +1,206 @@
 from .. import fredutil
+from .. import fredhistory
+
+# ALGORITHM:  The debugger counts the hits of each breakpoint (as in
+# 'info breakpoints'), and those counts are saved in every checkpoint.  So:
+#  - The number of hits since the start of a checkpoint is the difference
+#    between the hit counts now and just after restarting it.
+#  - The checkpoint holding the last hit before the present is found by
+#    bisection over the checkpoints, restarting each probe without replay.
+#  - Within that checkpoint, one replay of its history (reading the hit
+#    counts after each run of identical commands) finds the run of the last
+#    hit, and the replay stops there.
+# All of that is skipped when the position trace of the checkpoint
+# (Checkpoint.d_trace) covers every command back to the last hit:  the
+# debugger just restarts and replays up to it.
+# Either way, the breakpoints are those of the present breakpoint table:
+# hits of breakpoints deleted since are not counted.
 
 def reverse_continue(dbg):
-    """Perform 'reverse-continue' command. """
-    dbg.update_state()
-    orig_state = dbg.state().copy()
-    n_to_restart = dbg.current_checkpoint().get_index()
-    n_breakpoints_found = 0
-    b_finished = False
-    while True:
-        if b_finished:
-            break
-        dbg.do_restart(n_to_restart)
-        # Count the number of breakpoints encountered
-        for cmd in dbg.current_checkpoint().get_history():
-            dbg.execute_fred_command(cmd)
-            if dbg.at_breakpoint():
-                n_breakpoints_found += 1
-        # If we were at a breakpoint, when rc was issued, we want to exclude
-        # it when we re-execute.
-        if n_breakpoints_found > 1 and dbg.at_breakpoint() or \
-                n_breakpoints_found > 0 and not dbg.at_breakpoint():
-            if dbg.at_breakpoint():
-                n_breakpoints_found -= 1
-            n_recount = 0
-            dbg.do_restart(n_to_restart)
-            for i in range(0,len(dbg.current_checkpoint().get_history())):
-                cmd = dbg.current_checkpoint().get_history()[i]
-                dbg.execute_fred_command(cmd)
-                if dbg.at_breakpoint():
-                    n_recount += 1
-                if n_recount == n_breakpoints_found:
-                    dbg.current_checkpoint().set_history(
-                        dbg.current_checkpoint().get_history()[:i+1])
-                    b_finished = True
-                    break
-        else:
-            n_to_restart -= 1
-            if n_to_restart < 0:
-                fredutil.fred_error("Reverse-continue failed.")
-                break
+    """Perform 'reverse-continue' command: return to the last time before
+    the present that the debugger stopped at a breakpoint."""
+    l_history = dbg.copy_current_checkpoint_history()
+    n_pos = _traced_last_hit(dbg, l_history)
+    if n_pos != None:
+        fredutil.fred_debug("Last breakpoint hit found in the position "
+                            "trace after %d commands." % n_pos)
+        dbg.do_restart(b_clear_history = True)
+        dbg.replay_history(l_history, n_pos)
+        dbg.current_checkpoint().set_history(l_history[:n_pos])
+        dbg.update_state()
+        fredutil.fred_debug("Reverse continue finished.")
+        return
+    b_at_breakpoint = dbg.at_breakpoint()
+    d_present = _hit_counts(dbg)
+    l_numbers = d_present.keys()
+    n_orig_ckpt = dbg.current_checkpoint().get_index()
+    l_orig_history = dbg.copy_current_checkpoint_history()
+    dbg.do_restart(n_orig_ckpt)
+    d_start = _hit_counts(dbg, l_numbers)
+    n_hits = _hits_between(d_start, d_present)
+    if b_at_breakpoint and n_hits > 0:
+        n_hits = _hits_before_present(dbg, l_orig_history, d_start, n_hits,
+                                      l_numbers)
+    n_ckpt = n_orig_ckpt
+    if n_hits <= 0:
+        (n_ckpt, n_hits, d_start) = \
+            _last_checkpoint_with_hits(dbg, n_orig_ckpt, d_start, l_numbers)
+        if n_ckpt == -1:
+            fredutil.fred_error("Reverse-continue failed: no earlier "
+                                "breakpoint hit.")
+            dbg.do_restart(n_orig_ckpt)
+            dbg.replay_history(l_orig_history)
+            return
+    l_history = dbg.copy_current_checkpoint_history()
+    n_pos = _replay_to_hit(dbg, n_ckpt, l_history, d_start, n_hits,
+                           l_numbers)
+    if n_pos == -1:
+        fredutil.fred_error("Reverse-continue failed.")
+        n_pos = len(l_history)
+    dbg.current_checkpoint().set_history(l_history[:n_pos])
     dbg.update_state()
     fredutil.fred_debug("Reverse continue finished.")
+
+def _moves(cmd):
+    """Return True if the given FredCommand can move the debugger to another
+    position."""
+    return cmd.is_next() or cmd.is_step() or cmd.is_continue()
+
+def _last_move(l_history):
+    """Return the index of the last command of l_history which moves, or -1.
+    The positions after it are all the same."""
+    n = len(l_history) - 1
+    while n >= 0 and not _moves(l_history[n]):
+        n -= 1
+    return n
+
+def _hits_before_present(dbg, l_history, d_start, n_hits, l_numbers):
+    """The debugger stopped at a breakpoint after l_history, and was then
+    restarted to the start of its checkpoint, where the hit counts are
+    d_start.  n_hits hits were counted in between.  Return how many of them
+    come before the present stop, which is one of them only if it was a hit
+    after the start of the checkpoint:  it is not if the checkpoint was
+    taken while stopped there, or if a 'finish', say, stopped at the line
+    of a breakpoint.  The debugger is left at the start of the checkpoint."""
+    n_last = _last_move(l_history)
+    if n_last == -1:
+        # Stopped there since the start of the checkpoint.
+        return n_hits
+    cmd = l_history[n_last]
+    if cmd.is_continue() and cmd.n_stop_breakpoint in l_numbers:
+        # A 'continue' stops at a breakpoint only by hitting it.
+        return n_hits - 1
+    if n_last > 0:
+        dbg.replay_history(l_history, n_last)
+    n_before = _hits_between(d_start, _hit_counts(dbg, l_numbers))
+    dbg.do_restart()
+    return n_before
+
+def _traced_last_hit(dbg, l_history):
+    """Return the number of commands of l_history after which the debugger
+    last stopped at a breakpoint, before the present, according to the
+    position trace, and the present breakpoint table.  Return None if a
+    position on the way back is missing from the trace, or if there is no
+    such stop in l_history."""
+    # Positions after the last command which moved are the present one.
+    n = _last_move(l_history)
+    while n > 0:
+        if _moves(l_history[n - 1]):
+            b_at_breakpoint = dbg.traced_at_breakpoint(l_history[:n])
+            if b_at_breakpoint == None:
+                return None
+            if b_at_breakpoint:
+                return n
+        n -= 1
+    return None
+
+def _hit_counts(dbg, l_numbers=None):
+    """Return a dict mapping the number of each breakpoint to its hit count,
+    as the debugger reports it now.  If l_numbers is given, only the
+    breakpoints with those numbers are included."""
+    return dict([(bp.n_number, bp.n_count)
+                 for bp in dbg.refresh_breakpoints()
+                 if bp.s_type == "breakpoint" and
+                    (l_numbers == None or bp.n_number in l_numbers)])
+
+def _hits_between(d_before, d_after):
+    """Return the number of breakpoint hits between two readings of
+    _hit_counts().  Breakpoints missing from a reading (created or deleted
+    in between) count from zero there."""
+    n_hits = 0
+    for n_number in set(d_before.keys()) | set(d_after.keys()):
+        n_hits += max(0, d_after.get(n_number, 0) -
+                         d_before.get(n_number, 0))
+    return n_hits
+
+def _last_checkpoint_with_hits(dbg, n_ckpt, d_ckpt, l_numbers):
+    """Return (index, number of hits, hit counts at its start) for the last
+    checkpoint before n_ckpt whose history hits a breakpoint, by bisection;
+    the debugger is left at the start of that checkpoint.  d_ckpt are the
+    hit counts at the start of n_ckpt, of the breakpoints numbered in
+    l_numbers.  Returns (-1, 0, None) if there is no such checkpoint."""
+    # Invariant: some hit after the start of n_min (or n_min == -1),
+    #            no hit between the start of n_max and the start of n_ckpt.
+    n_min = -1
+    n_max = n_ckpt
+    d_counts = {n_ckpt : d_ckpt}
+    n_at = n_ckpt
+    while n_max - n_min > 1:
+        n_probe = (n_min + n_max) / 2
+        dbg.do_restart(n_probe)
+        n_at = n_probe
+        d_counts[n_probe] = _hit_counts(dbg, l_numbers)
+        if _hits_between(d_counts[n_probe], d_ckpt) > 0:
+            n_min = n_probe
+        else:
+            n_max = n_probe
+    if n_min == -1:
+        return (-1, 0, None)
+    fredutil.fred_debug("Last breakpoint hit in checkpoint %d." % n_min)
+    if n_at != n_min:
+        dbg.do_restart(n_min)
+    return (n_min, _hits_between(d_counts[n_min], d_counts[n_max]),
+            d_counts[n_min])
+
+def _replay_to_hit(dbg, n_ckpt, l_history, d_start, n_hits, l_numbers):
+    """The debugger is at the start of checkpoint n_ckpt, whose history is
+    l_history, with hit counts d_start (of the breakpoints numbered in
+    l_numbers).  Replay up to the position of the n_hits-th hit of those
+    breakpoints, and return that position (number of commands), or -1 if
+    there are not that many hits."""
+    n_run_start = 0
+    n_hits_before = 0
+    for (proto, n) in l_history.runs():
+        h_run = fredhistory.History()
+        h_run.append(proto, n)
+        dbg.replay_history(h_run)
+        n_hits_now = _hits_between(d_start, _hit_counts(dbg, l_numbers))
+        if n_hits_now >= n_hits:
+            break
+        n_hits_before = n_hits_now
+        n_run_start += n
+    else:
+        return -1
+    n_run_end = n_run_start + n
+    if n == 1:
+        return n_run_end
+    if n_hits_now - n_hits_before == n:
+        # Every command of the run stopped at a breakpoint (a run of
+        # 'continue's, typically).
+        n_pos = n_run_start + n_hits - n_hits_before
+    else:
+        # Find the hit within the run, one command at a time.
+        dbg.do_restart(n_ckpt)
+        if n_run_start > 0:
+            dbg.replay_history(l_history, n_run_start)
+        n_pos = n_run_start
+        while n_pos < n_run_end:
+            dbg.replay_history(l_history[n_pos:n_pos + 1])
+            n_pos += 1
+            if _hits_between(d_start,
+                             _hit_counts(dbg, l_numbers)) >= n_hits:
+                return n_pos
+    if n_pos != n_run_end:
+        dbg.do_restart(n_ckpt)
+        dbg.replay_history(l_history, n_pos)
+    return n_pos
@@ -10,7 +10,6 @@ def reverse_finish(dbg, n=1):
     while n > 0:
         n -= 1
         dbg.update_state()
-        orig_state = dbg.state().copy()
         l_history = dbg.copy_current_checkpoint_history()
         level = dbg.state().level()
 	if level == 1:
@@ -53,13 +52,7 @@ def reverse_finish(dbg, n=1):
                 fredutil.fred_assert(dbg.state().level() == level-1)
             elif l_history[-1].is_next():
                 # Search for time in past when level was one higher.
-                # This can be optimized for fewer ckpt/restarts.
-                while dbg.state().level() >= level and \
-                        not dbg.at_breakpoint() and len(l_history)>0 and \
-                        (l_history[-1].is_next() or l_history[-1].is_step()):
-                    dbg.trim_n_cmds(l_history, 1)
-                    dbg.do_restart(b_clear_history = True)
-                    dbg.replay_history(l_history)
+                l_history = _search_shallower_level(dbg, l_history, level)
                 fredutil.fred_assert(dbg.state().level() >= level-1)
             elif l_history[-1].is_step():
                 dbg.trim_n_cmds(l_history, 1)
@@ -74,3 +67,62 @@ def reverse_finish(dbg, n=1):
     dbg.replay_history()
     dbg.update_state()
     fredutil.fred_debug("Reverse finish finished.")
+
+def _search_shallower_level(dbg, l_history, level):
+    """l_history ends with 'next' and 'step' commands, and the debugger is at
+    its end, at stack level >= level.  Return the prefix of l_history for
+    the last time the level was < level or the debugger was at a breakpoint,
+    but no earlier than the start of those commands; the debugger is left
+    there.
+    That can be true and false again before the call being finished (a
+    'step' into another call at the same depth), or inside it (at a
+    breakpoint), so it cannot be bisected for:  every position after the
+    one returned must be tried.  Those in the position trace are tried back
+    from the end without restarting.  The others are tried in windows of
+    1, 2, 4, ... positions back from there, each gone through forward one
+    command at a time after a single restart:  about log2(d) restarts for a
+    call site d commands back, where trying the positions one at a time
+    back from the end took d."""
+    n_start = len(l_history)
+    for (proto, n) in reversed(l_history.runs()):
+        if not proto.is_next() and not proto.is_step():
+            break
+        n_start -= n
+    n = len(l_history) - 1
+    while n > n_start:
+        l_prefix = l_history[:n]
+        n_level = dbg.traced_level(l_prefix)
+        if n_level == None:
+            break
+        if n_level < level or dbg.traced_at_breakpoint(l_prefix):
+            fredutil.fred_debug("Shallower level found in the position trace "
+                                "after %d commands." % n)
+            dbg.do_restart(b_clear_history = True)
+            dbg.replay_history(l_history, n)
+            return l_prefix
+        n -= 1
+    # Positions n_start + 1 to n are left to try:
+    n_width = 1
+    while n > n_start:
+        n_from = max(n - n_width, n_start)
+        dbg.do_restart(b_clear_history = True)
+        dbg.replay_history(l_history, n_from + 1)
+        n_found = None
+        for n_pos in range(n_from + 1, n + 1):
+            if n_pos > n_from + 1:
+                dbg.replay_history(l_history[n_pos - 1:n_pos])
+            if dbg.state().level() < level or dbg.at_breakpoint():
+                n_found = n_pos
+        if n_found == n:
+            return l_history[:n]
+        if n_found != None:
+            dbg.do_restart(b_clear_history = True)
+            dbg.replay_history(l_history, n_found)
+            return l_history[:n_found]
+        n = n_from
+        n_width *= 2
+    # Deeper since the start of the commands: stop there, as the caller
+    # handles the command before them.
+    dbg.do_restart(b_clear_history = True)
+    dbg.replay_history(l_history, n_start)
+    return l_history[:n_start]
@@ -1,5 +1,5 @@
 from .. import fredutil
-from .. import freddebugger
+import binary_search
 import undo
 import reverse_finish
 
@@ -9,16 +9,20 @@ import reverse_finish
 # .* 'n' at_bkpt -> .* 's' 'n'* at_bkpt  if 'n' changes level, and recurse
 # .* 'c' at_bkpt -> .* 's' 'n'* at_bkpt  and recurse to cases above
 # .* 'n' -> reverse_finish(.*)   if 'n' returns to shallower stack level
+# When the position trace of the checkpoint (Checkpoint.d_trace) shows
+# the level before the last 'n', the first two rules need no restart.
 def reverse_next(dbg, n=1):
     """Perform n 'reverse-next' commands."""
     if dbg.branch.get_num_checkpoints() == 0:
         fredutil.fred_error("No checkpoints found for reverse-next.")
         return
+    l_history = dbg.copy_current_checkpoint_history()
+    # False once the debugger is left behind the end of l_history:
+    b_live = True
     while n > 0:
         n -= 1
-        dbg.update_state()
-        orig_state = dbg.state().copy()
-        l_history = dbg.copy_current_checkpoint_history()
+        if b_live:
+            dbg.update_state()
         while True:
             # Trimming ignore commands. TODO: This could delete commands
             # with side effects like "p var++".
@@ -31,14 +35,23 @@ def reverse_next(dbg, n=1):
                 break
             if l_history[-1].is_step():
                 dbg.trim_n_cmds(l_history, 1)
+                b_live = False
                 break
             elif l_history[-1].is_next():
-                level = dbg.state().level()
-                if not dbg.program_is_running():
-                    level = -99
+                level = _level(dbg, l_history, b_live)
+                if level == None:
+                    _replay(dbg, l_history)
+                    b_live = True
+                    level = _level(dbg, l_history, b_live)
+                level_before = dbg.traced_level(l_history[:-1])
                 dbg.trim_n_cmds(l_history, 1)
-                dbg.do_restart(b_clear_history = True)
-                dbg.replay_history(l_history)
+                if level_before == level:
+                    fredutil.fred_debug("Level before 'next' found in the "
+                                        "position trace.")
+                    b_live = False
+                    break
+                _replay(dbg, l_history)
+                b_live = True
                 if dbg.state().level() == level:
                     break
                 elif dbg.state().level() == level+1:
@@ -60,21 +73,31 @@ def reverse_next(dbg, n=1):
                 # then it acts like 'c'.  Already undid last command for 'n'
                 if l_history[-1].is_continue():
                     del l_history[-1]
-                    dbg.do_restart(b_clear_history = True)
-                    dbg.replay_history(l_history)
+                    _replay(dbg, l_history)
                 dbg.append_step_over_libc(l_history)
-                # FIXME:  This is inefficient.  In gdb, we should be
-                #   doing 'n 2', 'n 4', 'n 8', etc., and be depending
-                #   on gdb stopping at breakpoint.  But gdb doesn't always
-                #   stop at breakpoint (e.g. at beginning of 'for' loop)
-                while dbg.program_is_running() and \
-                        not dbg.at_breakpoint():
-                    l_history += \
-                        [dbg._p.get_personality_cmd(freddebugger.fred_next_cmd())]
-                    dbg.replay_history([l_history[-1]])
+                l_history = binary_search.NEW_binary_search_next_to_breakpoint(
+                    dbg, l_history)
     # Gene - Am I using the next four lines correctly?
     dbg.current_checkpoint().set_history(l_history)
     dbg.do_restart()
     dbg.replay_history(l_history)
     dbg.update_state()
     fredutil.fred_debug("Reverse next finished.")
+
+def _level(dbg, l_history, b_live):
+    """Return the stack level at the end of l_history (-99 if the program
+    is not running there), from the debugger if b_live (it is there), and
+    from the position trace otherwise (None if it is not in the trace)."""
+    if b_live:
+        if not dbg.program_is_running():
+            return -99
+        return dbg.state().level()
+    level = dbg.traced_level(l_history)
+    if level == -1:
+        return -99
+    return level
+
+def _replay(dbg, l_history):
+    """Restart and replay l_history."""
+    dbg.do_restart(b_clear_history = True)
+    dbg.replay_history(l_history)
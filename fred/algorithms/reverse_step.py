@@ -1,5 +1,4 @@
 from .. import fredutil
-from .. import freddebugger
 import binary_search
 import undo
 
@@ -20,7 +19,6 @@ def reverse_step(dbg, n=1):
     while n > 0:
         n -= 1
         dbg.update_state()
-        orig_state = dbg.state().copy()
         if dbg.branch.get_num_checkpoints() == 0:
             fredutil.fred_error("No checkpoints found for reverse-step.")
             return
@@ -37,17 +35,12 @@ def reverse_step(dbg, n=1):
             # Since we last executed 'continue', we must be at a breakpoint.
             # Use that to expand the last 'continue' command until we
             #   reach the breakpoint.
-            # FIXME:  This is inefficient.  In gdb, we should be
-            #   doing 'n 2', 'n 4', 'n 8', etc., and be depending
-            #   on gdb stopping at breakpoint.  But gdb doesn't always
-            #   stop at breakpoint (e.g. at beginning of 'for' loop)
             del l_history[-1]
             dbg.do_restart(b_clear_history = True)
             dbg.replay_history(l_history)
             dbg.append_step_over_libc(l_history)
-            while dbg.program_is_running() and not dbg.at_breakpoint():
-                l_history += [dbg._p.get_personality_cmd(freddebugger.fred_next_cmd())]
-                dbg.replay_history([l_history[-1]])
+            l_history = binary_search.NEW_binary_search_next_to_breakpoint(
+                dbg, l_history)
         fredutil.fred_debug("Done next doubling; starting search.")
         while l_history[-1].is_next():
             level = dbg.state().level()
@@ -1,5 +1,8 @@
 from .. import fredutil
+from .. import freddebugger
+from .. import fredmanager
 import binary_search
+import thread_rank
 
 def _reverse_watch_main_thread(dbg, s_expr, s_expr_val):
     """Perform 'reverse-watch' command on expression, *only* in the
@@ -34,10 +37,12 @@ def _reverse_watch_main_thread(dbg, s_expr, s_expr_val):
         dbg.remove_checkpoint(n_ckpt_idx)
     return b_main_thread_changed_expr
 
-def _reverse_watch_round_robin(dbg, testIfTooFar):
+def _reverse_watch_round_robin(dbg, testIfTooFar, n_entry=None):
     """Perform a round-robin reverse-watch on all threads currently
     alive. Return True if the round-robin algorithm identified the
-    thread which changed the expression, or false if it failed."""
+    thread which changed the expression, or false if it failed.
+    If n_entry, the log event during which the expression changed, is
+    given, threads are tried in the order of thread_rank.rank_threads()."""
     fredutil.fred_debug("Beginning round-robin search through threads.")
 
     fredutil.fred_assert(not testIfTooFar())
@@ -49,8 +54,17 @@ def _reverse_watch_round_robin(dbg, testIfTooFar):
     l_threads = dbg.get_alive_threads()[:-1]
     # XXX: Write function to remove non-user threads from the list:
     #debugger.remove_non_user_threads(l_threads)
+    # Clone ids are handed out from 1 in thread creation order, as gdb
+    # numbers threads, so the log index ranks debugger tids directly.
+    log_index = None
+    if n_entry != None:
+        log_index = fredmanager.get_log_index()
+    if log_index != None:
+        l_threads = thread_rank.rank_threads(log_index, n_entry, l_threads)
     b_found_thread = False
+    n_tried = 0
     for t in l_threads:
+        n_tried += 1
         dbg.do_switch_to_thread(t)
         while True:
             try:
@@ -83,6 +97,10 @@ def _reverse_watch_round_robin(dbg, testIfTooFar):
         if b_found_thread:
             break
         dbg.do_restart(n_begin_rr_ckpt, b_clear_history=True)
+    freddebugger.gn_total_thread_searches += 1
+    freddebugger.gn_total_threads_tried += n_tried
+    fredutil.fred_debug("Round-robin search tried %d of %d threads." %
+                        (n_tried, len(l_threads)))
     dbg.update_state()
     return b_found_thread
 
@@ -95,7 +113,7 @@ def reverse_watch_for_mt(dbg, s_expr):
         return
     
     s_expr_val = dbg.evaluate_expression(s_expr)
-    testIfTooFar = lambda: dbg.test_expression(s_expr, s_expr_val)
+    testIfTooFar = binary_search.ExpressionTest(dbg, s_expr, s_expr_val)
     fredutil.fred_debug("RW: Starting with expr value '%s'" % s_expr_val)
 
     # ---------------------------- Binary search of checkpoints
@@ -115,7 +133,7 @@ def reverse_watch_for_mt(dbg, s_expr):
                         "Starting binary search of system calls.")
     
     # ---------------------------- Binary search through system calls
-    binary_search.binary_search_log_events(dbg, testIfTooFar)
+    n_entry = binary_search.binary_search_log_events(dbg, testIfTooFar)
     # We are now at a point in time where at some point after the next
     # system call the expression will change. We are guaranteed that
     # the culprit thread is alive, because a "pthread_create" call is
@@ -123,7 +141,7 @@ def reverse_watch_for_mt(dbg, s_expr):
     # consider that in determining the lower bound.
 
     # ---------------------------- Round-robin search for culprit thread
-    if not _reverse_watch_round_robin(dbg, testIfTooFar):
+    if not _reverse_watch_round_robin(dbg, testIfTooFar, n_entry):
         fredutil.fred_error("Reverse-watch failed to determine the thread "
                             "which caused the expression '%s' to change." %
                             s_expr)
@@ -0,0 +1,195 @@
+from .. import fredutil
+from .. import freddebugger
+from .. import fredjournal
+import json
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import parallel_search
+import reverse_next
+import reverse_step
+
+"""
+This file contains the speculation engine, enabled with fredapp.py
+--speculate.
+
+While the user sits at the prompt, a worker process (fredworker.py
+--speculate) restarts the current checkpoint in a session of its own,
+replays the history and performs 'reverse-next' and 'reverse-step' there.
+The resulting histories are kept for the position they were computed
+from, so that a 'fred-rn' or 'fred-rs' issued there takes one restart and
+replay instead of a search.  ('fred-undo' already takes one restart.)
+
+Any user command cancels the worker at once (after collecting what it
+finished).  The worker and everything it starts run at the lowest
+priority and with a limit on CPU time.
+"""
+
+# Speculate at the prompt (fredapp.py --speculate):
+gb_speculate = False
+# Priority and CPU time limit (per process) of the worker:
+GN_SPECULATION_NICE = 19
+GN_SPECULATION_CPU_SECONDS = 60
+# Commands precomputed by the worker, in this order:
+GL_SPECULATED_COMMANDS = ["reverse-next", "reverse-step"]
+GD_SPECULATED_ALGORITHMS = {"reverse-next" : reverse_next.reverse_next,
+                            "reverse-step" : reverse_step.reverse_step}
+
+# The Speculation started at the current position, or None:
+g_speculation = None
+# Cancelled workers which may still be exiting:
+gl_dying_workers = []
+# Speculated commands issued by the user, and how many were ready:
+gn_total_speculated = 0
+gn_total_speculation_hits = 0
+
+class Speculation():
+    """One speculation worker, precomputing GL_SPECULATED_COMMANDS from the
+    position of the debugger when it was created."""
+    def __init__(self, dbg):
+        self.key = dbg.position_key()
+        self.n_index = dbg.current_checkpoint().get_index()
+        self.l_history = dbg.copy_current_checkpoint_history()
+        self.s_debugger = dbg.personality_name()
+        s_fred_tmpdir = os.path.dirname(os.environ["DMTCP_TMPDIR"])
+        self.s_tmpdir = os.path.join(s_fred_tmpdir, "speculation-worker")
+        self.s_history_path = self.s_tmpdir + "-history.json"
+        self.s_result_path = self.s_tmpdir + ".json"
+        # Past the ports of the search workers:
+        self.n_port = int(os.environ["DMTCP_PORT"]) + 1 + \
+                      parallel_search.gn_search_workers
+        self.d_results = {}
+        self.process = None
+
+    def start(self):
+        """Start the worker process (non-blocking)."""
+        shutil.rmtree(self.s_tmpdir, ignore_errors=True)
+        if os.path.exists(self.s_result_path):
+            os.remove(self.s_result_path)
+        f = open(self.s_history_path, "w")
+        json.dump(fredjournal.encode_history(self.l_history), f)
+        f.close()
+        l_cmd = [sys.executable, parallel_search.GS_WORKER_SCRIPT,
+                 "-p", str(self.n_port),
+                 "--tmpdir", self.s_tmpdir,
+                 "--checkpoint-dir",
+                 os.path.realpath(os.environ["DMTCP_TMPDIR"]),
+                 "--result", self.s_result_path,
+                 "--speculate", self.s_history_path]
+        if fredutil.GB_DEBUG:
+            l_cmd.append("--enable-debug")
+        l_cmd += [self.s_debugger, str(self.n_index)]
+        fredutil.fred_debug("Starting speculation worker: %s" % str(l_cmd))
+        f_null = open(os.devnull, "w")
+        self.process = subprocess.Popen(l_cmd, stdin=subprocess.PIPE,
+                                        stdout=f_null, stderr=f_null,
+                                        close_fds=True,
+                                        preexec_fn=_limit_worker)
+        f_null.close()
+
+    def collect(self):
+        """Read the results the worker has written so far."""
+        try:
+            f = open(self.s_result_path)
+            d_results = json.load(f)
+            f.close()
+        except (IOError, ValueError):
+            return
+        for (s_command, l_runs) in d_results.items():
+            self.d_results[s_command] = fredjournal.decode_history(
+                l_runs, freddebugger.fred_command_from_list)
+
+    def stop(self):
+        """Collect the results, and ask the worker to exit if it is still
+        running."""
+        self.collect()
+        if self.process != None and self.process.poll() == None:
+            fredutil.fred_debug("Cancelling speculation worker.")
+            self.process.send_signal(signal.SIGTERM)
+            gl_dying_workers.append(self.process)
+        self.process = None
+
+    def result(self, dbg, s_command):
+        """Return the History which s_command leads to from the current
+        position, or None if it was not computed."""
+        if dbg.position_key() != self.key:
+            return None
+        return self.d_results.get(s_command)
+
+def _limit_worker():
+    """Run in the worker process before it starts:  lower its priority
+    and limit its CPU time.  Both are inherited by its children."""
+    global GN_SPECULATION_NICE, GN_SPECULATION_CPU_SECONDS
+    os.nice(GN_SPECULATION_NICE)
+    resource.setrlimit(resource.RLIMIT_CPU, (GN_SPECULATION_CPU_SECONDS,
+                                             GN_SPECULATION_CPU_SECONDS))
+
+def _reap_dying_workers():
+    """Wait for the cancelled workers, which release their port and tmpdir
+    when they exit."""
+    global gl_dying_workers
+    for process in gl_dying_workers:
+        process.wait()
+    gl_dying_workers = []
+
+def start(dbg):
+    """Start speculating from the current position, if enabled.  Called when
+    the user is back at the prompt."""
+    global gb_speculate, g_speculation, GL_SPECULATED_COMMANDS
+    if not gb_speculate or dbg.branch.get_num_checkpoints() == 0 or \
+           dbg.position_key() == None:
+        return
+    if g_speculation != None and g_speculation.key == dbg.position_key() and \
+           len(g_speculation.d_results) == len(GL_SPECULATED_COMMANDS):
+        # Nothing moved since, and everything is computed.
+        return
+    cancel()
+    _reap_dying_workers()
+    g_speculation = Speculation(dbg)
+    g_speculation.start()
+
+def cancel():
+    """Stop the worker, keeping whatever it has finished.  Called before
+    every user command."""
+    global g_speculation
+    if g_speculation != None:
+        g_speculation.stop()
+
+def use_result(dbg, s_command):
+    """If the worker computed s_command (one of GL_SPECULATED_COMMANDS) from
+    the current position, go to its result with one restart and return
+    True.  Otherwise return False, and the command must be performed."""
+    global g_speculation, gn_total_speculated, gn_total_speculation_hits
+    if g_speculation == None:
+        return False
+    gn_total_speculated += 1
+    l_history = g_speculation.result(dbg, s_command)
+    g_speculation = None
+    if l_history == None:
+        fredutil.fred_debug("No speculated result for '%s'." % s_command)
+        return False
+    gn_total_speculation_hits += 1
+    fredutil.fred_debug("Using speculated result for '%s' (%d of %d so far)."
+                        % (s_command, gn_total_speculation_hits,
+                           gn_total_speculated))
+    dbg.current_checkpoint().set_history(l_history)
+    dbg.do_restart()
+    dbg.replay_history()
+    dbg.update_state()
+    return True
+
+def speculate(dbg, l_history):
+    """Worker side:  the debugger's current checkpoint is the one the
+    parent speculates from.  Perform each of GL_SPECULATED_COMMANDS after
+    l_history, and yield (command, resulting History) as each finishes."""
+    global GL_SPECULATED_COMMANDS, GD_SPECULATED_ALGORITHMS
+    for s_command in GL_SPECULATED_COMMANDS:
+        dbg.do_restart(b_clear_history = True)
+        if len(l_history) > 0:
+            dbg.replay_history(l_history)
+        dbg.current_checkpoint().set_history(l_history.copy())
+        GD_SPECULATED_ALGORITHMS[s_command](dbg)
+        yield (s_command, dbg.copy_current_checkpoint_history())
@@ -0,0 +1,83 @@
+from .. import fredutil
+
+"""
+This file contains the ranking of candidate threads for the round-robin
+search of reverse-watch (reverse_watch._reverse_watch_round_robin()).
+
+binary_search_log_events() locates the log entry n_entry during which the
+expression changed.  Memory writes are not logged, but the synchronization
+log around n_entry (fredlog.LogIndex) says which threads were running
+then:
+  - the thread owning n_entry, and the threads with entries soon after it,
+    were scheduled while the expression changed;
+  - threads which took or released locks around n_entry are the ones
+    whose critical sections may guard the expression;
+  - threads whose calls around n_entry write memory (read(), malloc(), ...)
+    may have changed it through a syscall or the allocator.
+Threads are tried in decreasing order of these scores.
+"""
+
+# Entries on each side of n_entry which are considered:
+GN_RANK_WINDOW = 32
+# Score of the thread owning n_entry:
+GF_NEXT_WEIGHT = 4.0
+# Score of the other threads with entries in the window after n_entry,
+# decreasing linearly with the distance of their first entry:
+GF_SOON_WEIGHT = 2.0
+# Score of the threads with lock events in the window:
+GF_LOCK_WEIGHT = 1.0
+# Score of the threads with memory-writing events in the window:
+GF_MEMORY_WEIGHT = 1.0
+
+GL_LOCK_EVENTS = ["pthread_mutex_lock", "pthread_mutex_trylock",
+                  "pthread_mutex_unlock", "pthread_rwlock_rdlock",
+                  "pthread_rwlock_wrlock", "pthread_rwlock_unlock",
+                  "pthread_cond_wait", "pthread_cond_timedwait",
+                  "pthread_cond_signal", "pthread_cond_broadcast",
+                  "flockfile", "ftrylockfile", "funlockfile"]
+GL_MEMORY_EVENTS = ["read", "readv", "pread", "preadv", "recvfrom",
+                    "recvmsg", "fread", "fgets", "getline", "getdelim",
+                    "vfscanf", "getc", "fgetc", "readlink", "realpath",
+                    "getcwd", "readdir_r", "getpwnam_r", "getpwuid_r",
+                    "getgrnam_r", "getgrgid_r", "mmap", "mmap64", "mremap",
+                    "munmap", "malloc", "calloc", "realloc", "free",
+                    "libc_memalign"]
+
+def thread_scores(log_index, n_entry):
+    """Return a dict mapping the clone id of each thread with log entries
+    around n_entry to its score."""
+    global GN_RANK_WINDOW, GF_NEXT_WEIGHT, GF_SOON_WEIGHT, GF_LOCK_WEIGHT, \
+           GF_MEMORY_WEIGHT, GL_LOCK_EVENTS, GL_MEMORY_EVENTS
+    d_scores = {}
+    def add(n_clone_id, f_score):
+        d_scores[n_clone_id] = d_scores.get(n_clone_id, 0.0) + f_score
+    n_first = max(0, n_entry - GN_RANK_WINDOW)
+    n_last = min(len(log_index), n_entry + GN_RANK_WINDOW)
+    if n_entry < len(log_index):
+        add(log_index.clone_id(n_entry), GF_NEXT_WEIGHT)
+    s_seen = set()
+    for n in range(n_entry + 1, n_last):
+        n_clone_id = log_index.clone_id(n)
+        if n_clone_id not in s_seen:
+            s_seen.add(n_clone_id)
+            add(n_clone_id, GF_SOON_WEIGHT *
+                (1.0 - float(n - n_entry) / GN_RANK_WINDOW))
+    for (l_events, f_weight) in [(GL_LOCK_EVENTS, GF_LOCK_WEIGHT),
+                                 (GL_MEMORY_EVENTS, GF_MEMORY_WEIGHT)]:
+        s_threads = set([log_index.clone_id(n) for n in
+                         log_index.events(l_event_names=l_events,
+                                          n_first=n_first, n_last=n_last)])
+        for n_clone_id in s_threads:
+            add(n_clone_id, f_weight)
+    return d_scores
+
+def rank_threads(log_index, n_entry, l_threads):
+    """Return l_threads (clone ids) sorted by decreasing score around log
+    entry n_entry.  Threads with equal scores keep their order."""
+    d_scores = thread_scores(log_index, n_entry)
+    l_ranked = sorted(l_threads, key=lambda t: -d_scores.get(t, 0.0))
+    fredutil.fred_debug("Threads ranked around log entry %d: %s" %
+                        (n_entry, ", ".join(["%d (%.2f)" %
+                                             (t, d_scores.get(t, 0.0))
+                                             for t in l_ranked])))
+    return l_ranked
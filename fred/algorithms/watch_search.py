@@ -0,0 +1,76 @@
+from .. import fredutil
+from .. import fredhistory
+
+"""
+This file contains the watchpoint engine of reverse-watch, selected with
+fredapp.py --reverse-watch-engine watch.
+
+Instead of bisecting a history with one restart per probe, it restarts
+once, sets a counting watchpoint on the location of the expression (see
+Personality.set_counting_watchpoint()) and replays the whole history,
+reading the number of changes after each run of commands.  The last run
+that changed the expression is then replayed one command at a time.  That
+takes at most three restarts, however long the history.
+
+Expressions that cannot be watched (not lvalues, not in scope where the
+search starts, or personalities without watchpoints) are left to the
+bisection of binary_search.py.
+"""
+
+def watch_search_history(dbg, l_history, n_min, s_expr):
+    """Find the command of l_history[n_min:] which last changed s_expr.
+    Like binary_search.NEW_binary_search_history(), return l_history up to
+    and including that command, with the debugger just before it.  Return
+    None if s_expr cannot be watched or never changes."""
+    if not dbg._p.b_watchpoint_support:
+        return None
+    n_watch = _restart_and_watch(dbg, l_history, n_min, s_expr)
+    if n_watch == -1:
+        return None
+    # Pass 1: count the changes made by each run of commands.
+    n_hits = 0
+    n_run_start = n_min
+    t_last_run = None
+    for (proto, n) in l_history[n_min:].runs():
+        h_run = fredhistory.History()
+        h_run.append(proto, n)
+        dbg.replay_history(h_run)
+        n_now = dbg.counting_watchpoint_hits()
+        if n_now < 0:
+            dbg.delete_watchpoint(n_watch)
+            return None
+        if n_now > n_hits:
+            t_last_run = (n_run_start, n_run_start + n)
+            n_hits = n_now
+        n_run_start += n
+    dbg.delete_watchpoint(n_watch)
+    if t_last_run == None:
+        fredutil.fred_debug("Watchpoint on '%s' never hit." % s_expr)
+        return None
+    fredutil.fred_debug("'%s' changed %d times; last in commands [%d, %d)." %
+                        (s_expr, n_hits, t_last_run[0], t_last_run[1]))
+    # Pass 2: find the command of that run which made the last change.
+    n_change = t_last_run[0]
+    if t_last_run[1] - t_last_run[0] > 1:
+        n_watch = _restart_and_watch(dbg, l_history, n_min, s_expr)
+        fredutil.fred_assert(n_watch != -1)
+        if t_last_run[0] > n_min:
+            dbg.replay_history(l_history[n_min:t_last_run[0]])
+        while n_change < t_last_run[1] - 1:
+            dbg.replay_history(l_history[n_change:n_change + 1])
+            if dbg.counting_watchpoint_hits() == n_hits:
+                break
+            n_change += 1
+        dbg.delete_watchpoint(n_watch)
+    fredutil.fred_debug("Last change of '%s' by command %d." %
+                        (s_expr, n_change))
+    dbg.do_restart(b_clear_history = True)
+    dbg.replay_history(l_history, n_change)
+    return l_history[:n_change + 1]
+
+def _restart_and_watch(dbg, l_history, n_min, s_expr):
+    """Restart, replay l_history[:n_min] and set a counting watchpoint on
+    s_expr.  Return its number, or -1 if it cannot be set."""
+    dbg.do_restart(b_clear_history = True)
+    dbg.replay_history(l_history, n_min)
+    return dbg.set_counting_watchpoint(s_expr)
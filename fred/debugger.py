@@ -32,13 +32,15 @@ class Debugger():
         """Set the real pid of the debugger process."""
         self._n_real_pid = n_pid
 
-    def _next(self, n, b_timeout=False):
+    def _next(self, n, b_timeout=False, n_timeout=None):
         """Perform n 'next' commands. Returns output."""
-        return self._p.do_next(n, b_timeout_prompt=b_timeout)
+        return self._p.do_next(n, b_timeout_prompt=b_timeout,
+                               n_timeout=n_timeout)
 
-    def _step(self, n, b_timeout=False):
+    def _step(self, n, b_timeout=False, n_timeout=None):
         """Perform n 'step' commands. Returns output."""
-        return self._p.do_step(n, b_timeout_prompt=b_timeout)
+        return self._p.do_step(n, b_timeout_prompt=b_timeout,
+                               n_timeout=n_timeout)
 
     def _continue(self, b_wait_for_prompt):
         """Perform 'continue' command. Returns output."""
@@ -64,6 +66,28 @@ class Debugger():
         """Perform 'print expr' command. Returns output."""
         return self._p.do_print(expr, b_drain_first)
 
+    def _print_batch(self, l_exprs):
+        """Perform 'print expr' for each expression. Returns list of outputs."""
+        return self._p.do_print_batch(l_exprs)
+
+    def set_counting_watchpoint(self, s_expr):
+        """Set a watchpoint counting the changes of s_expr without stopping.
+        Return its number, or -1 if it cannot be set.  Like all watchpoint
+        calls, this is not logged in the history."""
+        return self._p.set_counting_watchpoint(s_expr)
+
+    def counting_watchpoint_hits(self):
+        """Return the number of changes counted by counting watchpoints."""
+        return self._p.counting_watchpoint_hits()
+
+    def delete_watchpoint(self, n_number):
+        """Delete the given (counting) watchpoint."""
+        self._p.delete_watchpoint(n_number)
+
+    def source_line(self, s_file, n_line):
+        """Return the text of the given source line, or None if unknown."""
+        return self._p.source_line(s_file, n_line)
+
     def _switch_to_thread(self, n_tid):
         """Perform thread switch command to given tid. No output returned."""
         self._p.switch_to_thread(n_tid)
@@ -86,11 +110,17 @@ class Debugger():
 
     def get_alive_threads(self):
         """Return a list of debugger tids for all threads currently alive."""
+        d_state = self.state_snapshot()
+        if d_state != None:
+            return d_state["threads"]
         l_threads = self._p.get_threads()
         return [x[1] for x in l_threads]
 
     def get_current_thread(self):
         """Return the debugger tid for the currently active thread."""
+        d_state = self.state_snapshot()
+        if d_state != None and d_state["thread"] != None:
+            return d_state["thread"]
         l_threads = self._p.get_threads()
         for tup in l_threads:
             if tup[0]:
@@ -99,14 +129,29 @@ class Debugger():
     def within_user_code(self):
         """Return True if the current position is within user code."""
         fredutil.fred_assert(self.personality_name() == "gdb")
+        d_state = self.state_snapshot()
+        if d_state != None and d_state["frame"] != None:
+            return d_state["user_code"]
         return self._p.within_user_code()
 
     def current_position(self):
         """Return a BacktraceFrame representing current debugger position."""
+        d_state = self.state_snapshot()
+        if d_state != None:
+            return frame_from_snapshot(d_state["frame"])
         return self._p.current_position()
 
+    def state_snapshot(self):
+        """Return a dict describing the current position, fetched from the
+        debugger in one round trip (see gdbhelper.py), or None if the
+        personality does not support it."""
+        return self._p.state_snapshot()
+
     def at_breakpoint(self):
         """Return True if debugger is currently on a breakpoint."""
+        d_state = self.state_snapshot()
+        if d_state != None:
+            return d_state["at_breakpoint"]
         bt_frame = self._p.current_position()
         self.update_state()
         return self._p.at_breakpoint(bt_frame, self.state().get_breakpoints())
@@ -119,7 +164,13 @@ class Debugger():
     def update_state(self):
         """Update the underlying DebuggerState."""
         fredutil.fred_debug("Updating DebuggerState.")
-        self.state().set_backtrace(self._p.get_backtrace())
+        if self._p.b_stack_depth_support:
+            self.state().set_lazy_backtrace(self._p.get_backtrace,
+                                            self._p.stack_depth(),
+                                            self.current_position)
+        else:
+            # The depth is read from the backtrace anyway.
+            self.state().set_backtrace(self._p.get_backtrace())
         self.state().set_breakpoints(self._p.get_breakpoints())
 
     def get_find_prompt_function(self):
@@ -148,6 +199,11 @@ class Debugger():
         # The extra debugging functions are gdb-specific.  When a gdb
         #  target app exits, it first returns to the call frames below.
         if self.personality_name() == "gdb":
+            d_state = self.state_snapshot()
+            if d_state != None:
+                return d_state["running"] and d_state["frame"] != None and \
+                    d_state["frame"]["function"] not in \
+                    ["_start", "__libc_start_main"]
             if not self.program_is_runnable():
                 return False
             return self._p.program_is_running() and \
@@ -159,7 +215,7 @@ class Debugger():
     def program_is_runnable(self):
         """Return True if inferior is in a "runnable" state."""
         if self.personality_name() == "gdb":
-            return self._p.current_position() != None
+            return self.current_position() != None
         else:
             fredutil.fred_assert(False, "Unimplemented")
 
@@ -197,24 +253,108 @@ class Debugger():
         if n_pid != -1:
             os.kill(n_pid, signal.SIGINT)
 
-class DebuggerState():
+def frame_from_snapshot(d_frame):
+    """Return a BacktraceFrame built from the "frame" of a state snapshot
+    (see Debugger.state_snapshot()), or None if there is no frame.  Such
+    frames have no argument list."""
+    if d_frame == None:
+        return None
+    frame = BacktraceFrame()
+    frame.n_frame_num = d_frame["level"]
+    frame.s_addr      = "0x%x" % d_frame["pc"]
+    frame.s_function  = str(d_frame["function"])
+    frame.s_file      = str(d_frame["file"])
+    frame.n_line      = d_frame["line"]
+    return frame
+
+class DebuggerState(object):
     """Represents the current state of a debugger.
     State of a debugger is represented by:
       - current backtrace
       - current breakpoints, if any
-    """
+    Frames and Breakpoints are never modified once parsed, so copies of a
+    state share them.
+    The backtrace may be lazy (see set_lazy_backtrace()):  it is only read
+    from the debugger when first needed.  The stack depth is then read at
+    once, which is much cheaper than parsing a deep backtrace, so that
+    level() stays right after the debugger moves on.  Copies and
+    comparisons of lazy states only read the location of the innermost
+    frame, and compare states by depth and location unless both
+    backtraces were read."""
+    __slots__ = ["backtrace", "l_breakpoints", "fnc_get_backtrace",
+                 "n_depth", "fnc_get_location", "t_location"]
+
     def __init__(self):
-        # The current backtrace.
+        # The current backtrace (None in a copy made before it was read):
         self.backtrace = Backtrace()
         # Current breakpoints (list of Breakpoint objects)
         self.l_breakpoints = []
+        # Function returning the current Backtrace, until it is called (None
+        # when not lazy):
+        self.fnc_get_backtrace = None
+        # Stack depth, if known:
+        self.n_depth = None
+        # Function returning the BacktraceFrame of the current position,
+        # until it is called (None when not lazy):
+        self.fnc_get_location = None
+        # (function, file, line) of the innermost frame, if known:
+        self.t_location = None
 
     def set_backtrace(self, bt):
-        self.backtrace = bt
+        self._load_backtrace(bt)
+        self.n_depth = None
+        self.fnc_get_location = None
+        self.t_location = None
+
+    def set_lazy_backtrace(self, fnc_get_backtrace, n_depth,
+                           fnc_get_location):
+        """Set the backtrace to fnc_get_backtrace(), called when the
+        backtrace is first needed, the stack depth to n_depth, read from
+        the debugger at the same position, and the location to that of the
+        BacktraceFrame returned by fnc_get_location() (which is much
+        cheaper than the whole backtrace).  The backtrace and location must
+        be needed (if at all) before the debugger moves on."""
+        self.fnc_get_backtrace = fnc_get_backtrace
+        self.n_depth = n_depth
+        self.fnc_get_location = fnc_get_location
+        self.t_location = None
 
     def get_backtrace(self):
+        if self.fnc_get_backtrace != None:
+            self._load_backtrace(self.fnc_get_backtrace())
+        fredutil.fred_assert(self.backtrace != None,
+                             "Backtrace of a state copied before it was read.")
         return self.backtrace
 
+    def _load_backtrace(self, bt):
+        # Reuse the frames the new backtrace has in common with the old one,
+        # so that comparing the two states is mostly identity checks.
+        bt.share_frames(self.backtrace)
+        self.backtrace = bt
+        self.fnc_get_backtrace = None
+
+    def _has_backtrace(self):
+        """Return True if the backtrace was read."""
+        return self.fnc_get_backtrace == None and self.backtrace != None
+
+    def location(self):
+        """Return (function, file, line) of the innermost frame, or () if
+        there is none."""
+        if self.t_location == None:
+            if self.fnc_get_location != None:
+                frame = self.fnc_get_location()
+                self.fnc_get_location = None
+            else:
+                l_frames = self.get_backtrace().get_frames()
+                frame = None
+                if len(l_frames) > 0:
+                    frame = l_frames[0]
+            self.t_location = ()
+            if frame != None:
+                self.t_location = (frame.s_function, frame.s_file,
+                                   frame.n_line)
+        return self.t_location
+
     def set_breakpoints(self, l_bps):
         self.l_breakpoints = l_bps
 
@@ -225,30 +365,59 @@ class DebuggerState():
         self.l_breakpoints.append(bp)
 
     def __eq__(self, other):
-        return self.backtrace == other.backtrace and \
-               self.get_breakpoints() == other.get_breakpoints()
+        if other == None or self.get_breakpoints() != other.get_breakpoints():
+            return False
+        if self._has_backtrace() and other._has_backtrace():
+            return self.backtrace == other.backtrace
+        return self.level() == other.level() and \
+               self.location() == other.location()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
 
     def __repr__(self):
+        if self._has_backtrace():
+            s_backtrace = str(self.backtrace)
+        else:
+            s_backtrace = "(not read: depth %d at %s)" % (self.level(),
+                                                          self.location())
         s = "---Backtrace:---\n%s\n---Breakpoints:---\n%s\n" % \
-            (str(self.get_backtrace()), str(self.get_breakpoints()))
+            (s_backtrace, str(self.get_breakpoints()))
         return s
 
     def copy(self):
-        """Return a deep copy of this instance."""
+        """Return a copy of this instance, sharing its (unmodifiable) frames
+        and breakpoints.  A copy is never lazy, since the debugger will have
+        moved on by the time it is used:  if the backtrace was not read,
+        the copy only has the depth and location."""
         new_state = DebuggerState()
-        new_state.set_backtrace(self.get_backtrace().copy())
-        for b in self.get_breakpoints():
-            new_state.add_breakpoint(b.copy())
+        new_state.n_depth = self.level()
+        if self._has_backtrace():
+            new_state.backtrace = self.backtrace.copy()
+            new_state.t_location = self.t_location
+        else:
+            new_state.backtrace = None
+            new_state.t_location = self.location()
+        new_state.l_breakpoints = list(self.get_breakpoints())
         return new_state
 
     def level(self):
         """Return stack depth."""
-        return self.backtrace.depth()
+        if self.n_depth == None:
+            self.n_depth = self.get_backtrace().depth()
+        return self.n_depth
 
-class Breakpoint():
+class Breakpoint(object):
     """Represents one breakpoint in the debugger.
     It's not necessary to use all of these fields. gdb is currently the only
-    one which does."""
+    one which does.
+    The fields are filled in by the personality when parsing, and must not be
+    modified after that: Breakpoints are shared between DebuggerStates, and
+    cache their hash."""
+    __slots__ = ["n_number", "s_type", "s_display", "s_enable", "s_address",
+                 "s_function", "s_file", "n_line", "n_count",
+                 "n_ignore_count", "_n_hash"]
+
     def __init__(self):
         self.n_number   = 0
         self.s_type     = ""
@@ -259,66 +428,163 @@ class Breakpoint():
         self.s_file     = ""
         self.n_line     = 0
         self.n_count    = 0
+        # Number of crossings the debugger will still ignore:
+        self.n_ignore_count = 0
+        self._n_hash    = None
+
+    def _key(self):
+        return (self.n_number, self.s_type, self.s_display,
+                self.s_enable, self.s_address, self.s_function,
+                self.s_file, self.n_line, self.n_count, self.n_ignore_count)
 
     def __repr__(self):
-        return "bp: " + str((self.n_number, self.s_type, self.s_display,
-                             self.s_enable, self.s_address, self.s_function,
-                             self.s_file, self.n_line, self.n_count))
+        return "bp: " + str(self._key())
+
+    def __hash__(self):
+        if self._n_hash == None:
+            self._n_hash = hash(self._key())
+        return self._n_hash
 
     def __eq__(self, other):
-        return other != None and \
-               self.n_number == other.n_number and \
-               self.s_type == other.s_type and \
-               self.s_display == other.s_display and \
-               self.s_enable == other.s_enable and \
-               self.s_address == other.s_address and \
-               self.s_function == other.s_function and \
-               self.s_file == other.s_file and \
-               self.n_line == other.n_line and \
-               self.n_count == other.n_count
+        if self is other:
+            return True
+        return isinstance(other, Breakpoint) and \
+               hash(self) == hash(other) and self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
 
     def copy(self):
         """Return a deep copy of this instance."""
         bp = Breakpoint()
-        bp.n_number   = self.n_number
-        bp.s_type     = self.s_type
-        bp.s_display  = self.s_display
-        bp.s_enable   = self.s_enable
-        bp.s_address  = self.s_address
-        bp.s_function = self.s_function
-        bp.s_file     = self.s_file
-        bp.n_line     = self.n_line
-        bp.n_count    = self.n_count
+        (bp.n_number, bp.s_type, bp.s_display, bp.s_enable, bp.s_address,
+         bp.s_function, bp.s_file, bp.n_line, bp.n_count,
+         bp.n_ignore_count) = self._key()
+        bp._n_hash = self._n_hash
+        return bp
+
+    def with_enable(self, s_enable):
+        """Return a copy of this instance with the given enable flag."""
+        bp = self.copy()
+        bp.s_enable = s_enable
+        bp._n_hash = None
         return bp
 
-class Backtrace():
+class BreakpointTable():
+    """Client-side record of the breakpoints known to the debugger.
+
+    The table is updated from the breakpoint commands FReD sees go by, so
+    that the debugger does not have to be asked for 'info breakpoints' on
+    every state update. When FReD cannot tell what a command did to the
+    breakpoints (after a restart, or an unrecognized command), the table is
+    marked stale and is re-read from the debugger on next use.
+    Note that hit counts and ignore counts (Breakpoint.n_count and
+    n_ignore_count) are only as recent as the last time the table was read
+    from the debugger."""
+    def __init__(self):
+        # List of Breakpoint objects, in the order the debugger reports them
+        self.l_breakpoints = []
+        # Map of (s_file, n_line) -> list of Breakpoints at that location
+        self.d_locations = {}
+        self.b_stale = True
+
+    def __repr__(self):
+        return str(self.l_breakpoints)
+
+    def is_stale(self):
+        """Return True if the table must be re-read from the debugger."""
+        return self.b_stale
+
+    def mark_stale(self):
+        """Mark the table as out of date with respect to the debugger."""
+        self.b_stale = True
+
+    def set_breakpoints(self, l_breakpoints):
+        """Replace the contents of the table by the given list of
+        Breakpoints (as read from the debugger)."""
+        self.l_breakpoints = l_breakpoints
+        self._rebuild_locations()
+        self.b_stale = False
+
+    def get_breakpoints(self):
+        """Return the list of Breakpoints."""
+        return self.l_breakpoints
+
+    def remove(self, n_number):
+        """Remove the breakpoint with the given number, if any."""
+        self.l_breakpoints = [bp for bp in self.l_breakpoints
+                              if bp.n_number != n_number]
+        self._rebuild_locations()
+
+    def set_enabled(self, n_number, b_enabled):
+        """Set the enable flag of the breakpoint with the given number."""
+        s_enable = "y" if b_enabled else "n"
+        self.l_breakpoints = [bp.with_enable(s_enable)
+                              if bp.n_number == n_number else bp
+                              for bp in self.l_breakpoints]
+        self._rebuild_locations()
+
+    def at_location(self, s_file, n_line):
+        """Return the list of Breakpoints set at the given file and line."""
+        return self.d_locations.get((s_file, n_line), [])
+
+    def _rebuild_locations(self):
+        """Rebuild the (file, line) index from the list of breakpoints."""
+        self.d_locations = {}
+        for bp in self.l_breakpoints:
+            self.d_locations.setdefault((bp.s_file, bp.n_line), []).append(bp)
+
+class Backtrace(object):
     """Represents a stack trace (backtrace)."""
+    __slots__ = ["l_frames", "_n_hash"]
+
     def __init__(self):
         # List of BacktraceFrame objects:
         self.l_frames = []
+        self._n_hash = None
+
+    def __hash__(self):
+        if self._n_hash == None:
+            self._n_hash = hash(tuple(self.l_frames))
+        return self._n_hash
 
     def __eq__(self, other):
-        return other != None and self.l_frames == other.l_frames
+        if self is other:
+            return True
+        return isinstance(other, Backtrace) and \
+               hash(self) == hash(other) and self.l_frames == other.l_frames
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
 
     def __repr__(self):
         return str(self.l_frames)
 
-    def _copy_frames(self, l_frames):
-        """Return deep copy of this instance's l_frames."""
-        l_result = []
-        for frame in l_frames:
-            l_result.append(frame.copy())
-        return l_result
-
     def copy(self):
-        """Return a deep copy of this instance."""
+        """Return a copy of this instance.  The (unmodifiable) frames are
+        shared with the copy."""
         new_bt = Backtrace()
-        new_bt.l_frames = self._copy_frames(self.l_frames)
+        new_bt.l_frames = list(self.l_frames)
+        new_bt._n_hash = self._n_hash
         return new_bt
 
+    def share_frames(self, other):
+        """Replace frames of this instance by the equal frames of Backtrace
+        other, comparing from the outermost frame in.  Stops at the first
+        difference."""
+        if other == None:
+            return
+        for i in range(1, min(len(self.l_frames), len(other.l_frames)) + 1):
+            if self.l_frames[-i] is other.l_frames[-i]:
+                continue
+            if self.l_frames[-i] != other.l_frames[-i]:
+                break
+            self.l_frames[-i] = other.l_frames[-i]
+
     def add_frame(self, frame):
         """Add the given frame to this instance."""
         self.l_frames.append(frame)
+        self._n_hash = None
 
     def get_frames(self):
         """Return the list of frames."""
@@ -328,9 +594,15 @@ class Backtrace():
         """Return the depth of this instance."""
         return len(self.l_frames)
 
-class BacktraceFrame():
+class BacktraceFrame(object):
     """Represents one frame in the stack trace (backtrace).
-    It's not necessary to use all of these fields."""
+    It's not necessary to use all of these fields.
+    The fields are filled in by the personality when parsing, and must not be
+    modified after that: frames are shared between Backtraces, and cache
+    their hash."""
+    __slots__ = ["n_frame_num", "s_addr", "s_function", "s_args", "s_file",
+                 "n_line", "_n_hash"]
+
     def __init__(self):
         self.n_frame_num = 0
         self.s_addr      = ""
@@ -338,23 +610,32 @@ class BacktraceFrame():
         self.s_args      = ""
         self.s_file      = ""
         self.n_line      = 0
+        self._n_hash     = None
+
+    def _key(self):
+        return (self.n_frame_num, self.s_addr, self.s_function,
+                self.s_args, self.s_file, self.n_line)
+
+    def __hash__(self):
+        if self._n_hash == None:
+            self._n_hash = hash(self._key())
+        return self._n_hash
 
     def __eq__(self, other):
-        return other != None and \
-               self.n_frame_num == other.n_frame_num and \
-               self.s_addr == other.s_addr and \
-               self.s_function == other.s_function and \
-               self.s_args == other.s_args and \
-               self.s_file == other.s_file and \
-               self.n_line == other.n_line
+        if self is other:
+            return True
+        return isinstance(other, BacktraceFrame) and \
+               hash(self) == hash(other) and self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
 
     def __repr__(self):
-        return "frame: " + str((self.n_frame_num, self.s_addr, self.s_function,
-                                self.s_args, self.s_file, self.n_line))
+        return "frame: " + str(self._key())
 
     def addr(self):
         """Return frame address."""
-        return self.s_line
+        return self.s_addr
 
     def function(self):
         """Return function name."""
@@ -375,10 +656,7 @@ class BacktraceFrame():
     def copy(self):
         """Return deep copy of this instance."""
         new_frame = BacktraceFrame()
-        new_frame.n_frame_num = self.n_frame_num
-        new_frame.s_addr      = self.s_addr
-        new_frame.s_function  = self.s_function
-        new_frame.s_args      = self.s_args
-        new_frame.s_file      = self.s_file
-        new_frame.n_line      = self.n_line
+        (new_frame.n_frame_num, new_frame.s_addr, new_frame.s_function,
+         new_frame.s_args, new_frame.s_file, new_frame.n_line) = self._key()
+        new_frame._n_hash = self._n_hash
         return new_frame
@@ -235,9 +235,14 @@ def restart(n_index):
         time.sleep(0.01)
 
     remove_stale_ptrace_files()
-
-    l_ckpt_files = [os.path.join(os.environ["DMTCP_TMPDIR"], x) \
-                    for x in os.listdir(os.environ["DMTCP_TMPDIR"]) \
+    restart_files(get_checkpoint_files(n_index))
+
+def get_checkpoint_files(n_index, s_dir=None):
+    """Return the paths of the checkpoint images of the given index in
+    s_dir (default: DMTCP_TMPDIR)."""
+    if s_dir == None:
+        s_dir = os.environ["DMTCP_TMPDIR"]
+    l_ckpt_files = [os.path.join(s_dir, x) for x in os.listdir(s_dir) \
                     if x.endswith(".dmtcp.%d" % n_index)]
     if (len(l_ckpt_files) > 2):
         # XXX: I think this is a Python bug.... sometimes even when there are
@@ -250,7 +255,11 @@ def restart(n_index):
         #'/tmp/fred.tyler/dmtcp_tmpdir/ckpt_gdb_X-3081-4db5c59c.dmtcp']
         # I have replaced the hostname with X for readability.
         l_ckpt_files = list(set(l_ckpt_files))
+    return l_ckpt_files
 
+def restart_files(l_ckpt_files):
+    """Restart the given checkpoint images under the coordinator of
+    DMTCP_PORT, and wait until all peers are running."""
     # Due to what is arguably a bug in DMTCP, checkpoint files must
     # end in "*.dmtcp" in order for DMTCP to restart from them. So we
     # symlink to conform to that pattern before restarting.
@@ -274,6 +283,11 @@ def get_dmtcp_tmpdir_path(s_name):
     """Return the full path for DMTCP_TMPDIR with suffix s_name."""
     return "%s-%s" % (os.environ["DMTCP_TMPDIR"], s_name)
 
+def get_branch_file_path(s_file_name):
+    """Return the full path of the given file in the current branch's
+    tmpdir (DMTCP_TMPDIR links to it)."""
+    return os.path.join(os.environ["DMTCP_TMPDIR"], s_file_name)
+
 def relocate_dmtcp_tmpdir(s_name):
     """Copy the current DMTCP_TMPDIR to a new location with suffix s_name."""
     if not os.path.islink(os.environ["DMTCP_TMPDIR"]):
@@ -323,6 +337,25 @@ def remove_checkpoint_files_of_index(n_index):
         if os.path.lexists(y):
             os.remove(y)
 
+def renumber_checkpoint_files(n_old_index, n_new_index):
+    """Rename the checkpoint images of index n_old_index in the current
+    DMTCP_TMPDIR to index n_new_index."""
+    s_checkpoint_re = "^(ckpt_.+\.dmtcp)\.%d$" % n_old_index
+    for x in os.listdir(os.environ["DMTCP_TMPDIR"]):
+        m = re.search(s_checkpoint_re, x)
+        if m == None:
+            continue
+        s_old_name = os.path.join(os.environ["DMTCP_TMPDIR"], x)
+        s_new_name = os.path.join(os.environ["DMTCP_TMPDIR"],
+                                  "%s.%d" % (m.group(1), n_new_index))
+        fredutil.fred_debug("Renaming ckpt %s to %s." %
+                            (s_old_name, s_new_name))
+        os.rename(s_old_name, s_new_name)
+        # A symbolic link to the old name (see restart_files()) now dangles.
+        s_link = os.path.join(os.environ["DMTCP_TMPDIR"], m.group(1))
+        if os.path.lexists(s_link) and not os.path.exists(s_link):
+            os.remove(s_link)
+
 def remove_checkpoints_except_index(n_index):
     """Remove all checkpoint images in the current DMTCP_TMPDIR except
     the specified index."""
@@ -23,6 +23,7 @@ import math
 import time
 import pdb
 import re
+from collections import OrderedDict
 
 # Note we don't import fredio here. We should not load fredio unless absolutely
 # necessary. This helps preserve modularity. Typically anything you want to do
@@ -31,6 +32,8 @@ import re
 import dmtcpmanager
 import fredmanager
 import fredutil
+import fredhistory
+import fredjournal
 import debugger
 
 # Use "--enable-debug" CLI flag to see debugging messages.
@@ -50,11 +53,13 @@ import debugger
 #      ReversibleDebugger: checkpoint (current ckpt), l_checkpoints (all ckpts)
 #    DebuggerState:  backtrace, l_breakpoints
 #    Breakpoint:  n_number, s_type, s_display, s_enable, s_address,
-#		  s_function, s_file, n_line, n_count
+#		  s_function, s_file, n_line, n_count, n_ignore_count
 #    Backtrace:  l_frames
 #    BacktraceFrame:  n_frame_num, s_addr, s_function, s_args, s_file, n_line
 #    FredCommand:  s_name, s_args, s_native, b_ignore, b_count_cmd,
+#                  b_wait_for_prompt, n_stop_breakpoint, n_replay_count
 #    Checkpoint:  n_index (index into l_checkpoints), l_history (since ckpt)
+#    History:  runs of FredCommands, indexed by logical command (fredhistory.py)
 
 # NOTE: This code does not yet handle search inside gdb's 'finish'
 #   and 'until' commands.  These commands can be replayed, but not expanded
@@ -71,6 +76,28 @@ import debugger
 # ------------------------------------------------------- Global variables
 GS_FRED_MASTER_BRANCH_NAME = "MASTER"
 GS_NO_SYMBOL_ERROR = "FRED-NO-SYMBOL"
+# Maximum number of (position, expression) values kept in the cache:
+GN_EXPRESSION_CACHE_SIZE = 4096
+# Pseudo-expression under which program_is_running() results are cached:
+GS_PROGRAM_IS_RUNNING_EXPR = "$fred-program-is-running"
+# Pseudo-expression under which state_snapshot() results are cached:
+GS_STATE_SNAPSHOT_EXPR = "$fred-state-snapshot"
+# Record the state snapshots fetched at known positions in the position
+# trace of each checkpoint (see Checkpoint.d_trace):
+gb_position_trace = True
+# Fields of a state snapshot kept in the position trace.  Not whether it is
+# at a breakpoint:  that is checked against the present breakpoint table
+# (see traced_at_breakpoint()).
+GL_TRACE_FIELDS = ["running", "depth", "pc", "frame"]
+# Deadline of a replayed command is this factor times its recorded time:
+GN_DEADLINE_SAFETY_FACTOR = 4.0
+# Lower bound on any command deadline, in seconds:
+GN_MIN_COMMAND_DEADLINE = 2.0
+# Deadline for commands never executed before (fredio.GN_PROMPT_WAIT_TIMEOUT):
+GN_DEFAULT_COMMAND_DEADLINE = 20.0
+# Number of times a timed-out replay command is retried, each time with
+# twice the deadline:
+GN_REPLAY_MAX_RETRIES = 5
 
 # Some statistics for reverse-watch:
 gn_time_checkpointing = 0.0
@@ -78,7 +105,17 @@ gn_time_restarting = 0.0
 gn_time_evaluating = 0.0
 gn_total_checkpoints = 0
 gn_total_restarts = 0
+# Restart times by checkpoint:  (branch, index) => [seconds, restarts]
+gd_restart_times = {}
+# Probes of the binary searches reached without a restart, by going forward:
+gn_total_restarts_avoided = 0
+# Round-robin thread searches of reverse-watch, and threads tried by them:
+gn_total_thread_searches = 0
+gn_total_threads_tried = 0
 gn_total_evaluations = 0
+gn_total_cache_hits = 0
+gn_total_replay_timeouts = 0
+gn_total_replay_retries = 0
 
 # ------------------------------------------------------- End global variables
 
@@ -98,6 +135,18 @@ class ReversibleDebugger(debugger.Debugger):
         self.branch = Branch(GS_FRED_MASTER_BRANCH_NAME) # The current branch
         self.l_branches = []  # List of all branches
         self.l_branches.append(self.branch)
+        # Client-side record of the debugger's breakpoints:
+        self.breakpoint_table = debugger.BreakpointTable()
+        # Expression values by timeline position (see position_key()):
+        self.expression_cache = ExpressionCache(GN_EXPRESSION_CACHE_SIZE)
+        # Recorded execution times of commands by position:
+        self.command_times = CommandTimes()
+        # On-disk journal of the checkpoint histories of the current branch:
+        self.journal = fredjournal.HistoryJournal()
+        # Branch name and checkpoint index of the last restart or checkpoint,
+        # and History of commands executed since then (None if unknown):
+        self.t_position_base = None
+        self.h_position = None
 
     def destroy(self):
         """Perform any cleanup associated with a ReversibleDebugger inst."""
@@ -105,24 +154,340 @@ class ReversibleDebugger(debugger.Debugger):
         self.l_branches = []
         self.branch = Branch(GS_FRED_MASTER_BRANCH_NAME)
         self.l_branches.append(self.branch)
+        self.breakpoint_table = debugger.BreakpointTable()
+        self.expression_cache.clear()
+        self.command_times.clear()
+        self.journal.close()
+        self._forget_position()
         self._p.destroy()
 
+    def position_key(self):
+        """Return a key identifying the current position in the timeline:
+        (branch, checkpoint index, number of commands, fingerprint of the
+        commands) since the last restart or checkpoint.  Replay is
+        deterministic, so the program state at a key never changes.
+        Return None if the position is not known (e.g. after the inferior
+        was interrupted)."""
+        if self.h_position == None:
+            return None
+        return self.t_position_base + (len(self.h_position),
+                                       self.h_position.fingerprint())
+
+    def replay_position_key(self, l_history, n_index=-1):
+        """Return the position key reached by restarting from checkpoint
+        n_index (default: current) of the current branch and replaying the
+        given History."""
+        if n_index == -1:
+            n_index = self.current_checkpoint().get_index()
+        return (self.branch.get_name(), n_index, len(l_history),
+                l_history.fingerprint())
+
+    def _reset_position(self):
+        """The debugger is now at the start of the current checkpoint."""
+        self.t_position_base = (self.branch.get_name(),
+                                self.current_checkpoint().get_index())
+        self.h_position = fredhistory.History()
+
+    def _forget_position(self):
+        """The position of the debugger can no longer be determined."""
+        self.t_position_base = None
+        self.h_position = None
+
+    def _advance_position(self, cmd):
+        """Record that the given FredCommand was executed."""
+        if self.h_position != None:
+            self.h_position.append(cmd)
+
+    def _position_mark(self):
+        """Return an opaque mark of the current position, for
+        _record_command_time()."""
+        if self.h_position == None:
+            return (None, None)
+        return (self.t_position_base, self.h_position.copy())
+
+    def _record_command_time(self, mark, cmd, f_start):
+        """Record that cmd, executed from the position of the given mark,
+        started at time f_start and has just completed."""
+        (t_base, h_position) = mark
+        self.command_times.record(t_base, h_position, cmd,
+                                  time.time() - f_start)
+
+    def command_deadline(self, cmd):
+        """Return the number of seconds to wait for the given FredCommand to
+        complete from the current position:  GN_DEADLINE_SAFETY_FACTOR times
+        its recorded execution time, plus GN_DEFAULT_COMMAND_DEADLINE if
+        (part of) it was never executed from here before."""
+        (f_seconds, b_unknown) = \
+            self.command_times.expected(self.t_position_base,
+                                        self.h_position, cmd)
+        f_deadline = GN_DEADLINE_SAFETY_FACTOR * f_seconds
+        if b_unknown:
+            f_deadline += GN_DEFAULT_COMMAND_DEADLINE
+        return max(GN_MIN_COMMAND_DEADLINE, f_deadline)
+
+    def program_is_running(self):
+        """Return True if inferior is still running.  Cached by position."""
+        key = self.position_key()
+        if key == None:
+            return debugger.Debugger.program_is_running(self)
+        b_running = self.cached_expression_value(key,
+                                                 GS_PROGRAM_IS_RUNNING_EXPR)
+        if b_running == None:
+            b_running = debugger.Debugger.program_is_running(self)
+            self.expression_cache.put(key, GS_PROGRAM_IS_RUNNING_EXPR,
+                                      b_running)
+        return b_running
+
+    def state_snapshot(self):
+        """Return the state snapshot of the current position (see
+        Debugger.state_snapshot()).  Cached by position."""
+        key = self.position_key()
+        if key == None:
+            return debugger.Debugger.state_snapshot(self)
+        d_state = self.cached_expression_value(key, GS_STATE_SNAPSHOT_EXPR)
+        if d_state == None:
+            d_state = debugger.Debugger.state_snapshot(self)
+            if d_state != None:
+                self.expression_cache.put(key, GS_STATE_SNAPSHOT_EXPR,
+                                          d_state)
+        if d_state != None:
+            self._trace_position(d_state)
+        return d_state
+
+    def _file_state_snapshot(self, d_state):
+        """Cache the given state snapshot, fetched before the current
+        position was known, as that of the current position."""
+        key = self.position_key()
+        if d_state == None or key == None:
+            return
+        self.expression_cache.put(key, GS_STATE_SNAPSHOT_EXPR, d_state)
+        self._trace_position(d_state)
+
+    def _trace_position(self, d_state):
+        """Record the state snapshot of the current position in the
+        position trace of the current checkpoint."""
+        global gb_position_trace
+        if not gb_position_trace:
+            return
+        ckpt = self.current_checkpoint()
+        if ckpt == None or self.h_position == None or \
+               self.t_position_base != (self.branch.get_name(),
+                                        ckpt.get_index()):
+            return
+        ckpt.trace_position(self.h_position, d_state)
+
+    def traced_state(self, l_history):
+        """Return the position trace entry (a dict of GL_TRACE_FIELDS) of
+        the position reached by restarting from the current checkpoint and
+        replaying the given History, or None if it was never recorded.
+        No command is sent to the debugger."""
+        return self.current_checkpoint().traced_position(l_history)
+
+    def traced_level(self, l_history):
+        """Like traced_state(), but return only the stack depth, or -1 if
+        the inferior was not running there."""
+        d_trace = self.traced_state(l_history)
+        if d_trace == None:
+            return None
+        if not d_trace["running"]:
+            return -1
+        return d_trace["depth"]
+
+    def traced_at_breakpoint(self, l_history):
+        """Like traced_state(), but return whether the position is at one of
+        the current breakpoints, as at_breakpoint() would there."""
+        d_trace = self.traced_state(l_history)
+        if d_trace == None:
+            return None
+        bt_frame = debugger.frame_from_snapshot(d_trace["frame"])
+        if bt_frame == None:
+            return False
+        self.get_breakpoints()
+        return self._frame_at_breakpoint(bt_frame)
+
+    def cached_expression_value(self, key, s_expr):
+        """Return the cached value of s_expr at the position with the given
+        key, or None if it is not cached."""
+        global gn_total_cache_hits
+        value = self.expression_cache.get(key, s_expr)
+        if value != None:
+            gn_total_cache_hits += 1
+        return value
+
+    def cache_expression_value(self, key, s_expr, s_val):
+        """Record that s_expr has the (sanitized) value s_val at the position
+        with the given key, for values obtained elsewhere (e.g. by a search
+        worker).  Expressions with side effects are not cached."""
+        if key != None and _is_side_effect_free(s_expr):
+            self.expression_cache.put(key, s_expr, s_val)
+
+    def cached_test_expression(self, key, s_expr, s_expr_val):
+        """Like test_expression(), but at the position with the given key
+        and only from the cache.  Return None if s_expr is not cached."""
+        s_val = self.cached_expression_value(key, s_expr)
+        if s_val == None:
+            return None
+        return self.expression_values_match(s_val, s_expr_val)
+
+    def stop_inferior(self):
+        """Sends SIGSTOP to inferior process."""
+        self._forget_position()
+        debugger.Debugger.stop_inferior(self)
+
+    def interrupt_inferior(self):
+        """Sends a ^C to the inferior process."""
+        self._forget_position()
+        debugger.Debugger.interrupt_inferior(self)
+
+    def set_scheduler_locking(self, n_on):
+        # Changes how later commands execute, so positions are not comparable.
+        self._forget_position()
+        debugger.Debugger.set_scheduler_locking(self, n_on)
+
+    def update_state(self):
+        """Update the underlying DebuggerState.
+        Breakpoints are taken from the client-side breakpoint table, which
+        is only re-read from the debugger when it is stale."""
+        fredutil.fred_debug("Updating DebuggerState.")
+        if self._p.b_stack_depth_support:
+            d_state = self.state_snapshot()
+            if d_state != None:
+                frame = debugger.frame_from_snapshot(d_state["frame"])
+                self.state().set_lazy_backtrace(self._p.get_backtrace,
+                                                d_state["depth"],
+                                                lambda: frame)
+            else:
+                self.state().set_lazy_backtrace(self._p.get_backtrace,
+                                                self._p.stack_depth(),
+                                                self.current_position)
+        else:
+            # The depth is read from the backtrace anyway.
+            self.state().set_backtrace(self._p.get_backtrace())
+        self.state().set_breakpoints(self.get_breakpoints())
+
+    def get_breakpoints(self):
+        """Return the list of current Breakpoints, re-reading them from the
+        debugger only if the breakpoint table is stale."""
+        if self.breakpoint_table.is_stale():
+            fredutil.fred_debug("Re-reading stale breakpoint table.")
+            self.breakpoint_table.set_breakpoints(self._p.get_breakpoints())
+        return self.breakpoint_table.get_breakpoints()
+
+    def refresh_breakpoints(self):
+        """Force the breakpoint table to be re-read from the debugger (for
+        example, to get up-to-date hit counts). Returns the Breakpoints."""
+        self.breakpoint_table.mark_stale()
+        return self.get_breakpoints()
+
+    def at_breakpoint(self):
+        """Return True if debugger is currently on a breakpoint.
+        This is a lookup of the current (file, line) in the breakpoint table."""
+        self.update_state()
+        d_state = self.state_snapshot()
+        if d_state != None:
+            bt_frame = debugger.frame_from_snapshot(d_state["frame"])
+            if bt_frame == None:
+                return False
+        else:
+            l_frames = self.state().get_backtrace().get_frames()
+            if len(l_frames) == 0:
+                return False
+            bt_frame = l_frames[self._p.n_top_backtrace_frame]
+        return self._frame_at_breakpoint(bt_frame)
+
+    def _frame_at_breakpoint(self, bt_frame):
+        """Return True if the given BacktraceFrame is on a breakpoint of the
+        breakpoint table."""
+        return self._p.at_breakpoint(
+            bt_frame, self.breakpoint_table.at_location(bt_frame.s_file,
+                                                        bt_frame.n_line))
+
+    def _set_stop_breakpoint(self, cmd, s_output):
+        """Record in the given 'continue' FredCommand, which just completed
+        with the given output, the number of the breakpoint it stopped at,
+        if the personality can replay runs of such continues as one (see
+        History.coalesced()).  Nothing is recorded unless the output says
+        the breakpoint stopped it, and a run can be replayed that way:  the
+        breakpoint is the only enabled one at its location, and has no
+        ignore count, which 'continue N' would overwrite."""
+        if not self._p.b_coalesce_continue_support or cmd.s_args != "" or \
+           s_output == None:
+            return
+        n_number = self._p.stop_breakpoint(s_output)
+        if n_number == -1:
+            return
+        l_bps = [bp for bp in self.get_breakpoints() if bp.n_number == n_number]
+        if len(l_bps) != 1 or l_bps[0].n_ignore_count != 0:
+            return
+        l_here = [bp for bp in self.breakpoint_table.at_location(
+                      l_bps[0].s_file, l_bps[0].n_line)
+                  if bp.s_enable == "y"]
+        if len(l_here) == 1:
+            cmd.set_stop_breakpoint(n_number)
+
+    def _stop_state_snapshot(self):
+        """Return the state snapshot where a 'continue' which just completed
+        stopped.  It is not filed under any position yet, since the position
+        after the continue is keyed by the breakpoint it records.  Return
+        None, with the DebuggerState updated instead, if the personality
+        does not support state snapshots."""
+        d_state = debugger.Debugger.state_snapshot(self)
+        if d_state == None:
+            self.update_state()
+        return d_state
+
+    def _observe_breakpoint_command(self, cmd):
+        """Keep the breakpoint table in step with the given FredCommand, which
+        is about to be (or has just been) sent to the debugger."""
+        if cmd.is_delete() or cmd.is_disable() or cmd.is_enable():
+            l_numbers = _parse_breakpoint_numbers(cmd.s_args)
+            if l_numbers == None or len(l_numbers) == 0:
+                # 'delete' with no arguments asks for confirmation, and
+                # anything else is not worth emulating here.
+                self.breakpoint_table.mark_stale()
+                return
+            for n in l_numbers:
+                if cmd.is_delete():
+                    self.breakpoint_table.remove(n)
+                else:
+                    self.breakpoint_table.set_enabled(n, cmd.is_enable())
+        elif cmd.is_breakpoint():
+            # Only the debugger knows the number and location it assigns.
+            self.breakpoint_table.mark_stale()
+        elif cmd.is_unknown() and \
+                not self._p.is_inspection_command(cmd.native_repr()):
+            self.breakpoint_table.mark_stale()
+
     def create_master_branch(self):
         """Create the master branch (on startup)."""
         global GS_FRED_MASTER_BRANCH_NAME
         dmtcpmanager.create_master_branch(GS_FRED_MASTER_BRANCH_NAME)
+        self.journal.open(self._journal_path(),
+                          {"name" : GS_FRED_MASTER_BRANCH_NAME,
+                           "parent" : None})
 
     def do_branch(self, s_name):
         """Create and switch to a new branch named s_name."""
         if dmtcpmanager.branch_exists(s_name):
             fredutil.fred_error("Branch '%s' already exists." % s_name)
             return
+        self.expression_cache.invalidate_branch(s_name)
+        self.command_times.invalidate_branch(s_name)
+        self.sync_journal()
+        s_parent = self.branch.get_name()
         self.branch = Branch(s_name)
         self.l_branches.append(self.branch)
         dmtcpmanager.create_branch(s_name)
         # Creating branches always creates ckpt 0:
         self.branch.add_checkpoint(Checkpoint(0))
         self.branch.set_current_checkpoint(self.branch.get_checkpoint(0))
+        # The new tmpdir is a copy of the parent's: start a new journal.
+        self.journal.open(self._journal_path(),
+                          {"name" : s_name, "parent" : s_parent})
+        self.journal.add_checkpoint(0)
+        self.journal.fsync()
+        self._reset_position()
+        self.breakpoint_table.mark_stale()
         self.update_state()
         fredutil.fred_info("Now in new branch '%s'." % s_name)
 
@@ -131,12 +496,18 @@ class ReversibleDebugger(debugger.Debugger):
         if not dmtcpmanager.branch_exists(s_name):
             fredutil.fred_error("Branch '%s' does not exist." % s_name)
             return
+        self.sync_journal()
         for b in self.l_branches:
             if b.get_name() == s_name:
                 self.branch = b
         dmtcpmanager.switch_branch(s_name)
         # Switching to branches always restarts in ckpt 0:
         self.branch.set_current_checkpoint(self.branch.get_checkpoint(0))
+        self.journal.open(self._journal_path())
+        for ckpt in self.branch.get_all_checkpoints():
+            self.journal.mark_synced(ckpt.get_index(), ckpt.get_history())
+        self._reset_position()
+        self.breakpoint_table.mark_stale()
         self.update_state()
         fredutil.fred_info("Switched to branch '%s'." % s_name)
 
@@ -145,9 +516,32 @@ class ReversibleDebugger(debugger.Debugger):
         global GS_FRED_MASTER_BRANCH_NAME
         #fredutil.fred_assert(False, "Resume not yet implemented with branches.")
         self.branch = Branch(GS_FRED_MASTER_BRANCH_NAME)
+        # Get the checkpoint histories back from the journal, if any.
+        t_journal = fredjournal.load(self._journal_path(),
+                                     fred_command_from_list)
+        d_histories = {}
+        n_current = -1
+        if t_journal != None:
+            (d_header, d_histories, n_current) = t_journal
         for i in range(0, dmtcpmanager.get_num_checkpoints()):
-            self.branch.add_checkpoint(Checkpoint(i))
-        self.branch.set_current_checkpoint(self.branch.get_last_checkpoint())
+            ckpt = Checkpoint(i)
+            if i in d_histories:
+                ckpt.set_history(d_histories[i])
+            self.branch.add_checkpoint(ckpt)
+        if n_current < 0 or n_current >= self.branch.get_num_checkpoints():
+            n_current = -1
+        self.branch.set_current_checkpoint(self.branch.get_checkpoint(n_current))
+        fredutil.fred_info("Resumed %d checkpoints, with %d journaled "
+                           "commands." %
+                           (self.branch.get_num_checkpoints(),
+                            sum([len(h) for h in d_histories.values()])))
+        self.journal.open(self._journal_path())
+        for ckpt in self.branch.get_all_checkpoints():
+            self.journal.mark_synced(ckpt.get_index(), ckpt.get_history())
+        self.expression_cache.clear()
+        self.command_times.clear()
+        self._forget_position()
+        self.breakpoint_table.mark_stale()
         self.update_state()
 
     def do_checkpoint(self):
@@ -157,13 +551,72 @@ class ReversibleDebugger(debugger.Debugger):
         n_index = self.branch.do_checkpoint()
         gn_time_checkpointing += fredutil.fred_timer_stop("checkpoint")
         gn_total_checkpoints += 1
+        self.journal.add_checkpoint(n_index)
+        self.sync_journal(b_fsync=True)
+        if self.h_position != None:
+            self._reset_position()
         return n_index
 
     def remove_checkpoint(self, n_index):
-        """Remove the checkpoint with the specified index."""
+        """Remove the checkpoint with the specified index.  Later checkpoints
+        are renumbered (see Branch.remove_checkpoint())."""
         global gn_total_checkpoints
         if self.branch.remove_checkpoint(n_index):
             gn_total_checkpoints -= 1
+            self.journal.remove_checkpoint(n_index)
+            self._checkpoint_removed(n_index)
+
+    def do_temporary_checkpoint(self):
+        """Perform a new checkpoint for the internal use of an algorithm,
+        which removes it with remove_temporary_checkpoint() when done.
+        Unlike do_checkpoint(), it is not announced, not written to the
+        history journal, and not counted in the checkpoint statistics.
+        Returns the index of the new ckpt."""
+        n_index = self.branch.do_checkpoint(b_quiet=True)
+        if self.h_position != None:
+            self._reset_position()
+        return n_index
+
+    def remove_temporary_checkpoint(self, n_index):
+        """Remove a checkpoint taken by do_temporary_checkpoint()."""
+        if self.branch.remove_checkpoint(n_index):
+            self._checkpoint_removed(n_index)
+
+    def _checkpoint_removed(self, n_index):
+        """Checkpoint n_index was removed:  later indexes now name other
+        checkpoints."""
+        self.expression_cache.invalidate_checkpoints(self.branch.get_name(),
+                                                     n_index)
+        self.command_times.invalidate_checkpoints(self.branch.get_name(),
+                                                  n_index)
+        if self.t_position_base != None and \
+                self.t_position_base[1] >= n_index:
+            self._forget_position()
+
+    def assume_position(self, l_history):
+        """Record that the debugger is where restarting the current
+        checkpoint and replaying the given History would bring it, although
+        it got there another way (from a temporary checkpoint, say)."""
+        self._reset_position()
+        self.h_position = l_history.copy()
+
+    def _journal_path(self):
+        """Return the path of the history journal of the current branch."""
+        return dmtcpmanager.get_branch_file_path(
+            fredjournal.GS_JOURNAL_FILE_NAME)
+
+    def sync_journal(self, b_fsync=False):
+        """Write any changes to the checkpoint histories of the current
+        branch to the history journal.  Cheap when nothing changed, so it
+        is called after every user command."""
+        if not self.journal.is_open():
+            return
+        for ckpt in self.branch.get_all_checkpoints():
+            self.journal.sync(ckpt.get_index(), ckpt.get_history())
+        if self.current_checkpoint() != None:
+            self.journal.set_current(self.current_checkpoint().get_index())
+        if b_fsync:
+            self.journal.fsync()
 
     def reset_on_restart(self):
         """Perform any reset functions that should happen on restart."""
@@ -173,15 +626,28 @@ class ReversibleDebugger(debugger.Debugger):
     def do_restart(self, n_index=-1, b_clear_history=False):
         """Restart from the current or specified checkpoint.
         n_index defaults to -1, which means restart from current checkpoint."""
-        global gn_time_restarting, gn_total_restarts
+        global gn_time_restarting, gn_total_restarts, gd_restart_times
         fredutil.fred_timer_start("restart")
-        self.branch.do_restart(n_index, b_clear_history, self.reset_on_restart)
-        gn_time_restarting += fredutil.fred_timer_stop("restart")
+        if self.branch.do_restart(n_index, b_clear_history,
+                                  self.reset_on_restart):
+            self._reset_position()
+        else:
+            self._forget_position()
+        f_seconds = fredutil.fred_timer_stop("restart")
+        gn_time_restarting += f_seconds
         gn_total_restarts += 1
+        if self.current_checkpoint() != None:
+            l_times = gd_restart_times.setdefault(
+                (self.branch.get_name(),
+                 self.current_checkpoint().get_index()), [0.0, 0])
+            l_times[0] += f_seconds
+            l_times[1] += 1
         # XXX Figure out a way to do this without fredio.
         import fredio
         self.set_real_debugger_pid(fredio.get_child_pid())
         del fredio
+        # The restarted debugger has the breakpoints of the checkpoint.
+        self.breakpoint_table.mark_stale()
         self.update_state()
         if self.personality_name() == "gdb":
             # Reset real inferior pid, as it gets a new real pid on restart.
@@ -204,10 +670,10 @@ class ReversibleDebugger(debugger.Debugger):
         """Return the history of all Checkpoints."""
         return self.branch.all_history()
 
-    def log_command(self, s_command):
+    def log_command(self, s_command, f_seconds=None, s_output=None):
         """Convert given command to FredCommand instance and add to current
-        history."""
-
+        history.  f_seconds, if given, is how long the command took, and
+        s_output (the end of) its output."""
         if self.personality_name() == "gdb":
             # XXX: Figure out a more elegant way to do this. We can't set the
             # inferior pids until we know the inferior is alive, so we keep trying
@@ -221,21 +687,38 @@ class ReversibleDebugger(debugger.Debugger):
                 else:
                     fredutil.fred_debug("Can't set virtual pid; no getpid() " +
                                         "symbol available.")
+        # identify_command() sets native representation
+        cmd = self._p.identify_command(s_command)
+        self._observe_breakpoint_command(cmd)
+        d_state = None
+        if cmd.is_continue():
+            d_state = self._stop_state_snapshot()
+            self._set_stop_breakpoint(cmd, s_output)
+        if f_seconds != None:
+            self.command_times.record(self.t_position_base, self.h_position,
+                                      cmd, f_seconds)
+        self._advance_position(cmd)
         if self.current_checkpoint() != None:
-            # identify_command() sets native representation
-            cmd = self._p.identify_command(s_command)
             self.current_checkpoint().log_command(cmd)
+        # No other command is sent just to fill the position trace.
+        self._file_state_snapshot(d_state)
 
     def log_fred_command(self, cmd):
         """Directly log the given FredCommand instance."""
+        self._advance_position(cmd)
         if self.current_checkpoint() != None:
             self.current_checkpoint().log_command(cmd)
 
-    def execute_fred_command(self, cmd, b_update=True):
-        """Execute the given FredCommand."""
+    def execute_fred_command(self, cmd, b_update=True, n_timeout=None):
+        """Execute the given FredCommand.  If n_timeout is given, raise
+        fredutil.PromptTimeoutException if the debugger prompt does not
+        return within n_timeout seconds."""
         if cmd.b_ignore:
             fredutil.fred_debug("Skipping ignore command '%s'" % \
                                 (cmd.s_native + " " + cmd.s_args))
+            # Still part of the History the position is keyed by (see
+            # replay_position_key()).
+            self._advance_position(cmd)
             return
         # Special handling for "log-breakpoint X" and "log-continue" cmds.
         if cmd.is_log_breakpoint():
@@ -244,8 +727,17 @@ class ReversibleDebugger(debugger.Debugger):
             self.do_log_continue()
         else:
             fredutil.fred_assert(cmd.s_native != "")
+            self._observe_breakpoint_command(cmd)
+            mark = self._position_mark()
+            f_start = time.time()
             self._p.execute_command(cmd.s_native + " " + cmd.s_args + "\n",
-                                    b_prompt=cmd.b_wait_for_prompt)
+                                    b_prompt=cmd.b_wait_for_prompt,
+                                    b_timeout=n_timeout != None and
+                                              cmd.b_wait_for_prompt,
+                                    n_timeout=n_timeout)
+            if cmd.b_wait_for_prompt:
+                self._record_command_time(mark, cmd, f_start)
+            self._advance_position(cmd)
         if b_update:
             self.update_state()
 
@@ -255,8 +747,11 @@ class ReversibleDebugger(debugger.Debugger):
         cmd.set_native(self._p.get_native(cmd))
         cmd.set_count_cmd(self._p.b_has_count_commands)
         cmd.set_count(n)
+        mark = self._position_mark()
         self.log_fred_command(cmd)
+        f_start = time.time()
         output = self._next(n)
+        self._record_command_time(mark, cmd, f_start)
         self.update_state()
         return output
 
@@ -272,11 +767,16 @@ class ReversibleDebugger(debugger.Debugger):
             cmd.set_native(self._p.get_native(cmd))
             cmd.set_count_cmd(self._p.b_has_count_commands)
             cmd.set_count(n)
+            n_timeout = self.command_deadline(cmd)
+            mark = self._position_mark()
             self.log_fred_command(cmd)
-            output = self._next(n, b_timeout=True)
+            f_start = time.time()
+            output = self._next(n, b_timeout=True, n_timeout=n_timeout)
+            self._record_command_time(mark, cmd, f_start)
             self.update_state()
         except fredutil.PromptTimeoutException:
             fredutil.fred_debug("'next' command timed out (probably a deadlock).")
+            self._forget_position()
             return (True, output)
         return (False, output)
 
@@ -288,6 +788,8 @@ class ReversibleDebugger(debugger.Debugger):
         cmd.set_count(n)
         # TODO: Special case for gdb so we don't step into libc. Think of
         # more portable way to do this.
+        mark = self._position_mark()
+        f_start = time.time()
         output = self._step(n)
         if output == "DO-NOT-STEP":
             # Log a next instead of step so we don't step into libc again.
@@ -295,6 +797,7 @@ class ReversibleDebugger(debugger.Debugger):
             cmd.set_native(self._p.get_native(cmd))
             cmd.set_count_cmd(self._p.b_has_count_commands)
             cmd.set_count(1)
+        self._record_command_time(mark, cmd, f_start)
         self.log_fred_command(cmd)
         self.update_state()
         return output
@@ -313,17 +816,22 @@ class ReversibleDebugger(debugger.Debugger):
             cmd.set_count(n)
             # TODO: Special case for gdb so we don't step into libc. Think of
             # more portable way to do this.
-            output = self._step(n, b_timeout=True)
+            n_timeout = self.command_deadline(cmd)
+            mark = self._position_mark()
+            f_start = time.time()
+            output = self._step(n, b_timeout=True, n_timeout=n_timeout)
             if output == "DO-NOT-STEP":
                 # Log a next instead of step so we don't step into libc again.
                 cmd = fred_next_cmd()
                 cmd.set_native(self._p.get_native(cmd))
                 cmd.set_count_cmd(self._p.b_has_count_commands)
                 cmd.set_count(1)
+            self._record_command_time(mark, cmd, f_start)
             self.log_fred_command(cmd)
             self.update_state()
         except fredutil.PromptTimeoutException:
             fredutil.fred_debug("'step' command timed out (probably a deadlock).")
+            self._forget_position()
             return (True, output)
 
         return (False, output)
@@ -341,7 +849,9 @@ class ReversibleDebugger(debugger.Debugger):
             self.replay_history(l_history)
 	# NOTE: do_step() logs "step", but we replace history.
         if self.do_step() == "DO-NOT-STEP":
-	    l_history[-1].set_native(self._p.get_native(fred_next_cmd()))
+            cmd = l_history[-1]
+	    cmd.set_native(self._p.get_native(fred_next_cmd()))
+            l_history[-1] = cmd
 	    # undo "step" and then replay "next"
             self.do_restart(b_clear_history = True)
             self.replay_history(l_history)
@@ -351,11 +861,21 @@ class ReversibleDebugger(debugger.Debugger):
         """Perform n 'continue' commands. Returns output."""
         cmd = fred_continue_cmd()
         cmd.set_native(self._p.get_native(cmd))
-        cmd.b_wait_for_prompt = b_wait_for_prompt
-        self.log_fred_command(cmd)
+        cmd.set_wait_for_prompt(b_wait_for_prompt)
+        if not b_wait_for_prompt:
+            # Don't update state if we are not waiting for the prompt.
+            self.log_fred_command(cmd)
+            return self._continue(b_wait_for_prompt)
+        mark = self._position_mark()
+        f_start = time.time()
         output = self._continue(b_wait_for_prompt)
-        # Don't update state if we are not waiting for the prompt.
-        if b_wait_for_prompt:
+        self._record_command_time(mark, cmd, f_start)
+        # Log only now that we know where it stopped:
+        d_state = self._stop_state_snapshot()
+        self._set_stop_breakpoint(cmd, output)
+        self.log_fred_command(cmd)
+        self._file_state_snapshot(d_state)
+        if d_state != None:
             self.update_state()
         return output
 
@@ -363,9 +883,10 @@ class ReversibleDebugger(debugger.Debugger):
         """Perform 'break expr' command. Returns output."""
         cmd = fred_breakpoint_cmd()
         cmd.set_native(self._p.get_native(cmd))
-        cmd.s_args = expr
+        cmd.set_args(expr)
         self.log_fred_command(cmd)
         output = self._breakpoint(expr)
+        self._observe_breakpoint_command(cmd)
         self.update_state()
         return output
 
@@ -384,14 +905,14 @@ class ReversibleDebugger(debugger.Debugger):
         """Switch debugger to given thread."""
         cmd = fred_switch_thread_cmd()
         cmd.set_native(self._p.get_native(cmd))
-        cmd.s_args = str(n_tid)
+        cmd.set_args(str(n_tid))
         self.log_fred_command(cmd)
         self._switch_to_thread(n_tid)
 
     def set_log_breakpoint(self, n_log_index):
         """Set a log breakpoint on the given log entry index."""
         cmd = fred_log_breakpoint_cmd()
-        cmd.s_args = str(n_log_index)
+        cmd.set_args(str(n_log_index))
         self.log_fred_command(cmd)
         fredmanager.set_fred_breakpoint(n_log_index)
 
@@ -415,115 +936,90 @@ class ReversibleDebugger(debugger.Debugger):
         # log bkpt right now).
         fredmanager.send_fred_continue()
 
-    def _copy_fred_commands(self, l_cmds):
-        """Perform a deep copy on the given list of FredCommands."""
-        l_result = []
-        for cmd in l_cmds:
-            l_result.append(cmd.copy())
-        return l_result
-
     def current_checkpoint(self):
         """Return the current Checkpoint."""
         return self.branch.get_current_checkpoint()
 
     def copy_current_checkpoint_history(self):
         """Return a copy of the current checkpoint's history."""
-        return self._copy_fred_commands(self.current_checkpoint().get_history())
+        return self.current_checkpoint().get_history().copy()
 
     def _coalesce_history(self, l_history):
-        """Return a modified version of l_history with as much condensing done
-        as possible. Example: [n,n,n,n,n] => [n 5]."""
-        if not self._p.b_coalesce_support or len(l_history) == 0:
-            return l_history
-        l_result = self._copy_fred_commands(l_history)
-        i = j = 0
-        while i < len(l_result):
-            if not l_result[i].b_count_cmd:
-                i += 1
-                continue
-            n_count = l_result[i].count()
-            j = i + 1
-            while j < len(l_result):
-                if l_result[j].s_name == l_result[i].s_name:
-                    n_count += l_result[j].count()
-                else:
-                    break
-                j += 1
-            if n_count > 1:
-                del l_result[i+1:i+n_count]
-                l_result[i].set_count(n_count)
-            i += 1
-        return l_result
+        """Return the list of commands to issue to replay l_history, with as
+        much condensing done as possible. Example: [n,n,n,n,n] => [n 5]."""
+        return list(l_history.coalesced(
+            self._p.b_coalesce_support,
+            self._p.b_coalesce_continue_support))
 
     def replay_history(self, l_history=[], n=-1):
-        import signal
-        class TimeoutException(Exception):
-            pass
-        def timeout_handler(signum, frame):
-            raise TimeoutException()
-        n_timeout = 30
-        signal.signal(signal.SIGALRM, timeout_handler)
-        signal.alarm(n_timeout)
-        while True:
-            try:
-                self.replay_history_helper(l_history, n)
-                signal.alarm(0)
-                return
-            except TimeoutException:
-                fredutil.fred_debug("Replay history timed out.")
-                self.do_restart()
-
-    def replay_history_helper(self, l_history=[], n=-1):
         """Issue the commands in given or current checkpoint's history to
-        debugger."""
+        debugger, from wherever the debugger is.  Each command must complete
+        within its deadline (see command_deadline()).  When one times out,
+        restart, go back to the position the replay started from, reissue
+        the commands that completed, and retry the failing command with
+        twice the deadline, up to GN_REPLAY_MAX_RETRIES times.  After that,
+        it is retried once more without a deadline, so the replay always
+        completes.  If the starting position is not known, no deadlines are
+        used since it could not be gone back to."""
+        global gn_total_replay_timeouts, gn_total_replay_retries
         if len(l_history) == 0:
             l_history = self.copy_current_checkpoint_history()
-        if n == -1:
-            l_temp = self._coalesce_history(l_history)
-        else:
-            l_temp = self.first_n_commands(self._coalesce_history(l_history), n)
+        elif not isinstance(l_history, fredhistory.History):
+            l_history = fredhistory.History(l_history)
+        if n != -1:
+            l_history = self.first_n_commands(l_history, n)
+        l_temp = self._coalesce_history(l_history)
         fredutil.fred_debug("Replaying the following history: %s" % \
                             str(l_temp))
-        for cmd in l_temp:
-            self.execute_fred_command(cmd, b_update=False)
+        h_start = self._replay_start_position()
+        n_done = 0
+        n_retries = 0
+        while n_done < len(l_temp):
+            cmd = l_temp[n_done]
+            n_timeout = None
+            if h_start != None and n_retries <= GN_REPLAY_MAX_RETRIES:
+                n_timeout = self.command_deadline(cmd) * 2 ** n_retries
+            try:
+                self.execute_fred_command(cmd, b_update=False,
+                                          n_timeout=n_timeout)
+            except fredutil.PromptTimeoutException:
+                gn_total_replay_timeouts += 1
+                fredutil.fred_debug("Replay of '%s' timed out after %.1f s." %
+                                    (cmd, n_timeout))
+                if n_retries == GN_REPLAY_MAX_RETRIES:
+                    fredutil.fred_warning("Replay of '%s' keeps timing out; "
+                                          "waiting for it without a "
+                                          "deadline." % cmd)
+                n_retries += 1
+                gn_total_replay_retries += 1
+                # These already completed once, so need no deadlines:
+                self.do_restart()
+                for prev_cmd in self._coalesce_history(h_start) + \
+                                l_temp[:n_done]:
+                    self.execute_fred_command(prev_cmd, b_update=False)
+                continue
+            n_done += 1
+            n_retries = 0
         self.update_state()
 
+    def _replay_start_position(self):
+        """Return a copy of the History which, replayed after restarting the
+        current checkpoint, brings the debugger back to where it is, or None
+        if that is not known."""
+        if self.h_position == None or self.current_checkpoint() == None or \
+           self.t_position_base != (self.branch.get_name(),
+                                    self.current_checkpoint().get_index()):
+            return None
+        return self.h_position.copy()
+
     def first_n_commands(self, l_history, n):
-        """Return the first 'n' commands from given history."""
-        # TODO: Clean this up a bit.
-        l_result = []
-        i = j = 0
-        while i < n:
-            # Make sure we do a copy of the command.
-            l_result.append(l_history[j].copy())
-            if l_history[j].b_count_cmd:
-                count = l_history[j].count()
-                if count != 1:
-                    if i + count < n:
-                        i += count
-                        j += 1
-                        continue
-                    else:
-                        l_result[-1].set_count(n - i)
-                        break
-            i += 1
-            j += 1
-        return l_result
+        """Return the first 'n' (logical) commands from given History."""
+        return l_history.prefix(n)
 
     def trim_n_cmds(self, l_history, n):
         """Trim last n commands.
         Also adjust things like 'next 5' to be 'next 4'."""
-        if len(l_history) == 0:
-            return
-        while n > 0:
-            if l_history[-1].b_count_cmd:
-                n_count = l_history[-1].count()
-                if n_count != 1:
-                    l_history[-1].set_count(n_count - 1)
-                    n -= 1
-                    continue
-            n -= 1
-            l_history.pop()
+        l_history.trim(n)
 
     # Gene - We should generalize this.  self.evaluate_expression could
     #  convert "1" to "true" and "0" to "false".  Then test_expression
@@ -531,12 +1027,17 @@ class ReversibleDebugger(debugger.Debugger):
     #  Also, is compare_expressions a better name than test_expression ?
     def test_expression(self, s_expr, s_expr_val):
         global gn_time_evaluating, gn_total_evaluations
-        ls_truths = ["1", "true"]
-        ls_falsehoods = ["0", "false", ""] # Empty string needed for Perl.
         fredutil.fred_timer_start("evaluation")
         s_result = self.evaluate_expression(s_expr)
         gn_time_evaluating += fredutil.fred_timer_stop("evaluation")
         gn_total_evaluations += 1
+        return self.expression_values_match(s_result, s_expr_val)
+
+    def expression_values_match(self, s_result, s_expr_val):
+        """Return True if the two sanitized expression values are equal,
+        treating the various spellings of true and false as equal."""
+        ls_truths = ["1", "true"]
+        ls_falsehoods = ["0", "false", ""] # Empty string needed for Perl.
         if s_result in ls_truths and s_expr_val in ls_truths:
             return True
         elif s_result in ls_falsehoods and s_expr_val in ls_falsehoods:
@@ -545,9 +1046,54 @@ class ReversibleDebugger(debugger.Debugger):
             return s_result == s_expr_val
 
     def evaluate_expression(self, s_expr):
+        """Returns sanitized value of expression in debugger.
+        Values of expressions without side effects are cached by timeline
+        position (see position_key())."""
+        key = self.position_key()
+        b_cacheable = key != None and _is_side_effect_free(s_expr)
+        if b_cacheable:
+            s_val = self.cached_expression_value(key, s_expr)
+            if s_val != None:
+                return s_val
+        s_val = self._evaluate_expression(s_expr)
+        if b_cacheable:
+            self.expression_cache.put(key, s_expr, s_val)
+        return s_val
+
+    def evaluate_expressions(self, l_exprs):
+        """Returns a dict mapping each expression of the list to its
+        sanitized value.  The uncached expressions are all printed in one
+        debugger round trip where the personality supports it."""
+        key = self.position_key()
+        d_values = {}
+        l_uncached = []
+        for s_expr in l_exprs:
+            if s_expr in d_values or s_expr in l_uncached:
+                continue
+            s_val = None
+            if key != None and _is_side_effect_free(s_expr):
+                s_val = self.cached_expression_value(key, s_expr)
+            if s_val != None:
+                d_values[s_expr] = s_val
+            else:
+                l_uncached.append(s_expr)
+        if len(l_uncached) > 0:
+            l_outputs = self._print_batch(l_uncached)
+            for (s_expr, s_output) in zip(l_uncached, l_outputs):
+                s_val = self._sanitize_expression_value(s_output)
+                if key != None and _is_side_effect_free(s_expr):
+                    self.expression_cache.put(key, s_expr, s_val)
+                d_values[s_expr] = s_val
+        return d_values
+
+    def _evaluate_expression(self, s_expr):
         """Returns sanitized value of expression in debugger."""
-        global GS_NO_SYMBOL_ERROR
         s_val = self.do_print(s_expr, b_drain_first=True)
+        return self._sanitize_expression_value(s_val)
+
+    def _sanitize_expression_value(self, s_val):
+        """Returns sanitized value from the output of a print command."""
+        global GS_NO_SYMBOL_ERROR
         s_val = self._p.sanitize_print_result(s_val)
         if (re.search("No symbol .+ in current context", s_val) != None or
             re.search("You can't do that without a process to debug", s_val) != None):
@@ -558,7 +1104,10 @@ class ReversibleDebugger(debugger.Debugger):
         """Report any gathered timing statistics."""
         global gn_time_checkpointing, gn_time_restarting, \
                gn_time_evaluating, gn_total_checkpoints, \
-               gn_total_restarts, gn_total_evaluations
+               gn_total_restarts, gn_total_evaluations, gn_total_cache_hits, \
+               gn_total_replay_timeouts, gn_total_replay_retries, \
+               gn_total_restarts_avoided, gn_total_thread_searches, \
+               gn_total_threads_tried
         fredutil.fred_debug("Timing statistics:")
         s = "\n"
         s += "Total time checkpointing:   %.3f s\n" % gn_time_checkpointing
@@ -566,19 +1115,32 @@ class ReversibleDebugger(debugger.Debugger):
         s += "Total time evaluating expr: %.3f s\n" % gn_time_evaluating
         s += "Total checkpoints:          %d\n"     % gn_total_checkpoints
         s += "Total restarts:             %d\n"     % gn_total_restarts
+        s += "Restarts avoided by search: %d\n"     % gn_total_restarts_avoided
         s += "Total evaluations of expr:  %d\n"     % gn_total_evaluations
+        s += "Expression cache hits:      %d\n"     % gn_total_cache_hits
+        s += "Replay command timeouts:    %d\n"     % gn_total_replay_timeouts
+        s += "Replay command retries:     %d\n"     % gn_total_replay_retries
         s += "Average checkpoint time:    %.3f s\n" % (gn_time_checkpointing /
                                                        gn_total_checkpoints)
         s += "Average restart time:       %.3f s\n" % (gn_time_restarting /
                                                        gn_total_restarts)
         s += "Average evaluation time:    %.3f s\n" % (gn_time_evaluating /
                                                        gn_total_evaluations)
+        if gn_total_thread_searches > 0:
+            s += "Average threads tried:      %.1f\n" % \
+                (float(gn_total_threads_tried) / gn_total_thread_searches)
         fredutil.fred_debug(s)
 
-class FredCommand():
+class FredCommand(object):
     """Represents one user command sent to the debugger.
     Used to abstract away personality-specific syntax. Each FredCommand retains
-    the 'native' command, however, which is used during command replay."""
+    the 'native' command, however, which is used during command replay.
+    Fields are read directly but only changed through the set_*() methods,
+    which reset the cached hash."""
+    __slots__ = ["s_name", "s_args", "s_native", "b_ignore", "b_count_cmd",
+                 "b_wait_for_prompt", "n_stop_breakpoint", "n_replay_count",
+                 "_n_hash"]
+
     def __init__(self, name, args=""):
         self.s_name = name
         self.s_args = args
@@ -591,6 +1153,39 @@ class FredCommand():
         # When True, executing this command will wait for the debugger prompt.
         # Defaults to True because that is the usual behavior.
         self.b_wait_for_prompt = True
+        # Number of the breakpoint a 'continue' stopped at (-1 if unknown):
+        self.n_stop_breakpoint = -1
+        # Number of logical commands of a History this command replays, when
+        # it was coalesced from a run of non-count commands (not part of the
+        # key: see History.coalesced()):
+        self.n_replay_count = 1
+        self._n_hash = None
+
+    def _key(self):
+        return (self.s_name, self.s_args, self.s_native, self.b_ignore,
+                self.b_count_cmd, self.b_wait_for_prompt,
+                self.n_stop_breakpoint)
+
+    def __hash__(self):
+        if self._n_hash == None:
+            self._n_hash = hash(self._key())
+        return self._n_hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        return isinstance(other, FredCommand) and \
+               hash(self) == hash(other) and self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def equals_except_args(self, other):
+        """Return whether this command and other differ at most in their
+        arguments."""
+        key = self._key()
+        other_key = other._key()
+        return key[0] == other_key[0] and key[2:] == other_key[2:]
 
     def __repr__(self):
         """Return a FReD-abstracted representation of this command."""
@@ -609,8 +1204,16 @@ class FredCommand():
         new_cmd.b_ignore          = self.b_ignore
         new_cmd.b_count_cmd       = self.b_count_cmd
         new_cmd.b_wait_for_prompt = self.b_wait_for_prompt
+        new_cmd.n_stop_breakpoint = self.n_stop_breakpoint
+        new_cmd.n_replay_count    = self.n_replay_count
+        new_cmd._n_hash           = self._n_hash
         return new_cmd
 
+    def to_list(self):
+        """Return a list of the fields of this FredCommand, for storing as
+        JSON (see fred_command_from_list())."""
+        return list(self._key())
+
     def native_repr(self):
         """Return a personality-native representation of this command.
         Native representation can be passed directly to the debugger."""
@@ -622,15 +1225,37 @@ class FredCommand():
     def set_native(self, s_repr):
         """Set the native representation to the given string."""
         self.s_native = s_repr
+        self._n_hash = None
+
+    def set_args(self, s_args):
+        """Set the arguments to the given string."""
+        self.s_args = s_args
+        self._n_hash = None
 
     def set_ignore(self):
         """Set the ignore flag to true."""
         self.b_ignore = True
+        self._n_hash = None
+
+    def set_wait_for_prompt(self, b_wait):
+        """Set whether executing this command waits for the prompt."""
+        self.b_wait_for_prompt = b_wait
+        self._n_hash = None
+
+    def set_stop_breakpoint(self, n_number):
+        """Set the number of the breakpoint this command stopped at."""
+        self.n_stop_breakpoint = n_number
+        self._n_hash = None
+
+    def set_replay_count(self, n):
+        """Set the number of logical commands this command replays."""
+        self.n_replay_count = n
 
     def set_count_cmd(self, b_allowed):
         """Set the count cmd flag to true if b_allowed."""
         if b_allowed:
             self.b_count_cmd = True
+            self._n_hash = None
 
     def is_unknown(self):
         return self.s_name == fred_unknown_cmd().s_name
@@ -647,6 +1272,15 @@ class FredCommand():
     def is_breakpoint(self):
         return self.s_name == fred_breakpoint_cmd().s_name
 
+    def is_delete(self):
+        return self.s_name == fred_delete_cmd().s_name
+
+    def is_disable(self):
+        return self.s_name == fred_disable_cmd().s_name
+
+    def is_enable(self):
+        return self.s_name == fred_enable_cmd().s_name
+
     def is_log_breakpoint(self):
         return self.s_name == fred_log_breakpoint_cmd().s_name
 
@@ -666,7 +1300,7 @@ class FredCommand():
         """Set s_args flag to the given count."""
         fredutil.fred_assert(self.b_count_cmd or n == 1,
                              "Tried to set count of non-count cmd.")
-        self.s_args = str(n)
+        self.set_args(str(n))
 
 
 class Branch():
@@ -680,8 +1314,9 @@ class Branch():
         self.checkpoint = None
         self.l_checkpoints = []
 
-    def do_checkpoint(self):
-        """Add a new Checkpoint to this branch."""
+    def do_checkpoint(self, b_quiet=False):
+        """Add a new Checkpoint to this branch.  Unless b_quiet, tell the
+        user."""
         new_ckpt = Checkpoint()
         self.add_checkpoint(new_ckpt)
         self.set_current_checkpoint(new_ckpt)
@@ -689,28 +1324,44 @@ class Branch():
         #fredutil.fred_debug(
         #    "!! Sleeping after checkpoint (ptrace instability hack)")
         #time.sleep(1)
-        fredutil.fred_info("Created checkpoint #%d." %
-                           self.get_last_checkpoint().get_index())
+        s_message = "Created checkpoint #%d." % \
+                    self.get_last_checkpoint().get_index()
+        if b_quiet:
+            fredutil.fred_debug(s_message)
+        else:
+            fredutil.fred_info(s_message)
         return self.get_last_checkpoint().get_index()
 
     def remove_checkpoint(self, n_index):
-        """Remove the checkpoint with the specified index."""
-        if n_index + 1 != self.n_next_checkpoint:
-            fredutil.fred_warning(
-                "Checkpoint is not last one.  Can't remove it.")
+        """Remove the checkpoint with the specified index.  Later checkpoints
+        (and their images) are renumbered to fill the gap.  If it was the
+        current checkpoint, the one before it becomes current."""
+        if n_index < 0 or n_index >= self.n_next_checkpoint:
+            fredutil.fred_warning("No such checkpoint index %d." % n_index)
             return False
+        if self.n_next_checkpoint == 1:
+            fredutil.fred_warning("Can't remove the only checkpoint.")
+            return False
+        b_current = self.checkpoint == self.l_checkpoints[n_index]
         dmtcpmanager.remove_checkpoint_files_of_index(n_index)
+        for ckpt in self.l_checkpoints[n_index + 1:]:
+            dmtcpmanager.renumber_checkpoint_files(ckpt.get_index(),
+                                                   ckpt.get_index() - 1)
+            ckpt.set_index(ckpt.get_index() - 1)
         del self.l_checkpoints[n_index]
         self.n_next_checkpoint -= 1
-        self.set_current_checkpoint(self.get_last_checkpoint())
+        dmtcpmanager.reset_checkpoint_indexing()
+        if b_current:
+            self.set_current_checkpoint(
+                self.get_checkpoint(max(0, n_index - 1)))
         return True
 
     def do_restart(self, n_index, b_clear_history, reset_fnc):
         """Restart from the specified checkpoint, calling the provided
-        reset_fnc before restarting, if provided."""
+        reset_fnc before restarting, if provided.  Return True on success."""
         if self.get_num_checkpoints() == 0:
             fredutil.fred_error("No checkpoints found.")
-            return
+            return False
         if reset_fnc != None:
             reset_fnc()
         if n_index == -1:
@@ -720,7 +1371,7 @@ class Branch():
         else:
             if n_index > self.get_num_checkpoints() - 1:
                 fredutil.fred_error("No such checkpoint index %d." % n_index)
-                return
+                return False
             fredutil.fred_debug("Restarting from checkpoint index %d "
                                 "in branch %s" % \
                                 (n_index, self.get_name()))
@@ -730,6 +1381,7 @@ class Branch():
             self.get_current_checkpoint().clear_history()
         #fredutil.fred_debug("!! Sleeping after restart (ptrace instability hack)")
         #time.sleep(1)
+        return True
 
     def add_checkpoint(self, ckpt):
         """Append the given Checkpoint object to list of checkpoints."""
@@ -772,7 +1424,7 @@ class Branch():
         if self.checkpoint != None:
             for ckpt in self.l_checkpoints:
                 l_history.append("*ckpt*")
-                l_history.extend(ckpt.l_history)
+                l_history.extend(list(ckpt.l_history.coalesced()))
         return l_history
 
 class Checkpoint():
@@ -782,25 +1434,46 @@ class Checkpoint():
     def __init__(self, n_index=-1):
         # Index number:
         self.n_index = n_index
-        # The history is a list of FredCommands sent to the debugger
-        # from the beginning of this checkpoint.
-        self.l_history  = []
+        # The history is the fredhistory.History of FredCommands sent to the
+        # debugger from the beginning of this checkpoint.
+        self.l_history  = fredhistory.History()
+        # The position trace:  the GL_TRACE_FIELDS of the state snapshots
+        # taken at positions reached from this checkpoint, keyed by the
+        # (length, fingerprint) of the History leading there.  Replay is
+        # deterministic, so entries stay valid when the history changes.
+        self.d_trace = {}
 
     def __repr__(self):
         return str(self.n_index)
 
     def clear_history(self):
         """Clears the history for this Checkpoint."""
-        del self.l_history[:]
+        self.l_history.clear()
 
     def get_history(self):
         """Return the history for this Checkpoint."""
         return self.l_history
 
     def set_history(self, l_history):
-        """Set the history for this Checkpoint."""
+        """Set the history for this Checkpoint (a History or a list of
+        FredCommands)."""
+        if not isinstance(l_history, fredhistory.History):
+            l_history = fredhistory.History(l_history)
         self.l_history = l_history
 
+    def trace_position(self, l_history, d_state):
+        """Record the state snapshot d_state of the position reached by
+        replaying the given History from this checkpoint."""
+        global GL_TRACE_FIELDS
+        self.d_trace[(len(l_history), l_history.fingerprint())] = \
+            dict([(s_field, d_state.get(s_field))
+                  for s_field in GL_TRACE_FIELDS])
+
+    def traced_position(self, l_history):
+        """Return the trace entry recorded by trace_position() for the
+        given History, or None."""
+        return self.d_trace.get((len(l_history), l_history.fingerprint()))
+
     def get_index(self):
         return self.n_index
 
@@ -813,11 +1486,7 @@ class Checkpoint():
 
     def number_non_ignore_cmds(self):
         """Return the number of non-ignore cmds from the history."""
-        n = 0
-        for cmd in self.l_history:
-            if not cmd.b_ignore:
-                n += 1 if not cmd.b_count_cmd else cmd.count()
-        return n
+        return self.l_history.number_non_ignore()
 
     def last_command(self):
         """Return the last command of the history or None."""
@@ -828,25 +1497,138 @@ class Checkpoint():
 
     def last_command_non_ignore(self):
         """Return the last non-ignore command of the history or None."""
-        for i in range(-1, -(len(self.l_history)+1), -1):
-            cmd = self.l_history[i]
-            if not cmd.b_ignore:
-                return cmd
-        return None
+        return self.l_history.last_non_ignore()
 
     def trim_non_ignore(self, n):
         """Trim last n non-ignore commands.
         Also adjust things like 'next 5' to be 'next 4'."""
-        while n > 0:
-            if not self.last_command().b_ignore:
-                if self.last_command().b_count_cmd:
-                    count = self.last_command().count()
-                    if count != 1:
-                        self.last_command().set_count(count - 1)
-                        n -= 1
-                        continue
-                n -= 1
-            self.l_history.pop()
+        self.l_history.trim_non_ignore(n)
+
+class ExpressionCache():
+    """Least-recently-used cache of expression values, keyed by
+    (position key, expression).  See ReversibleDebugger.position_key()."""
+
+    def __init__(self, n_size):
+        self.n_size = n_size
+        self.d_values = OrderedDict()
+
+    def __len__(self):
+        return len(self.d_values)
+
+    def get(self, key, s_expr):
+        """Return the cached value of s_expr at key, or None."""
+        t_key = (key, s_expr)
+        value = self.d_values.pop(t_key, None)
+        if value != None:
+            # Re-insert as most recently used.
+            self.d_values[t_key] = value
+        return value
+
+    def put(self, key, s_expr, value):
+        """Cache the value of s_expr at key."""
+        t_key = (key, s_expr)
+        self.d_values.pop(t_key, None)
+        self.d_values[t_key] = value
+        while len(self.d_values) > self.n_size:
+            self.d_values.popitem(last=False)
+
+    def clear(self):
+        """Remove all values."""
+        self.d_values.clear()
+
+    def invalidate_branch(self, s_branch):
+        """Remove all values for positions in the named branch."""
+        self._invalidate(lambda key: key[0] == s_branch)
+
+    def invalidate_checkpoints(self, s_branch, n_first_index):
+        """Remove all values for positions after checkpoints with index
+        n_first_index or higher of the named branch."""
+        self._invalidate(lambda key: key[0] == s_branch and
+                         key[1] >= n_first_index)
+
+    def _invalidate(self, fnc_matches):
+        for t_key in self.d_values.keys():
+            if fnc_matches(t_key[0]):
+                del self.d_values[t_key]
+
+class CommandTimes():
+    """Recorded execution times of commands, keyed by the position (see
+    ReversibleDebugger.position_key()) each command was executed from.
+    Replay is deterministic, so a command replayed from the same position
+    should take about as long again."""
+
+    def __init__(self):
+        # Position key => (prototype FredCommand, count, seconds):
+        self.d_times = {}
+        # Command name => [seconds, count] over all recorded commands:
+        self.d_kinds = {}
+
+    def __len__(self):
+        return len(self.d_times)
+
+    def record(self, t_base, h_position, cmd, f_seconds):
+        """Record that cmd took f_seconds from the position given by the
+        position base and History (see ReversibleDebugger.position_key())."""
+        if h_position == None:
+            return
+        (proto, n_count) = fredhistory.command_prototype(cmd)
+        if proto is cmd:
+            proto = cmd.copy()
+        key = t_base + (len(h_position), h_position.fingerprint())
+        self.d_times[key] = (proto, n_count, f_seconds)
+        l_kind = self.d_kinds.setdefault(proto.s_name, [0.0, 0])
+        l_kind[0] += f_seconds
+        l_kind[1] += n_count
+
+    def seconds_per_command(self, s_name=None):
+        """Return the average recorded time of one logical command with the
+        given name (of any command if None), or None if there is none."""
+        if s_name == None:
+            f_seconds = sum([l[0] for l in self.d_kinds.values()])
+            n_count = sum([l[1] for l in self.d_kinds.values()])
+        else:
+            (f_seconds, n_count) = self.d_kinds.get(s_name, (0.0, 0))
+        if n_count == 0:
+            return None
+        return f_seconds / n_count
+
+    def expected(self, t_base, h_position, cmd):
+        """Return (seconds, b_unknown):  the recorded execution time of cmd
+        from the given position, and whether some of it was never recorded.
+        A replayed 'next 5' may have been recorded as five 'next's, so its
+        time is summed over the recorded commands it covers."""
+        if h_position == None:
+            return (0.0, True)
+        (proto, n_count) = fredhistory.command_prototype(cmd)
+        h_position = h_position.copy()
+        f_seconds = 0.0
+        while n_count > 0:
+            entry = self.d_times.get(t_base + (len(h_position),
+                                               h_position.fingerprint()))
+            if entry == None or entry[0] != proto or entry[1] > n_count:
+                return (f_seconds, True)
+            f_seconds += entry[2]
+            n_count -= entry[1]
+            h_position.append(proto, entry[1])
+        return (f_seconds, False)
+
+    def clear(self):
+        """Remove all times."""
+        self.d_times.clear()
+        self.d_kinds.clear()
+
+    def invalidate_branch(self, s_branch):
+        """Remove all times for positions in the named branch."""
+        for key in self.d_times.keys():
+            if key[0] == s_branch:
+                del self.d_times[key]
+
+    def invalidate_checkpoints(self, s_branch, n_first_index):
+        """Remove all times for positions after checkpoints with index
+        n_first_index or higher of the named branch."""
+        for key in self.d_times.keys():
+            if key[0] == s_branch and key[1] >= n_first_index:
+                del self.d_times[key]
 
 # These will be the abstract commands that should be used *everywhere*. The
 # only place which does not operate on these commands is the personalityXXX.py
@@ -859,6 +1641,12 @@ def fred_continue_cmd():
     return FredCommand("continue")
 def fred_breakpoint_cmd():
     return FredCommand("breakpoint")
+def fred_delete_cmd():
+    return FredCommand("delete")
+def fred_disable_cmd():
+    return FredCommand("disable")
+def fred_enable_cmd():
+    return FredCommand("enable")
 def fred_where_cmd():
     return FredCommand("where")
 def fred_info_breakpoints_cmd():
@@ -873,3 +1661,36 @@ def fred_log_continue_cmd():
     return FredCommand("log-continue")
 def fred_switch_thread_cmd():
     return FredCommand("thread")
+
+def fred_command_from_list(l_fields):
+    """Return the FredCommand from the result of FredCommand.to_list()."""
+    cmd = FredCommand(l_fields[0], l_fields[1])
+    cmd.set_native(l_fields[2])
+    if l_fields[3]:
+        cmd.set_ignore()
+    cmd.set_count_cmd(l_fields[4])
+    cmd.set_wait_for_prompt(l_fields[5])
+    cmd.set_stop_breakpoint(l_fields[6])
+    return cmd
+
+def _parse_breakpoint_numbers(s_args):
+    """Return the list of breakpoint numbers named by the arguments of a
+    'delete'/'disable'/'enable' command, e.g. "2 4-6" => [2, 4, 5, 6].
+    Returns None if the arguments are anything other than numbers/ranges."""
+    l_numbers = []
+    for s_arg in s_args.split():
+        m = re.match("^(\d+)(?:-(\d+))?$", s_arg)
+        if m == None:
+            return None
+        n_first = int(m.group(1))
+        n_last = int(m.group(2)) if m.group(2) != None else n_first
+        l_numbers.extend(range(n_first, n_last + 1))
+    return l_numbers
+
+def _is_side_effect_free(s_expr):
+    """Return True if evaluating s_expr cannot change the program state.
+    Conservative: any assignment, increment or parenthesis (function call)
+    is assumed to have side effects, including the compound assignments
+    '<<=' and '>>='."""
+    return re.search(r"\+\+|--|\(|<<=|>>=|(^|[^=!<>])=($|[^=])",
+                     s_expr) == None
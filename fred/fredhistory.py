@@ -0,0 +1,405 @@
+###############################################################################
+# Copyright (C) 2009, 2010, 2011, 2012 by Kapil Arya, Gene Cooperman,         #
+#                                        Tyler Denniston, and Ana-Maria Visan #
+# {kapil,gene,tyler,amvisan}@ccs.neu.edu                                      #
+#                                                                             #
+# This file is part of FReD.                                                  #
+#                                                                             #
+# FReD is free software: you can redistribute it and/or modify                #
+# it under the terms of the GNU General Public License as published by        #
+# the Free Software Foundation, either version 3 of the License, or           #
+# (at your option) any later version.                                         #
+#                                                                             #
+# FReD is distributed in the hope that it will be useful,                     #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of              #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the               #
+# GNU General Public License for more details.                                #
+#                                                                             #
+# You should have received a copy of the GNU General Public License           #
+# along with FReD.  If not, see <http://www.gnu.org/licenses/>.               #
+###############################################################################
+
+"""
+This file contains the History class, the representation of the command
+history of a Checkpoint.
+
+A History is a sequence of *logical* commands: 'next 5' counts as five
+'next' commands, so len(), indexing and slicing all work in units of
+logical commands, which is what the binary search algorithms reason about.
+
+Consecutive identical commands are stored as one run: a prototype
+FredCommand (with count 1) and a count.  The runs form a persistent
+(immutable) linked list from the latest run back to the first, and a
+History is just a pointer to its last run plus its logical length.  So
+copies, prefixes and the histories of the binary search probes all share
+their common runs: copy() is O(1), append() is O(1), and prefix(), trim()
+and indexing are O(log n) using the jump pointers of the runs.
+
+Prototype FredCommands are shared between Histories and must never be
+mutated.  Indexing a History returns a fresh copy, so to change a command
+assign it back:  cmd = hist[-1]; cmd.set_native(...); hist[-1] = cmd
+"""
+
+def command_prototype(cmd):
+    """Return (prototype, n) for the given FredCommand:  it without its
+    count, and the number of logical commands it stands for.  The prototype
+    is a copy only if a count had to be removed; otherwise it is cmd itself,
+    which the caller must copy before keeping it."""
+    if cmd.b_count_cmd:
+        if cmd.s_args == "":
+            return (cmd, 1)
+        n = cmd.count()
+        proto = cmd.copy()
+        proto.set_args("")
+    elif cmd.n_replay_count != 1:
+        n = cmd.n_replay_count
+        proto = cmd.copy()
+        proto.set_args("")
+        proto.set_replay_count(1)
+    else:
+        return (cmd, 1)
+    return (proto, n)
+
+def _command_count(cmd):
+    """Return the number of logical commands the FredCommand stands for."""
+    if cmd.b_count_cmd:
+        return cmd.count()
+    return cmd.n_replay_count
+
+def _is_prototype_of(proto, cmd):
+    """Return whether the prototype FredCommand is that of cmd (as returned
+    by command_prototype()), without copying cmd."""
+    if cmd.b_count_cmd or cmd.n_replay_count != 1:
+        return proto.s_args == "" and proto.equals_except_args(cmd)
+    return proto == cmd
+
+def _copied_prototype(cmd):
+    """Return command_prototype(cmd), copying cmd if it is the prototype."""
+    (proto, n) = command_prototype(cmd)
+    if proto is cmd:
+        proto = cmd.copy()
+    return (proto, n)
+
+def _with_count(proto, n):
+    """Return a copy of the prototype FredCommand with the given count."""
+    cmd = proto.copy()
+    if n != 1:
+        cmd.set_count(n)
+    return cmd
+
+def _continue_run(proto, n):
+    """Return one 'continue' FredCommand replaying the given run of n
+    continues, each of which stopped at the same breakpoint:  gdb's
+    'continue N' ignores the breakpoint it is stopped at N-1 times."""
+    cmd = proto.copy()
+    cmd.set_args(str(n))
+    cmd.set_replay_count(n)
+    return cmd
+
+class _Run():
+    """One immutable node of a History: n_count identical logical commands
+    following the runs of the parent _Run."""
+
+    def __init__(self, proto, n_count, parent):
+        self.proto = proto
+        self.parent = parent
+        if parent == None:
+            self.n_depth = 0
+            self.n_start = 0
+            self.n_live_start = 0
+            self.n_parent_fingerprint = 0
+            self.jump = None
+        else:
+            self.n_depth = parent.n_depth + 1
+            self.n_start = parent.n_end
+            self.n_live_start = parent.n_live_end
+            self.n_parent_fingerprint = parent.n_fingerprint
+            # Jump pointers as in a skew-binary random access list: any
+            # ancestor can be reached in O(log(depth)) steps.
+            if parent.jump != None and parent.jump.jump != None and \
+                    parent.n_depth - parent.jump.n_depth == \
+                    parent.jump.n_depth - parent.jump.jump.n_depth:
+                self.jump = parent.jump.jump
+            else:
+                self.jump = parent
+        self.n_end = self.n_start + n_count
+        self.n_live_end = self.n_live_start
+        if not proto.b_ignore:
+            self.n_live_end += n_count
+        self.n_fingerprint = self.fingerprint(n_count)
+
+    def fingerprint(self, n_count):
+        """Return the fingerprint of the history ending with the first
+        n_count commands of this run."""
+        return hash((self.n_parent_fingerprint, self.proto, n_count))
+
+class History():
+    """Persistent, run-length encoded list of logical FredCommands.
+
+    A History never modifies a _Run once created, so any number of
+    Histories (of checkpoints, and of the algorithms working on copies of
+    them) may safely share runs.  The last run of a History may be only
+    partially included in it, when the History is a prefix of a longer one."""
+
+    def __init__(self, l_cmds=None):
+        # Last run (or None if empty) and logical length:
+        self._tip = None
+        self._n_len = 0
+        if l_cmds != None:
+            self.extend(l_cmds)
+
+    def __repr__(self):
+        return str(list(self.coalesced()))
+
+    def __len__(self):
+        return self._n_len
+
+    def __iter__(self):
+        for (proto, n) in self.runs():
+            for i in xrange(n):
+                yield proto.copy()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            (n_start, n_stop, n_step) = key.indices(self._n_len)
+            if n_step != 1:
+                raise ValueError("History slices cannot have a step.")
+            return self._slice(n_start, n_stop)
+        return self._find(self._index(key)).proto.copy()
+
+    def __setitem__(self, key, cmd):
+        n_index = self._index(key)
+        if n_index == self._n_len - 1:
+            self.trim(1)
+            self.append(cmd)
+        else:
+            new_hist = self._slice(0, n_index)
+            new_hist.append(cmd)
+            new_hist.extend(self._slice(n_index + 1, self._n_len))
+            self._adopt(new_hist)
+
+    def __delitem__(self, key):
+        if isinstance(key, slice):
+            (n_start, n_stop, n_step) = key.indices(self._n_len)
+            if n_step != 1:
+                raise ValueError("History slices cannot have a step.")
+        else:
+            n_start = self._index(key)
+            n_stop = n_start + 1
+        if n_stop <= n_start:
+            return
+        if n_stop == self._n_len:
+            self._truncate(n_start)
+        else:
+            new_hist = self._slice(0, n_start)
+            new_hist.extend(self._slice(n_stop, self._n_len))
+            self._adopt(new_hist)
+
+    def __iadd__(self, l_cmds):
+        self.extend(l_cmds)
+        return self
+
+    def __add__(self, l_cmds):
+        new_hist = self.copy()
+        new_hist.extend(l_cmds)
+        return new_hist
+
+    def copy(self):
+        """Return a copy of this History.  O(1): all runs are shared."""
+        new_hist = History()
+        new_hist._adopt(self)
+        return new_hist
+
+    def prefix(self, n):
+        """Return a new History of the first n logical commands."""
+        new_hist = self.copy()
+        new_hist._truncate(max(0, min(n, self._n_len)))
+        return new_hist
+
+    def trim(self, n):
+        """Trim the last n logical commands (so 'next 5' becomes 'next 4')."""
+        self._truncate(max(0, self._n_len - n))
+
+    def clear(self):
+        """Remove all commands."""
+        self._truncate(0)
+
+    def append(self, cmd, n_repeat=1):
+        """Append the given FredCommand (which is copied, and which counts
+        as cmd.count() logical commands if it is a count command) n_repeat
+        times."""
+        tip = self._tip
+        if tip != None and _is_prototype_of(tip.proto, cmd):
+            # The common case, extending the last run:  nothing to copy.
+            self._append_run(tip.proto, _command_count(cmd) * n_repeat)
+        else:
+            (proto, n) = _copied_prototype(cmd)
+            self._append_run(proto, n * n_repeat)
+
+    def extend(self, l_cmds):
+        """Append all commands of the given History or list of FredCommands."""
+        if isinstance(l_cmds, History):
+            for (proto, n) in l_cmds.runs():
+                self._append_run(proto, n)
+            return
+        # Gather each run of identical commands before appending it:
+        proto = None
+        n_run = 0
+        for cmd in l_cmds:
+            if proto != None and _is_prototype_of(proto, cmd):
+                n_run += _command_count(cmd)
+            else:
+                if proto != None:
+                    self._append_run(proto, n_run)
+                (proto, n_run) = _copied_prototype(cmd)
+        if proto != None:
+            self._append_run(proto, n_run)
+
+    def pop(self):
+        """Remove and return the last logical command."""
+        cmd = self[-1]
+        self.trim(1)
+        return cmd
+
+    def runs(self):
+        """Return the list of (prototype FredCommand, count) for each run of
+        identical commands.  The prototypes must not be modified."""
+        l_runs = []
+        run = self._tip
+        n_end = self._n_len
+        while run != None:
+            l_runs.append((run.proto, n_end - run.n_start))
+            n_end = run.n_start
+            run = run.parent
+        l_runs.reverse()
+        return l_runs
+
+    def coalesced(self, b_coalesce=True, b_coalesce_continue=False):
+        """Generate the FredCommands to issue to replay this History.  If
+        b_coalesce, each run of a count command is a single command, as in
+        [n,n,n,n,n] => [n 5].  If b_coalesce_continue, each run of
+        'continue's that all stopped at the same breakpoint is replayed as
+        [c,c,c,c,c] => [c, c 4]:  the first continue may stop at any
+        breakpoint, but after that the debugger is stopped at the one the
+        rest stop at.  Runs are split by any command in between (such as
+        adding or deleting breakpoints), so those are always honored."""
+        for (proto, n) in self.runs():
+            if b_coalesce and proto.b_count_cmd:
+                yield _with_count(proto, n)
+            elif b_coalesce_continue and n > 2 and proto.is_continue() and \
+                    proto.n_stop_breakpoint != -1 and proto.s_args == "" and \
+                    proto.b_wait_for_prompt:
+                yield proto.copy()
+                yield _continue_run(proto, n - 1)
+            else:
+                for i in xrange(n):
+                    yield proto.copy()
+
+    def fingerprint(self):
+        """Return a hash of the logical commands of this History.  O(1).
+        Equal histories have equal fingerprints, however they were built,
+        since consecutive equal commands always share a run."""
+        if self._tip == None:
+            return 0
+        return self._tip.fingerprint(self._n_len - self._tip.n_start)
+
+    def number_non_ignore(self):
+        """Return the number of logical non-ignore commands."""
+        if self._tip == None:
+            return 0
+        n_live = self._tip.n_live_start
+        if not self._tip.proto.b_ignore:
+            n_live += self._n_len - self._tip.n_start
+        return n_live
+
+    def last_non_ignore(self):
+        """Return the last non-ignore command, or None."""
+        n_live = self.number_non_ignore()
+        if n_live == 0:
+            return None
+        return self._find_live(n_live).proto.copy()
+
+    def trim_non_ignore(self, n):
+        """Trim the last n non-ignore commands, along with any ignore commands
+        following the earliest of them."""
+        n_live = self.number_non_ignore()
+        if n <= 0 or n_live == 0:
+            return
+        n_target = max(0, n_live - n)
+        # Run holding non-ignore command number n_target+1 (1-based):
+        run = self._find_live(n_target + 1)
+        self._truncate(run.n_start + n_target - run.n_live_start)
+
+    def _index(self, key):
+        """Return the non-negative logical index for the given index."""
+        n_index = key
+        if n_index < 0:
+            n_index += self._n_len
+        if n_index < 0 or n_index >= self._n_len:
+            raise IndexError("History index out of range.")
+        return n_index
+
+    def _find(self, n_index):
+        """Return the run containing the given logical index."""
+        run = self._tip
+        while run.n_start > n_index:
+            if run.jump != None and run.jump.n_end > n_index:
+                run = run.jump
+            else:
+                run = run.parent
+        return run
+
+    def _find_live(self, n):
+        """Return the run containing non-ignore command number n (1-based)."""
+        run = self._tip
+        while run.n_live_start >= n:
+            if run.jump != None and run.jump.n_live_end >= n:
+                run = run.jump
+            else:
+                run = run.parent
+        return run
+
+    def _slice(self, n_start, n_stop):
+        """Return a new History of logical commands [n_start:n_stop)."""
+        if n_start == 0 or n_stop <= n_start:
+            return self.prefix(max(n_start, n_stop) - n_start)
+        l_runs = []
+        run = self._find(n_stop - 1)
+        n_end = n_stop
+        while n_end > n_start:
+            l_runs.append((run.proto, n_end - max(run.n_start, n_start)))
+            n_end = run.n_start
+            run = run.parent
+        l_runs.reverse()
+        new_hist = History()
+        for (proto, n) in l_runs:
+            new_hist._append_run(proto, n)
+        return new_hist
+
+    def _adopt(self, other):
+        """Replace the contents of this History by those of History other."""
+        self._tip = other._tip
+        self._n_len = other._n_len
+
+    def _truncate(self, n):
+        """Shrink this History to its first n logical commands."""
+        if n == 0:
+            self._tip = None
+        else:
+            self._tip = self._find(n - 1)
+        self._n_len = n
+
+    def _append_run(self, proto, n):
+        """Append n logical commands of the given prototype FredCommand."""
+        if n <= 0:
+            return
+        tip = self._tip
+        if tip != None and tip.proto == proto:
+            # Replace (never modify) the last run by a longer one.
+            self._tip = _Run(tip.proto, self._n_len - tip.n_start + n,
+                             tip.parent)
+        else:
+            if tip != None and self._n_len < tip.n_end:
+                tip = _Run(tip.proto, self._n_len - tip.n_start, tip.parent)
+            self._tip = _Run(proto, n, tip)
+        self._n_len += n
@@ -43,6 +43,8 @@ GS_FRED_DEMO_UNHIDE_PREFIX = ['next', 'step']
 
 # Maximum length of a prompt string (from any debugger)
 GN_MAX_PROMPT_LENGTH = 32
+# Length of the end of a command's output kept by last_command_output()
+GN_MAX_COMMAND_OUTPUT_LENGTH = 4096
 # Timeout (in seconds) for waiting for the prompt to appear
 GN_PROMPT_WAIT_TIMEOUT = 20.0
 
@@ -94,6 +96,9 @@ gb_need_user_input = False
 gs_last_printed = ""
 # Set to True, always display all child output, overriding other settings.
 gb_show_child_output = False
+# The last characters printed by the child since the last send_command(),
+# up to GN_MAX_COMMAND_OUTPUT_LENGTH of them (see last_command_output()).
+gs_last_command_output = ""
 
 # Functions beginning with an underscore ('_') should not be used outside of
 # this file!
@@ -104,7 +109,8 @@ class ThreadedOutput(threading.Thread):
                g_capture_output_event, gb_capture_output_til_prompt, \
                gb_hide_output, gn_max_need_input_length, gb_need_user_input, \
                gb_capture_output_multi_page, gs_last_printed, \
-               gb_show_child_output, g_read_child_event
+               gb_show_child_output, g_read_child_event, \
+               gs_last_command_output
         # Used to detect when debugger needs additional user input
         last_printed_need_input = ""
         while 1:
@@ -117,6 +123,9 @@ class ThreadedOutput(threading.Thread):
             if output != None:
                 gs_last_printed = fredutil.last_n(gs_last_printed, output,
                                                GN_MAX_PROMPT_LENGTH)
+                gs_last_command_output = \
+                    fredutil.last_n(gs_last_command_output, output,
+                                    GN_MAX_COMMAND_OUTPUT_LENGTH)
                 last_printed_need_input = \
                     fredutil.last_n(last_printed_need_input, output,
                                     gn_max_need_input_length)
@@ -243,18 +252,21 @@ def _start_output_capture(wait_for_prompt, b_drain_first):
     gb_capture_output = True
 
 def _wait_for_captured_output(b_wait_for_prompt, b_timeout,
-                              b_multi_page, b_hide_reset):
+                              b_multi_page, b_hide_reset, n_timeout=None):
     """Wait until output capture is done, and return captured output.
     The actual output capture is done by the output thread, and placed into
     global gs_captured_output. This function resets that global string when
-    finished."""
+    finished.  If b_timeout, wait at most n_timeout seconds (default
+    GN_PROMPT_WAIT_TIMEOUT)."""
     global gb_capture_output, gs_captured_output, g_capture_output_event, \
            gb_capture_output_til_prompt, gb_capture_output_multi_page, \
            gb_hide_output, GN_PROMPT_WAIT_TIMEOUT, GN_PYTHON_BUG_LOCK_TIMEOUT
     gb_capture_output_til_prompt = b_wait_for_prompt
     gb_capture_output_multi_page = b_multi_page
     if b_timeout:
-        g_capture_output_event.wait(GN_PROMPT_WAIT_TIMEOUT)
+        if n_timeout == None:
+            n_timeout = GN_PROMPT_WAIT_TIMEOUT
+        g_capture_output_event.wait(n_timeout)
         if not g_capture_output_event.is_set():
             gb_hide_output = b_hide_reset
             gs_captured_output = ""
@@ -269,13 +281,14 @@ def _wait_for_captured_output(b_wait_for_prompt, b_timeout,
 
 def get_child_response(s_input, b_timeout=False, hide=True,
                        b_wait_for_prompt=False, b_multi_page=True,
-                       b_drain_first=False):
+                       b_drain_first=False, n_timeout=None):
     """Sends requested input to child, and returns any response made.
     If hide flag is True (default), suppresses echoing from child.  If
     wait_for_prompt flag is True, collects output until the debugger
     prompt is ready. If b_drain_first flag is True, drain all output
     from the child before issuing the input (this blocks the main
-    thread)."""
+    thread).  If b_timeout flag is True, raise PromptTimeoutException
+    after n_timeout seconds (default GN_PROMPT_WAIT_TIMEOUT)."""
     global gb_hide_output
     global GB_FRED_DEMO, GS_FRED_DEMO_HIDE, GS_FRED_DEMO_UNHIDE_PREFIX
     global GB_FRED_DEMO_FROM_USER
@@ -291,7 +304,8 @@ def get_child_response(s_input, b_timeout=False, hide=True,
     _start_output_capture(b_wait_for_prompt, b_drain_first)
     _send_child_input(s_input)
     response = _wait_for_captured_output(b_wait_for_prompt, b_timeout,
-                                         b_multi_page, b_orig_hide_state)
+                                         b_multi_page, b_orig_hide_state,
+                                         n_timeout)
     gb_hide_output = b_orig_hide_state
     return response
 
@@ -374,12 +388,18 @@ def send_command_nonblocking(command):
 
 def send_command(command):
     """Send a command to the child process and wait for the prompt."""
-    global g_prompt_ready_event, gb_need_user_input
+    global g_prompt_ready_event, gb_need_user_input, gs_last_command_output
     g_prompt_ready_event.clear()
     gb_need_user_input = False
+    gs_last_command_output = ""
     _send_child_input(command+'\n')
     wait_for_prompt()
 
+def last_command_output():
+    """Return the end of the output of the last command sent with
+    send_command() (the last GN_MAX_COMMAND_OUTPUT_LENGTH characters)."""
+    return gs_last_command_output
+
 def reexec(argv):
     """Replace the current child process with the new given one."""
     if GB_FRED_DEMO:
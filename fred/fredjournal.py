@@ -0,0 +1,213 @@
+###############################################################################
+# Copyright (C) 2009, 2010, 2011, 2012 by Kapil Arya, Gene Cooperman,         #
+#                                        Tyler Denniston, and Ana-Maria Visan #
+# {kapil,gene,tyler,amvisan}@ccs.neu.edu                                      #
+#                                                                             #
+# This file is part of FReD.                                                  #
+#                                                                             #
+# FReD is free software: you can redistribute it and/or modify                #
+# it under the terms of the GNU General Public License as published by        #
+# the Free Software Foundation, either version 3 of the License, or           #
+# (at your option) any later version.                                         #
+#                                                                             #
+# FReD is distributed in the hope that it will be useful,                     #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of              #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the               #
+# GNU General Public License for more details.                                #
+#                                                                             #
+# You should have received a copy of the GNU General Public License           #
+# along with FReD.  If not, see <http://www.gnu.org/licenses/>.               #
+###############################################################################
+
+"""
+This file contains the HistoryJournal class, which keeps the checkpoint
+histories of a branch in an append-only file in the branch's tmpdir, so that
+a resumed session (fredapp.py --resume) gets them back.
+
+The journal is a sequence of JSON records, one per line:
+  {"op": "branch", "name": NAME, "parent": PARENT}  first record of the file
+  {"op": "checkpoint", "index": N}        checkpoint N was created
+  {"op": "current", "index": N}           checkpoint N is now the current one
+  {"op": "remove", "index": N}            checkpoint N was removed, and the
+                                          later ones renumbered N, N+1, ...
+  {"op": "append", "index": N, "runs": R} commands appended to N's history
+  {"op": "history", "index": N, "runs": R}  N's history was rewritten
+where R is a list of [FredCommand.to_list(), count] runs (see fredhistory.py).
+The file is fsynced at checkpoint boundaries.  A record torn by a crash can
+only be the last one, and is ignored on load.
+"""
+
+import json
+import os
+
+import fredhistory
+import fredutil
+
+GS_JOURNAL_FILE_NAME = "fred-journal.json"
+
+class HistoryJournal():
+    """Append-only journal of the checkpoint histories of one branch."""
+
+    def __init__(self):
+        self.f = None
+        # Checkpoint index => (length, fingerprint) of its History as last
+        # journaled, to write only what changed:
+        self.d_synced = {}
+        self.n_current = -1
+
+    def is_open(self):
+        return self.f != None
+
+    def open(self, s_path, d_header=None):
+        """Open the journal at s_path for appending.  If d_header (a dict
+        with the branch "name" and "parent") is given, start a new journal
+        with it, discarding any existing one."""
+        self.close()
+        if d_header != None:
+            self.f = open(s_path, "w")
+            d_record = {"op" : "branch"}
+            d_record.update(d_header)
+            self._write(d_record)
+            self.fsync()
+        else:
+            self.f = open(s_path, "a")
+
+    def close(self):
+        """Close the journal, forgetting what was journaled."""
+        if self.f != None:
+            self.f.close()
+        self.f = None
+        self.d_synced = {}
+        self.n_current = -1
+
+    def fsync(self):
+        """Make sure all records are on disk."""
+        if self.f != None:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+
+    def add_checkpoint(self, n_index):
+        """Journal the creation of checkpoint n_index (with empty history)."""
+        self._write({"op" : "checkpoint", "index" : n_index})
+        self.d_synced[n_index] = (0, 0)
+        self.n_current = n_index
+
+    def remove_checkpoint(self, n_index):
+        """Journal the removal of checkpoint n_index (and the renumbering of
+        the later ones)."""
+        self._write({"op" : "remove", "index" : n_index})
+        self.d_synced = _remove_index(self.d_synced, n_index)
+        self.n_current = _index_after_removal(self.n_current, n_index)
+
+    def set_current(self, n_index):
+        """Journal that checkpoint n_index is the current one."""
+        if n_index != self.n_current:
+            self._write({"op" : "current", "index" : n_index})
+            self.n_current = n_index
+
+    def mark_synced(self, n_index, l_history):
+        """Record that the History of checkpoint n_index is already in the
+        journal (e.g. just after loading it)."""
+        self.d_synced[n_index] = (len(l_history), l_history.fingerprint())
+
+    def sync(self, n_index, l_history):
+        """Journal the History of checkpoint n_index, if it changed.  When
+        commands were only appended, just those are written."""
+        t_now = (len(l_history), l_history.fingerprint())
+        t_synced = self.d_synced.get(n_index)
+        if t_now == t_synced:
+            return
+        if t_synced != None and t_synced[0] < t_now[0] and \
+           l_history.prefix(t_synced[0]).fingerprint() == t_synced[1]:
+            self._write({"op" : "append", "index" : n_index,
+                         "runs" : _encode_runs(l_history[t_synced[0]:])})
+        else:
+            self._write({"op" : "history", "index" : n_index,
+                         "runs" : _encode_runs(l_history)})
+        self.d_synced[n_index] = t_now
+
+    def _write(self, d_record):
+        if self.f == None:
+            return
+        self.f.write(json.dumps(d_record, separators=(",", ":")) + "\n")
+        self.f.flush()
+
+def load(s_path, fnc_decode_cmd):
+    """Read the journal at s_path.  Returns (d_header, d_histories,
+    n_current), where d_histories maps each checkpoint index to its
+    History, and n_current is the current checkpoint index (or -1).
+    fnc_decode_cmd turns the result of FredCommand.to_list() back into a
+    FredCommand.  Returns None if there is no journal."""
+    if not os.path.exists(s_path):
+        return None
+    d_header = {}
+    d_histories = {}
+    n_current = -1
+    f = open(s_path)
+    for s_line in f:
+        try:
+            d_record = json.loads(s_line)
+            s_op = d_record["op"]
+            n_index = d_record.get("index")
+            if s_op == "branch":
+                d_header = d_record
+            elif s_op == "checkpoint":
+                d_histories[n_index] = fredhistory.History()
+                n_current = n_index
+            elif s_op == "current":
+                n_current = n_index
+            elif s_op == "remove":
+                d_histories = _remove_index(d_histories, n_index)
+                n_current = _index_after_removal(n_current, n_index)
+            elif s_op == "append":
+                _decode_runs(d_record["runs"], fnc_decode_cmd,
+                             d_histories[n_index])
+            elif s_op == "history":
+                d_histories[n_index] = \
+                    _decode_runs(d_record["runs"], fnc_decode_cmd,
+                                 fredhistory.History())
+        except (ValueError, KeyError, TypeError):
+            # Only the last record can be torn by a crash.
+            fredutil.fred_warning("Ignoring malformed history journal "
+                                  "record: %s" % s_line.strip())
+            break
+    f.close()
+    return (d_header, d_histories, n_current)
+
+def _remove_index(d_by_index, n_index):
+    """Return a copy of the dict keyed by checkpoint index without n_index,
+    and with the later indexes renumbered to fill the gap."""
+    d_new = {}
+    for (n, value) in d_by_index.items():
+        if n < n_index:
+            d_new[n] = value
+        elif n > n_index:
+            d_new[n - 1] = value
+    return d_new
+
+def _index_after_removal(n_current, n_index):
+    """Return the index of the current checkpoint after checkpoint n_index
+    was removed (see Branch.remove_checkpoint())."""
+    if n_current > n_index:
+        return n_current - 1
+    if n_current == n_index:
+        return max(0, n_index - 1)
+    return n_current
+
+def encode_history(l_history):
+    """Return the History as a JSON-serializable list of runs, as in the
+    journal (e.g. to pass it to another process)."""
+    return _encode_runs(l_history)
+
+def decode_history(l_runs, fnc_decode_cmd):
+    """Return the History encoded by encode_history()."""
+    return _decode_runs(l_runs, fnc_decode_cmd, fredhistory.History())
+
+def _encode_runs(l_history):
+    return [[proto.to_list(), n] for (proto, n) in l_history.runs()]
+
+def _decode_runs(l_runs, fnc_decode_cmd, l_history):
+    """Append the encoded runs to the given History, and return it."""
+    for (l_cmd, n) in l_runs:
+        l_history.append(fnc_decode_cmd(l_cmd), n)
+    return l_history
@@ -0,0 +1,253 @@
+###############################################################################
+# Copyright (C) 2009, 2010, 2011, 2012 by Kapil Arya, Gene Cooperman,         #
+#                                        Tyler Denniston, and Ana-Maria Visan #
+# {kapil,gene,tyler,amvisan}@ccs.neu.edu                                      #
+#                                                                             #
+# This file is part of FReD.                                                  #
+#                                                                             #
+# FReD is free software: you can redistribute it and/or modify                #
+# it under the terms of the GNU General Public License as published by        #
+# the Free Software Foundation, either version 3 of the License, or           #
+# (at your option) any later version.                                         #
+#                                                                             #
+# FReD is distributed in the hope that it will be useful,                     #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of              #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the               #
+# GNU General Public License for more details.                                #
+#                                                                             #
+# You should have received a copy of the GNU General Public License           #
+# along with FReD.  If not, see <http://www.gnu.org/licenses/>.               #
+###############################################################################
+
+"""
+This file contains a reader of the synchronization log written by
+fredhijack.so (record-replay/log.h), and the LogIndex class, a columnar
+index of its entries:  for entry i, the clone id of its thread, its event
+id and its return value.  The index answers questions such as "which
+pthread_mutex_lock events did thread T perform between entries a and b"
+without restarting the inferior.
+
+The log holds variable-sized entries:  a log_entry_header_t, followed by
+the log_event_<name>_t of the event unless it has no fields and returned
+0.  The payload sizes depend on the compiled wrappers, so they are read
+once from 'fred_read_log --event-table' (see EventTable).
+
+NumPy is used for the columns and queries if it is installed, the array
+module otherwise.
+"""
+
+import array
+import mmap
+import os
+import struct
+import subprocess
+
+import fredutil
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# LogMetadata, at the start of the log file:
+#   size_t size, dataSize, numEntries, numThreads;
+#   void *recordedStartAddr, *recordedSharedInterfaceInfoMapAddr;
+GS_METADATA_FORMAT = "@LLLLPP"
+GL_METADATA_FIELDS = ["size", "data_size", "num_entries", "num_threads",
+                      "recorded_start_addr", "recorded_shared_info_addr"]
+# The entries start LOG_OFFSET_FROM_START (a page) into the file:
+GN_LOG_OFFSET = mmap.PAGESIZE
+# log_entry_header_t is a 32-bit word of bitfields, allocated from the low
+# bits:  event (8), isOptional (3), retvalZero (1), cloneId (20).
+GS_HEADER_FORMAT = "@I"
+GN_HEADER_SIZE = struct.calcsize(GS_HEADER_FORMAT)
+GN_EVENT_BITS = 8
+GN_IS_OPTIONAL_BITS = 3
+GN_RETVAL_ZERO_SHIFT = GN_EVENT_BITS + GN_IS_OPTIONAL_BITS
+GN_CLONE_ID_SHIFT = GN_RETVAL_ZERO_SHIFT + 1
+# Every log_event_<name>_t starts with 'int savedErrno; void* retval;':
+GN_RETVAL_OFFSET = struct.calcsize("@i0P")
+GS_RETVAL_FORMAT = "@l"
+
+def synchronization_log_path(s_dmtcp_tmpdir, n_virtual_pid):
+    """Return the path of the synchronization log of the given process
+    (RECORD_LOG_PATH)."""
+    return "%s/synchronization-log-%d" % (s_dmtcp_tmpdir, n_virtual_pid)
+
+class EventTable():
+    """The events known to fredhijack.so, indexed by event id:  the name,
+    number of fields besides the return value, and payload size of each."""
+    def __init__(self, l_events):
+        """l_events is a list of (name, number of fields, payload size),
+        in event id order."""
+        self.l_names = [t[0] for t in l_events]
+        self.l_num_fields = [t[1] for t in l_events]
+        self.l_sizes = [t[2] for t in l_events]
+        self.d_ids = dict([(s_name, n_id)
+                           for (n_id, s_name) in enumerate(self.l_names)])
+
+    def __len__(self):
+        return len(self.l_names)
+
+    def event_id(self, s_name):
+        """Return the id of the named event, or -1 if there is none."""
+        return self.d_ids.get(s_name, -1)
+
+    def event_name(self, n_id):
+        return self.l_names[n_id]
+
+    def has_payload(self, n_id, b_retval_zero):
+        """Return True if an entry of event n_id is followed by its
+        log_event_<name>_t (getEntrySize() in log.cpp)."""
+        return self.l_num_fields[n_id] > 0 or not b_retval_zero
+
+def load_event_table(s_fred_read_log):
+    """Return the EventTable printed by 'fred_read_log --event-table', or
+    None if it cannot be read."""
+    try:
+        p = subprocess.Popen([s_fred_read_log, "--event-table"],
+                             stdout=subprocess.PIPE)
+        s_output = p.communicate()[0]
+    except OSError as e:
+        fredutil.fred_debug("Cannot run '%s': %s" % (s_fred_read_log, e))
+        return None
+    if p.returncode != 0:
+        return None
+    l_events = []
+    for s_line in s_output.splitlines():
+        l_fields = s_line.split()
+        fredutil.fred_assert(fredutil.to_int(l_fields[0]) == len(l_events))
+        l_events.append((l_fields[1], fredutil.to_int(l_fields[2]),
+                         fredutil.to_int(l_fields[3])))
+    return EventTable(l_events)
+
+def _column(l_values):
+    """Return l_values as a column of the index."""
+    if numpy != None:
+        return numpy.array(l_values, dtype=numpy.int64)
+    return array.array("l", l_values)
+
+class LogIndex():
+    """The entries of one synchronization log, as four columns:
+    l_entries (entry index), l_clone_ids, l_events (event id) and
+    l_retvals.  The log is read once, through a read-only mapping; a log
+    still being written by the inferior is indexed up to its current
+    numEntries."""
+    def __init__(self, s_path, event_table):
+        self.s_path = s_path
+        self.event_table = event_table
+        self.d_metadata = None
+        self.l_entries = _column([])
+        self.l_clone_ids = _column([])
+        self.l_events = _column([])
+        self.l_retvals = _column([])
+        self._read()
+
+    def __len__(self):
+        return len(self.l_entries)
+
+    def _read(self):
+        fd = os.open(self.s_path, os.O_RDONLY)
+        try:
+            n_file_size = os.fstat(fd).st_size
+            if n_file_size < GN_LOG_OFFSET:
+                fredutil.fred_debug("Log '%s' has no metadata." % self.s_path)
+                return
+            m = mmap.mmap(fd, 0, mmap.MAP_SHARED, mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        try:
+            self.d_metadata = dict(zip(GL_METADATA_FIELDS,
+                                       struct.unpack_from(GS_METADATA_FORMAT,
+                                                          m, 0)))
+            self._index_entries(m, min(GN_LOG_OFFSET +
+                                       self.d_metadata["data_size"],
+                                       n_file_size))
+        finally:
+            m.close()
+
+    def _index_entries(self, m, n_end):
+        """Walk the entries of the log mapped at m, up to offset n_end."""
+        n_num_entries = self.d_metadata["num_entries"]
+        l_clone_ids = []
+        l_events = []
+        l_retvals = []
+        n_offset = GN_LOG_OFFSET
+        while len(l_events) < n_num_entries and \
+                  n_offset + GN_HEADER_SIZE <= n_end:
+            n_header = struct.unpack_from(GS_HEADER_FORMAT, m, n_offset)[0]
+            n_clone_id = n_header >> GN_CLONE_ID_SHIFT
+            if n_clone_id == 0:
+                # End of the log.
+                break
+            n_event = n_header & ((1 << GN_EVENT_BITS) - 1)
+            b_retval_zero = (n_header >> GN_RETVAL_ZERO_SHIFT) & 1 == 1
+            if n_event >= len(self.event_table):
+                fredutil.fred_error("Unknown event %d in log entry %d of "
+                                    "'%s'." % (n_event, len(l_events),
+                                               self.s_path))
+                break
+            n_offset += GN_HEADER_SIZE
+            n_retval = 0
+            if self.event_table.has_payload(n_event, b_retval_zero):
+                if not b_retval_zero:
+                    n_retval = struct.unpack_from(GS_RETVAL_FORMAT, m,
+                                                  n_offset +
+                                                  GN_RETVAL_OFFSET)[0]
+                n_offset += self.event_table.l_sizes[n_event]
+            l_clone_ids.append(n_clone_id)
+            l_events.append(n_event)
+            l_retvals.append(n_retval)
+        fredutil.fred_debug("Indexed %d of %d entries of '%s'." %
+                            (len(l_events), n_num_entries, self.s_path))
+        self.l_entries = _column(range(len(l_events)))
+        self.l_clone_ids = _column(l_clone_ids)
+        self.l_events = _column(l_events)
+        self.l_retvals = _column(l_retvals)
+
+    def clone_id(self, n_entry):
+        """Return the clone id of the thread of entry n_entry."""
+        return int(self.l_clone_ids[n_entry])
+
+    def event_name(self, n_entry):
+        """Return the name of the event of entry n_entry."""
+        return self.event_table.event_name(int(self.l_events[n_entry]))
+
+    def retval(self, n_entry):
+        """Return the return value of entry n_entry."""
+        return int(self.l_retvals[n_entry])
+
+    def threads(self, n_first=0, n_last=None):
+        """Return the sorted clone ids of the threads with entries in
+        [n_first, n_last)."""
+        n_last = len(self) if n_last == None else min(n_last, len(self))
+        l_clone_ids = self.l_clone_ids[n_first:n_last]
+        if numpy != None:
+            return [int(n) for n in numpy.unique(l_clone_ids)]
+        return sorted(set(l_clone_ids))
+
+    def events(self, n_clone_id=None, l_event_names=None,
+               n_first=0, n_last=None):
+        """Return the indices of the entries in [n_first, n_last) of thread
+        n_clone_id (any thread if None) whose event is one of
+        l_event_names (any event if None)."""
+        n_last = len(self) if n_last == None else min(n_last, len(self))
+        n_first = max(0, n_first)
+        if n_first >= n_last:
+            return []
+        s_event_ids = None
+        if l_event_names != None:
+            s_event_ids = set([self.event_table.event_id(s_name)
+                               for s_name in l_event_names])
+        if numpy != None:
+            b_mask = numpy.ones(n_last - n_first, dtype=bool)
+            if n_clone_id != None:
+                b_mask &= self.l_clone_ids[n_first:n_last] == n_clone_id
+            if s_event_ids != None:
+                b_mask &= numpy.in1d(self.l_events[n_first:n_last],
+                                     list(s_event_ids))
+            return [int(n) for n in self.l_entries[n_first:n_last][b_mask]]
+        return [n for n in xrange(n_first, n_last)
+                if (n_clone_id == None or
+                    self.l_clone_ids[n] == n_clone_id) and
+                   (s_event_ids == None or self.l_events[n] in s_event_ids)]
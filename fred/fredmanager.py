@@ -20,6 +20,8 @@
 ###############################################################################
 
 import fredutil
+import fredshm
+import fredlog
 import dmtcpmanager
 
 import glob
@@ -29,10 +31,14 @@ import signal
 
 GS_FREDHIJACK_NAME = "fredhijack.so"
 GS_FREDHIJACK_PATH = ""
+GS_FRED_READ_LOG_NAME = "fred_read_log"
 
-g_child_subprocess = None
 gn_real_inferior_pid = -1
 gn_virtual_inferior_pid = -1
+# The fredlog.EventTable of fredhijack.so, and the fredlog.LogIndex of the
+# inferior's log (read on first use):
+g_event_table = None
+g_log_index = None
 
 def reset_real_inferior_pid(n_gdb_pid):
     global gn_real_inferior_pid
@@ -47,8 +53,10 @@ def get_real_inferior_pid():
 
 def set_virtual_inferior_pid(n_pid):
     """Set the virtual pid of the inferior."""
-    global gn_virtual_inferior_pid
+    global gn_virtual_inferior_pid, g_log_index
     fredutil.fred_debug("Setting virtual inferior pid to %d." % n_pid)
+    if n_pid != gn_virtual_inferior_pid:
+        g_log_index = None
     gn_virtual_inferior_pid = n_pid
 
 def get_virtual_inferior_pid():
@@ -99,100 +107,100 @@ def set_fredhijack_path(s_path):
     global GS_FREDHIJACK_PATH
     GS_FREDHIJACK_PATH = s_path
 
-def _execute_fred_command(s_cmd, s_arg=None):
-    """Execute the given fred_command command and return its output."""
-    global g_child_subprocess
-    fredutil.fred_assert(s_cmd in ["status", "info", "break", "continue"])
-    l_cmd = ["%s/fred_command" % GS_FREDHIJACK_PATH]
+def get_fred_read_log_path():
+    """Return the path to fred_read_log (built with fredhijack.so)."""
+    global GS_FREDHIJACK_PATH, GS_FRED_READ_LOG_NAME
+    return os.path.join(GS_FREDHIJACK_PATH, GS_FRED_READ_LOG_NAME)
+
+def get_log_index():
+    """Return the fredlog.LogIndex of the inferior's synchronization log, or
+    None if it cannot be read.  The index is kept for the inferior, and
+    rebuilt when the log has more entries than it (while recording, the
+    log keeps growing)."""
+    global g_event_table, g_log_index
+    if g_log_index != None:
+        n_total = get_total_entries()
+        if n_total == None or n_total <= len(g_log_index):
+            return g_log_index
+        fredutil.fred_debug("Log has grown from %d to %d entries: "
+                            "reindexing." % (len(g_log_index), n_total))
+        g_log_index = None
+    if g_event_table == None:
+        g_event_table = fredlog.load_event_table(get_fred_read_log_path())
+        if g_event_table == None:
+            fredutil.fred_warning("Cannot read the event table of "
+                                  "fred_read_log.")
+            return None
+    fredutil.fred_assert(get_virtual_inferior_pid() != -1)
+    s_path = fredlog.synchronization_log_path(os.environ["DMTCP_TMPDIR"],
+                                              get_virtual_inferior_pid())
+    try:
+        g_log_index = fredlog.LogIndex(s_path, g_event_table)
+    except EnvironmentError as e:
+        fredutil.fred_warning("Cannot read the log '%s': %s" % (s_path, e))
+        return None
+    return g_log_index
+
+def _fred_shm():
+    """Return the FredShm of the inferior."""
     fredutil.fred_assert(get_virtual_inferior_pid() != -1)
-    s_path = "%s/fred-shm.%d" % (os.environ["DMTCP_TMPDIR"],
-                                 get_virtual_inferior_pid())
-    l_cmd.append("--%s" % s_cmd)
-    if s_arg != None:
-        l_cmd.append(s_arg)
-    l_cmd.append(s_path)
-    fredutil.fred_debug("Executing fred_command: %s" % l_cmd)
-    if s_cmd == "break":
-        fredutil.fred_assert(g_child_subprocess == None)
-        g_child_subprocess = fredutil.execute_background_shell_command(l_cmd)
-        s_output = ""
-    else:
-        s_output = fredutil.execute_shell_command(l_cmd)
-    return s_output
+    return fredshm.FredShm(
+        fredshm.shm_file_path(os.environ["DMTCP_TMPDIR"],
+                              get_virtual_inferior_pid()))
+
+def _read_fred_info(s_field):
+    """Return the given field of the inferior's fred-shm file (see
+    fredshm.GL_INFO_FIELDS), or None if it cannot be read."""
+    d_info = _fred_shm().read_info()
+    if d_info == None:
+        return None
+    fredutil.fred_debug("FReD %s is: %d" % (s_field, d_info[s_field]))
+    return d_info[s_field]
 
 def destroy():
     """Perform any cleanup associated with the fred manager."""
     global gn_real_inferior_pid
-    g_child_subprocess = None
     gn_real_inferior_pid = -1
     set_virtual_inferior_pid(-1)
 
 def set_fred_breakpoint(n_index):
     """Set a FReD internal breakpoint on entry index n_index."""
-    _execute_fred_command("break", str(n_index))
+    fredutil.fred_debug("Setting FReD breakpoint on entry %d." % n_index)
+    _fred_shm().set_breakpoint(n_index)
 
 def wait_on_fred_breakpoint():
     """Blocking wait until a FReD internal breakpoint is hit."""
-    global g_child_subprocess
-    fredutil.fred_assert(g_child_subprocess != None)
-    g_child_subprocess.communicate()
-    g_child_subprocess = None
+    _fred_shm().wait_on_breakpoint()
 
 def send_fred_continue():
     """Send FReD internal continue command."""
-    _execute_fred_command("continue")
+    _fred_shm().clear_breakpoint()
 
 def get_current_thread():
     """Return the clone id of the current entry's thread."""
-    s_clone_id_re = "Current clone id = (\d+)"
-    s_output = _execute_fred_command("status")
-    m = re.search(s_clone_id_re, s_output)
-    if m != None:
-        fredutil.fred_debug("Current clone id is: %d" % int(m.group(1)))
-        return int(m.group(1))
-    else:
-        return None
+    return _read_fred_info("current_clone_id")
 
 def get_current_entry_index():
     """Return the index of the current entry."""
-    s_index_re = "Current entry index = (\d+)"
-    s_output = _execute_fred_command("status")
-    m = re.search(s_index_re, s_output)
-    if m != None:
-        fredutil.fred_debug("Current entry index is: %d" % int(m.group(1)))
-        return int(m.group(1))
-    else:
-        return None
+    return _read_fred_info("current_log_entry_index")
 
 def get_total_entries():
     """Return the total number of log entries."""
-    s_total_entries_re = "Total number of log entries = (\d+)"
-    s_output = _execute_fred_command("info")
-    m = re.search(s_total_entries_re, s_output)
-    if m != None:
-        fredutil.fred_debug("Total entries are: %d" % int(m.group(1)))
-        return int(m.group(1))
-    else:
-        return None
+    return _read_fred_info("total_entries")
 
 def get_total_threads():
     """Return the total number of log threads."""
-    s_total_threads_re = "Total number of threads = (\d+)"
-    s_output = _execute_fred_command("info")
-    m = re.search(s_total_threads_re, s_output)
-    if m != None:
-        fredutil.fred_debug("Total threads are: %d" % int(m.group(1)))
-        return int(m.group(1))
-    else:
-        return None
+    return _read_fred_info("total_threads")
 
 def current_fred_state():
     """Return a FredState instance representing the current FReD state."""
     state = FredState()
-    state.set_total_entries(get_total_entries())
-    state.set_total_threads(get_total_threads())
-    state.set_current_entry(get_current_entry_index())
-    state.set_current_thread(get_current_thread())
+    d_info = _fred_shm().read_info()
+    if d_info != None:
+        state.set_total_entries(d_info["total_entries"])
+        state.set_total_threads(d_info["total_threads"])
+        state.set_current_entry(d_info["current_log_entry_index"])
+        state.set_current_thread(d_info["current_clone_id"])
     return state
 
 class FredState:
@@ -0,0 +1,126 @@
+###############################################################################
+# Copyright (C) 2009, 2010, 2011, 2012 by Kapil Arya, Gene Cooperman,         #
+#                                        Tyler Denniston, and Ana-Maria Visan #
+# {kapil,gene,tyler,amvisan}@ccs.neu.edu                                      #
+#                                                                             #
+# This file is part of FReD.                                                  #
+#                                                                             #
+# FReD is free software: you can redistribute it and/or modify                #
+# it under the terms of the GNU General Public License as published by        #
+# the Free Software Foundation, either version 3 of the License, or           #
+# (at your option) any later version.                                         #
+#                                                                             #
+# FReD is distributed in the hope that it will be useful,                     #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of              #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the               #
+# GNU General Public License for more details.                                #
+#                                                                             #
+# You should have received a copy of the GNU General Public License           #
+# along with FReD.  If not, see <http://www.gnu.org/licenses/>.               #
+###############################################################################
+
+"""
+This file contains the FredShm class, an in-process client of the fred-shm
+file through which fredhijack.so publishes the state of a replay
+(record-replay/fred_interface.h).  It does what record-replay/fred_command
+does, without starting a process for each request.
+
+Log breakpoints are a polled flag, as on the fredhijack.so side:  the
+replaying thread which reaches the breakpoint entry sets
+breakpoint_at_index to GN_BREAKPOINT_HIT, and every thread then waits
+until it is GN_NO_BREAKPOINT again.
+"""
+
+import mmap
+import os
+import struct
+import time
+
+import fredutil
+
+# Layout of fred_interface_info_t, in native byte order and alignment:
+#   clone_id_t current_clone_id;           (long)
+#   size_t     current_log_entry_index;
+#   size_t     total_entries;
+#   size_t     total_threads;
+#   ssize_t    breakpoint_at_index;
+GS_INFO_FORMAT = "@lLLLl"
+GL_INFO_FIELDS = ["current_clone_id", "current_log_entry_index",
+                  "total_entries", "total_threads", "breakpoint_at_index"]
+GN_INFO_SIZE = struct.calcsize(GS_INFO_FORMAT)
+GN_BREAKPOINT_OFFSET = struct.calcsize("@lLLL")
+GS_BREAKPOINT_FORMAT = "@l"
+# Values of breakpoint_at_index (FRED_INTERFACE_NO_BP, FRED_INTERFACE_BP_HIT):
+GN_NO_BREAKPOINT = -1
+GN_BREAKPOINT_HIT = -2
+# Polling interval while waiting on a log breakpoint:
+GF_POLL_SECONDS = 0.0001
+
+def shm_file_path(s_dmtcp_tmpdir, n_virtual_pid):
+    """Return the path of the fred-shm file of the given process
+    (FRED_INTERFACE_SHM_FILE_FMT)."""
+    return "%s/fred-shm.%d" % (s_dmtcp_tmpdir, n_virtual_pid)
+
+class FredShm():
+    """The fred-shm file of one replaying process.  The file is mapped
+    anew for each request, since a restart recreates it."""
+    def __init__(self, s_path):
+        self.s_path = s_path
+
+    def _map(self):
+        """Return a shared, writable mmap of the file."""
+        fd = os.open(self.s_path, os.O_RDWR)
+        try:
+            return mmap.mmap(fd, GN_INFO_SIZE, mmap.MAP_SHARED,
+                             mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+
+    def read_info(self):
+        """Return a dict of the fields of fred_interface_info_t (see
+        GL_INFO_FIELDS), or None if the file cannot be read."""
+        try:
+            m = self._map()
+        except EnvironmentError as e:
+            fredutil.fred_debug("Cannot map '%s': %s" % (self.s_path, e))
+            return None
+        try:
+            l_values = struct.unpack(GS_INFO_FORMAT, m[:GN_INFO_SIZE])
+        finally:
+            m.close()
+        return dict(zip(GL_INFO_FIELDS, l_values))
+
+    def _write_breakpoint(self, n_value):
+        m = self._map()
+        try:
+            m[GN_BREAKPOINT_OFFSET:GN_INFO_SIZE] = \
+                struct.pack(GS_BREAKPOINT_FORMAT, n_value)
+        finally:
+            m.close()
+
+    def _read_breakpoint(self, m):
+        return struct.unpack(GS_BREAKPOINT_FORMAT,
+                             m[GN_BREAKPOINT_OFFSET:GN_INFO_SIZE])[0]
+
+    def set_breakpoint(self, n_index):
+        """Set the log breakpoint on entry index n_index."""
+        self._write_breakpoint(n_index)
+
+    def clear_breakpoint(self):
+        """Remove the log breakpoint, letting a paused replay continue."""
+        self._write_breakpoint(GN_NO_BREAKPOINT)
+
+    def wait_on_breakpoint(self, f_timeout=None):
+        """Block until the log breakpoint is hit.  Return False if f_timeout
+        seconds passed first."""
+        global GF_POLL_SECONDS
+        m = self._map()
+        try:
+            f_start = time.time()
+            while self._read_breakpoint(m) != GN_BREAKPOINT_HIT:
+                if f_timeout != None and time.time() - f_start > f_timeout:
+                    return False
+                time.sleep(GF_POLL_SECONDS)
+            return True
+        finally:
+            m.close()
@@ -0,0 +1,129 @@
+###############################################################################
+# Copyright (C) 2009, 2010, 2011, 2012 by Kapil Arya, Gene Cooperman,         #
+#                                        Tyler Denniston, and Ana-Maria Visan #
+# {kapil,gene,tyler,amvisan}@ccs.neu.edu                                      #
+#                                                                             #
+# This file is part of FReD.                                                  #
+#                                                                             #
+# FReD is free software: you can redistribute it and/or modify                #
+# it under the terms of the GNU General Public License as published by        #
+# the Free Software Foundation, either version 3 of the License, or           #
+# (at your option) any later version.                                         #
+#                                                                             #
+# FReD is distributed in the hope that it will be useful,                     #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of              #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the               #
+# GNU General Public License for more details.                                #
+#                                                                             #
+# You should have received a copy of the GNU General Public License           #
+# along with FReD.  If not, see <http://www.gnu.org/licenses/>.               #
+###############################################################################
+
+"""
+Helper commands loaded into gdb's embedded Python interpreter (with gdb's
+'source' command) by personalityGdb.py.  This file is never imported by
+FReD itself, and must run under whichever Python version gdb embeds.
+
+  fred-print-values EXPR1;;EXPR2;;...
+    Evaluate all expressions in one round trip, printing one frame per
+    expression:  "FRED-VALUE <index>: <value or error message>"
+
+  fred-state LIB1,LIB2,...
+    Print everything FReD needs to know about the current position as one
+    line:  "FRED-STATE <JSON object>", with the keys
+      running        True if the inferior has a stack
+      depth          number of frames on the stack
+      pc             pc of the newest frame
+      frame          newest frame with source information, as a dict with
+                     level, pc, function, file and line (or None)
+      user_code      True unless 'frame' is in one of the given libraries
+      at_breakpoint  True if 'frame' is at the line of an enabled breakpoint
+      threads        gdb thread numbers, highest first (as 'info threads')
+      thread         number of the selected thread (or None)
+"""
+
+import json
+
+import gdb
+
+GS_SEPARATOR = ";;"
+GS_FRAME_FORMAT = "FRED-VALUE %d: %s\n"
+GS_STATE_FORMAT = "FRED-STATE %s\n"
+
+class FredPrintValues(gdb.Command):
+    """Print the values of several expressions, separated by ';;'."""
+
+    def __init__(self):
+        gdb.Command.__init__(self, "fred-print-values", gdb.COMMAND_DATA)
+
+    def invoke(self, s_args, b_from_tty):
+        ls_exprs = s_args.split(GS_SEPARATOR)
+        for i in range(len(ls_exprs)):
+            try:
+                s_val = str(gdb.parse_and_eval(ls_exprs[i].strip()))
+            except gdb.error as e:
+                s_val = str(e)
+            gdb.write(GS_FRAME_FORMAT % (i, s_val))
+
+class FredState(gdb.Command):
+    """Print a snapshot of the debugger state as one JSON line."""
+
+    def __init__(self):
+        gdb.Command.__init__(self, "fred-state", gdb.COMMAND_STATUS)
+
+    def invoke(self, s_args, b_from_tty):
+        ls_blacklist = [x for x in s_args.strip().split(",") if x != ""]
+        d_state = {"running" : False, "depth" : 0, "pc" : None,
+                   "frame" : None, "user_code" : True,
+                   "at_breakpoint" : False, "threads" : [], "thread" : None}
+        try:
+            l_threads = gdb.selected_inferior().threads()
+            d_state["threads"] = sorted([t.num for t in l_threads],
+                                        reverse=True)
+            if gdb.selected_thread() != None:
+                d_state["thread"] = gdb.selected_thread().num
+            frame = gdb.newest_frame()
+        except gdb.error:
+            # "No stack."
+            gdb.write(GS_STATE_FORMAT % json.dumps(d_state))
+            return
+        d_state["running"] = True
+        d_state["pc"] = frame.pc()
+        n_level = 0
+        while frame != None:
+            sal = frame.find_sal()
+            if d_state["frame"] == None and sal.symtab != None:
+                d_state["frame"] = {"level" : n_level, "pc" : frame.pc(),
+                                    "function" : frame.name(),
+                                    "file" : sal.symtab.filename,
+                                    "line" : sal.line}
+            n_level += 1
+            frame = frame.older()
+        d_state["depth"] = n_level
+        d_frame = d_state["frame"]
+        if d_frame != None:
+            s_solib = gdb.solib_name(d_frame["pc"])
+            d_state["user_code"] = s_solib == None or \
+                len([x for x in ls_blacklist if x in s_solib]) == 0
+            d_state["at_breakpoint"] = _at_breakpoint(d_frame["file"],
+                                                      d_frame["line"])
+        gdb.write(GS_STATE_FORMAT % json.dumps(d_state))
+
+def _at_breakpoint(s_file, n_line):
+    """Return True if an enabled breakpoint is set at s_file:n_line."""
+    for bp in gdb.breakpoints() or []:
+        if not bp.enabled or bp.type != gdb.BP_BREAKPOINT or \
+           bp.location == None:
+            continue
+        try:
+            l_sals = gdb.decode_line(bp.location)[1] or []
+        except gdb.error:
+            continue
+        for sal in l_sals:
+            if sal.symtab != None and sal.symtab.filename == s_file and \
+               sal.line == n_line:
+                return True
+    return False
+
+FredPrintValues()
+FredState()
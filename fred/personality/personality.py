@@ -34,6 +34,9 @@ class Personality:
         self.GS_STEP = None
         self.GS_CONTINUE = None
         self.GS_BREAKPOINT = None
+        self.GS_DELETE = None
+        self.GS_DISABLE = None
+        self.GS_ENABLE = None
         self.GS_WHERE = None
         self.GS_INFO_BREAKPOINTS = None
         self.GS_INFO_THREADS = None
@@ -45,7 +48,18 @@ class Personality:
         self.gs_next_re = None
         self.gs_step_re = None
         self.gs_continue_re = None
+        self.gs_breakpoint_re = None
+        self.gs_delete_re = None
+        self.gs_disable_re = None
+        self.gs_enable_re = None
+        self.gs_where_re = None
+        self.gs_info_breakpoints_re = None
+        self.gs_print_re = None
         self.gs_program_not_running_re = None
+        # List of regexes matching commands which only inspect the debugger
+        # (and so cannot change its breakpoints). The where, print and info
+        # breakpoints regexes above are always included.
+        self.ls_inspection_re = []
 
         self.GS_PROMPT = None
         self.gre_prompt = None
@@ -57,6 +71,13 @@ class Personality:
         # Things like 'next 5' are allowed:
         self.b_has_count_commands = False
         self.b_coalesce_support = False
+        # Runs of 'continue' stopping at the same breakpoint may be replayed
+        # as one 'continue N' (see History.coalesced()):
+        self.b_coalesce_continue_support = False
+        # Counting watchpoints are supported (see set_counting_watchpoint()):
+        self.b_watchpoint_support = False
+        # stack_depth() is cheaper than get_backtrace():
+        self.b_stack_depth_support = False
         # List index which is the topmost frame in a backtrace. Will be 0 for
         # gdb and -1 for python, because of the way they order their
         # backtraces. -2 is to check for initialization.
@@ -71,6 +92,12 @@ class Personality:
         """Return a Backtrace object representing the current backtrace."""
         return self._parse_backtrace(self.do_where())
 
+    def stack_depth(self):
+        """Return the number of frames on the stack.  Personalities with a
+        cheaper way to get it than parsing a backtrace override this, and
+        must count the frames the same way at every position."""
+        return self.get_backtrace().depth()
+
     def get_breakpoints(self):
         """Return a list of Breakpoint objects for the current breakpoints."""
         return self._parse_breakpoints(self.do_info_breakpoints())
@@ -129,27 +156,32 @@ class Personality:
         fredutil.fred_assert(False, "Must be implemented in subclass.")
         
     def execute_command(self, s_cmd, b_timeout=False, b_prompt=True,
-                        b_drain_first=False):
-        """Send the given string to debugger and return its output."""
+                        b_drain_first=False, n_timeout=None):
+        """Send the given string to debugger and return its output.
+        If b_timeout, give up waiting for the prompt after n_timeout seconds
+        (default fredio.GN_PROMPT_WAIT_TIMEOUT)."""
         # Ensure it has strictly one newline:
         s_cmd = s_cmd.strip() + "\n"
         return fredio.get_child_response(s_cmd, b_timeout=b_timeout,
                                          b_wait_for_prompt=b_prompt,
-                                         b_drain_first=b_drain_first)
+                                         b_drain_first=b_drain_first,
+                                         n_timeout=n_timeout)
 
-    def do_next(self, n, b_timeout_prompt):
+    def do_next(self, n, b_timeout_prompt, n_timeout=None):
         """Perform n 'next' commands. Returns output."""
         cmd = self.GS_NEXT
         if self.b_has_count_commands:
             cmd += " " + str(n)
-        return self.execute_command(cmd, b_timeout=b_timeout_prompt)
+        return self.execute_command(cmd, b_timeout=b_timeout_prompt,
+                                    n_timeout=n_timeout)
         
-    def do_step(self, n, b_timeout_prompt):
+    def do_step(self, n, b_timeout_prompt, n_timeout=None):
         """Perform n 'step' commands. Returns output."""
         cmd = self.GS_STEP
         if self.b_has_count_commands:
             cmd += " " + str(n)
-        return self.execute_command(cmd, b_timeout=b_timeout_prompt)
+        return self.execute_command(cmd, b_timeout=b_timeout_prompt,
+                                    n_timeout=n_timeout)
         
     def do_continue(self, b_wait_for_prompt):
         """Perform 'continue' command. Returns output."""
@@ -181,6 +213,40 @@ class Personality:
         return self.execute_command(self.GS_PRINT + " " + str(expr),
                                     b_drain_first=b_drain_first)
 
+    def do_print_batch(self, l_exprs):
+        """Print each expression of the list.  Returns the list of outputs,
+        one per expression.  Personalities able to print several
+        expressions in one round trip override this."""
+        return [self.do_print(s_expr, b_drain_first=True)
+                for s_expr in l_exprs]
+
+    def state_snapshot(self):
+        """Return a dict describing the current position (see
+        gdbhelper.py for its keys), fetched in one round trip, or None if
+        the personality cannot do that."""
+        return None
+
+    def set_counting_watchpoint(self, s_expr):
+        """Set a watchpoint on the location of s_expr which never stops the
+        inferior, but counts the changes of its value (see
+        counting_watchpoint_hits()).  Return its number, or -1 if the
+        personality (or the expression) does not support that."""
+        return -1
+
+    def counting_watchpoint_hits(self):
+        """Return the number of value changes seen by the counting
+        watchpoints since they were set, or -1 on error."""
+        fredutil.fred_assert(False, "Must be implemented in subclass.")
+
+    def delete_watchpoint(self, n_number):
+        """Delete the given watchpoint."""
+        fredutil.fred_assert(False, "Must be implemented in subclass.")
+
+    def source_line(self, s_file, n_line):
+        """Return the text of line n_line of source file s_file, or None if
+        the personality cannot list sources."""
+        return None
+
     def current_position(self):
         """Return a BacktraceFrame representing current debugger position."""
         fredutil.fred_assert(self.n_top_backtrace_frame != -2)
@@ -229,16 +295,38 @@ class Personality:
             cmd = freddebugger.fred_step_cmd()
             cmd.set_count_cmd(self.b_has_count_commands)
         elif re.search(self.gs_continue_re, s_command) != None:
+            # Not a count command: in gdb 'continue N' means to ignore the
+            # current breakpoint N-1 times, not N continues.
             cmd = freddebugger.fred_continue_cmd()
-            cmd.set_count_cmd(self.b_has_count_commands)
+        elif self._matches(self.gs_breakpoint_re, s_command):
+            cmd = freddebugger.fred_breakpoint_cmd()
+        elif self._matches(self.gs_delete_re, s_command):
+            cmd = freddebugger.fred_delete_cmd()
+        elif self._matches(self.gs_disable_re, s_command):
+            cmd = freddebugger.fred_disable_cmd()
+        elif self._matches(self.gs_enable_re, s_command):
+            cmd = freddebugger.fred_enable_cmd()
         else:
             cmd = freddebugger.fred_unknown_cmd()
         cmd.set_native(s_command.partition(' ')[0])
-        cmd.s_args = s_command.partition(' ')[2]
+        cmd.set_args(s_command.partition(' ')[2])
         if cmd.b_count_cmd and cmd.s_args != "":
             cmd.set_count(int(cmd.s_args))
         return cmd        
 
+    def _matches(self, s_re, s_command):
+        """Return True if the (possibly unset) regex s_re matches s_command."""
+        return s_re != None and re.search(s_re, s_command) != None
+
+    def is_inspection_command(self, s_command):
+        """Return True if the given command only inspects the debugger, and
+        so cannot change its breakpoints (e.g. 'where' or 'print')."""
+        for s_re in [self.gs_where_re, self.gs_print_re,
+                     self.gs_info_breakpoints_re] + self.ls_inspection_re:
+            if self._matches(s_re, s_command):
+                return True
+        return False
+
     def get_native(self, fred_cmd):
         """Return native representation of given FredCommand."""
         if fred_cmd.is_next():
@@ -247,6 +335,14 @@ class Personality:
             return self.GS_STEP
         elif fred_cmd.is_continue():
             return self.GS_CONTINUE
+        elif fred_cmd.is_breakpoint():
+            return self.GS_BREAKPOINT
+        elif fred_cmd.is_delete():
+            return self.GS_DELETE
+        elif fred_cmd.is_disable():
+            return self.GS_DISABLE
+        elif fred_cmd.is_enable():
+            return self.GS_ENABLE
         elif fred_cmd.is_switch_thread():
             return self.GS_SWITCH_THREAD
         else:
@@ -261,6 +357,12 @@ class Personality:
         Where $XX changes with each command executed."""
         fredutil.fred_assert(False, "Must be implemented in subclass.")
 
+    def stop_breakpoint(self, s_output):
+        """Return the number of the breakpoint which the given output of a
+        'continue' reports stopping at, or -1 if it stopped for any other
+        reason (or the personality cannot tell)."""
+        return -1
+
     def at_breakpoint(self, bt_frame, breakpoints):
         """Returns True if at a breakpoint"""
         for breakpoint in breakpoints:
@@ -20,6 +20,7 @@
 ###############################################################################
 
 import glob
+import json
 import os
 import personality
 import re
@@ -41,6 +42,12 @@ GL_LIBRARY_BLACKLIST_NAMES = ["dmtcphijack",
                               "libpthread-2"]
 gl_library_blacklist_code_ranges = []
 gs_inferior_name = ""
+# gdb Python helper defining the 'fred-print-values' and 'fred-state' commands:
+GS_HELPER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "gdbhelper.py")
+GS_PRINT_BATCH_SEPARATOR = ";;"
+# Convenience variable counting the hits of counting watchpoints:
+GS_WATCH_HITS_VAR = "$fred_watch_hits"
 
 class PersonalityGdb(personality.Personality):
     def __init__(self):
@@ -50,6 +57,9 @@ class PersonalityGdb(personality.Personality):
         self.GS_STEP = "step"
         self.GS_CONTINUE = "continue"
         self.GS_BREAKPOINT = "break"
+        self.GS_DELETE = "delete"
+        self.GS_DISABLE = "disable"
+        self.GS_ENABLE = "enable"
         self.GS_WHERE = "where"
         self.GS_INFO_BREAKPOINTS = "info breakpoints"
         self.GS_INFO_THREADS = "info threads"
@@ -57,16 +67,25 @@ class PersonalityGdb(personality.Personality):
         self.GS_FINISH = "finish"
         self.GS_CURRENT_POS = "where 1"
         self.GS_SWITCH_THREAD = "thread"
+        self.GS_PRINT_BATCH = "fred-print-values"
+        self.GS_STATE_SNAPSHOT = "fred-state"
+        # A GDB/MI command, usable from the CLI:
+        self.GS_STACK_DEPTH = 'interpreter-exec mi "-stack-info-depth"'
         
         self.gs_next_re = fredutil.getRE(self.GS_NEXT, 4) + "|^n$|^n\s+.*$"
         self.gs_step_re = fredutil.getRE(self.GS_STEP, 4) + "|^s$|^s\s+.*$"
         self.gs_continue_re = fredutil.getRE(self.GS_CONTINUE, 3) + "|^c$"
         self.gs_breakpoint_re = fredutil.getRE(self.GS_BREAKPOINT)
+        self.gs_delete_re = r"^d(e(l(e(t(e)?)?)?)?)?\b"
+        self.gs_disable_re = r"^dis(a(b(l(e)?)?)?)?\b"
+        self.gs_enable_re = r"^en(a(b(l(e)?)?)?)?\b"
         self.gs_where_re = fredutil.getRE(self.GS_WHERE, 3) + "|^bt"
         self.gs_info_breakpoints_re = \
             fredutil.getRE(self.GS_INFO_BREAKPOINTS, 5) + "|^i b"
         self.gs_print_re = fredutil.getRE(self.GS_PRINT, 5) + "|^p(/\w)?"
         self.gs_program_not_running_re = "No stack."
+        # 'info ...' and 'list' never change breakpoints:
+        self.ls_inspection_re = [r"^i(n(f(o)?)?)?\s", r"^l(i(s(t)?)?)?\b"]
         
         self.GS_PROMPT = "(gdb) "
         self.gre_prompt = re.compile("\(gdb\) $")
@@ -80,7 +99,11 @@ class PersonalityGdb(personality.Personality):
                               " in ([a-zA-Z0-9_]+)\s+at (" \
                               + fredutil.GS_FILE_PATH_RE + \
                               "):(\d+)\s+(?:breakpoint already hit " \
-                              "(\d+) time)?"
+                              "(\d+) times?\s+)?(?:Will ignore next " \
+                              "(\d+) crossings)?"
+        # Matches the report of a (non-temporary) breakpoint stopping the
+        # program, e.g. "Breakpoint 2, main () at test.c:5":
+        self.gre_stop_breakpoint = "^(?:Thread .+ hit )?Breakpoint (\d+), "
         # Matches gdb thread ids from "info threads":
         self.gre_thread = "^(\*?)\s*(\d+)\s*Thread"
         # List of regexes that match debugger prompts for user input
@@ -90,10 +113,15 @@ class PersonalityGdb(personality.Personality):
         # Things like 'next 5' are allowed:
         self.b_has_count_commands = True
         self.b_coalesce_support = True
+        self.b_coalesce_continue_support = True
+        self.b_watchpoint_support = True
+        self.b_stack_depth_support = True
         # Gdb orders backtraces with topmost at the beginning (list idx 0):
         self.n_top_backtrace_frame = 0
         # GDB only: name of inferior process.
         self.s_inferior_name = ""
+        # GDB only: True once the helper commands of gdbhelper.py are loaded.
+        self.b_helper_loaded = False
         
     def destroy(self):
         """Destroy any state associated with the Personality instance."""
@@ -123,17 +151,19 @@ class PersonalityGdb(personality.Personality):
         else:
             return m.group(1)
 
-    def do_step(self, n, b_timeout_prompt=False):
+    def do_step(self, n, b_timeout_prompt=False, n_timeout=None):
         """Override generic do_step() from personality.py so we can avoid
         stepping into libc, etc."""
         # If the 'step' results in an address of something that is outside of
         # the user's code, execute a 'finish', and replace the 'step' in
         # history with a 'next', so on replay only the next is executed.
         output = self.execute_command(self.GS_STEP + " " + str(n),
-                                      b_timeout=b_timeout_prompt)
+                                      b_timeout=b_timeout_prompt,
+                                      n_timeout=n_timeout)
         if not self.within_user_code():
             self.execute_command(self.GS_FINISH,
-                                 b_timeout=b_timeout_prompt)
+                                 b_timeout=b_timeout_prompt,
+                                 n_timeout=n_timeout)
             # TODO: Think of more portable way to do this:
             return "DO-NOT-STEP"
         return output
@@ -170,8 +200,18 @@ class PersonalityGdb(personality.Personality):
         breakpoint.s_file     = match_obj[6]
         breakpoint.n_line     = int(match_obj[7])
         breakpoint.n_count    = fredutil.to_int(match_obj[8])
+        breakpoint.n_ignore_count = fredutil.to_int(match_obj[9])
         return breakpoint
 
+    def stop_breakpoint(self, s_output):
+        """Override generic stop_breakpoint() from personality.py:  the
+        number gdb reports in "Breakpoint N, ..." when it stops there."""
+        l_numbers = re.findall(self.gre_stop_breakpoint, s_output,
+                               re.MULTILINE)
+        if len(l_numbers) == 0:
+            return -1
+        return int(l_numbers[-1])
+
     def set_inferior_name(self):
         """Set the inferior name to what 'info inferiors' tells us."""
         exp = "Local exec file:\s+`(.+?)'"
@@ -184,6 +224,114 @@ class PersonalityGdb(personality.Personality):
                                 "Is executable available?")
         self.s_inferior_name = match.group(1).strip()
 
+    def load_helper(self):
+        """Load the gdb Python helper commands, if gdb supports Python."""
+        global GS_HELPER_PATH
+        output = self.execute_command("source " + GS_HELPER_PATH)
+        self.b_helper_loaded = \
+            re.search("error|not supported|No such file", output,
+                      re.IGNORECASE) == None
+        if not self.b_helper_loaded:
+            fredutil.fred_debug("Could not load gdb helper: %s" % output)
+
+    def stack_depth(self):
+        """Override generic stack_depth() from personality.py to ask gdb
+        for the depth, instead of printing and parsing the whole stack.
+        Unlike a parsed backtrace, this counts frames without source
+        information too; the reverse algorithms only compare depths."""
+        output = self.execute_command(self.GS_STACK_DEPTH)
+        m = re.search(r'\^done,depth="(\d+)"', output)
+        if m != None:
+            return int(m.group(1))
+        if re.search(self.gs_program_not_running_re, output) != None:
+            return 0
+        fredutil.fred_debug("Unexpected -stack-info-depth output: %s" % output)
+        return personality.Personality.stack_depth(self)
+
+    def do_print_batch(self, l_exprs):
+        """Override generic do_print_batch() from personality.py to print
+        all expressions with a single 'fred-print-values' command.  Each
+        output looks like that of 'print', so that sanitize_print_result()
+        applies unchanged."""
+        global GS_PRINT_BATCH_SEPARATOR
+        if not self.b_helper_loaded or len(l_exprs) < 2 or \
+           len([x for x in l_exprs if GS_PRINT_BATCH_SEPARATOR in x]) > 0:
+            return personality.Personality.do_print_batch(self, l_exprs)
+        output = self.execute_command(self.GS_PRINT_BATCH + " " +
+                                      GS_PRINT_BATCH_SEPARATOR.join(l_exprs),
+                                      b_drain_first=True)
+        output = re.sub(self.gre_prompt, '', output)
+        # Split into [junk, idx0, val0, idx1, val1, ...]:
+        l_parts = re.split(r"^FRED-VALUE (\d+): ", output, flags=re.MULTILINE)
+        l_outputs = l_parts[2::2]
+        if len(l_outputs) != len(l_exprs):
+            fredutil.fred_debug("Malformed batch print output: %s" % output)
+            return personality.Personality.do_print_batch(self, l_exprs)
+        # Frame the values as gdb's 'print' would:
+        return ["$0 = " + s_val.strip() for s_val in l_outputs]
+
+    def state_snapshot(self):
+        """Override generic state_snapshot() from personality.py to use the
+        'fred-state' helper command."""
+        global GL_LIBRARY_BLACKLIST_NAMES
+        if not self.b_helper_loaded:
+            return None
+        output = self.execute_command(self.GS_STATE_SNAPSHOT + " " +
+                                      ",".join(GL_LIBRARY_BLACKLIST_NAMES),
+                                      b_drain_first=True)
+        m = re.search(r"^FRED-STATE (.*)$", output, re.MULTILINE)
+        if m != None:
+            try:
+                return json.loads(m.group(1))
+            except ValueError:
+                pass
+        fredutil.fred_debug("Malformed state snapshot: %s" % output)
+        return None
+
+    def set_counting_watchpoint(self, s_expr):
+        """Override generic set_counting_watchpoint() from personality.py.
+        The condition of the watchpoint increments a counter and is always
+        false.  gdb only evaluates it when the watched value changes, and
+        resumes the current command (even a 'next') without stopping.
+        Software watchpoints, which single-step the inferior, are refused."""
+        global GS_WATCH_HITS_VAR
+        self.execute_command("set var %s = 0" % GS_WATCH_HITS_VAR)
+        output = self.execute_command(
+            "watch -l %s if (%s = %s + 1) < 0" %
+            (s_expr, GS_WATCH_HITS_VAR, GS_WATCH_HITS_VAR))
+        m = re.search(r"^(Hardware )?[Ww]atchpoint (\d+):", output,
+                      re.MULTILINE)
+        if m == None:
+            fredutil.fred_debug("Cannot watch '%s': %s" % (s_expr, output))
+            return -1
+        n_number = int(m.group(2))
+        if m.group(1) == None:
+            fredutil.fred_debug("Only a software watchpoint for '%s'." %
+                                s_expr)
+            self.delete_watchpoint(n_number)
+            return -1
+        return n_number
+
+    def counting_watchpoint_hits(self):
+        """Override generic counting_watchpoint_hits() from personality.py."""
+        global GS_WATCH_HITS_VAR
+        s_val = self.sanitize_print_result(
+            self.do_print(GS_WATCH_HITS_VAR, b_drain_first=True))
+        return fredutil.to_int(s_val.strip(), -1)
+
+    def delete_watchpoint(self, n_number):
+        """Override generic delete_watchpoint() from personality.py."""
+        self.execute_command("delete %d" % n_number)
+
+    def source_line(self, s_file, n_line):
+        """Override generic source_line() from personality.py."""
+        output = self.execute_command("list %s:%d,%d" %
+                                      (s_file, n_line, n_line))
+        m = re.search(r"^%d\t(.*)$" % n_line, output, re.MULTILINE)
+        if m == None:
+            return None
+        return m.group(1)
+
     def reset_user_code_interval(self):
         """Reset code intervals (for restarts)."""
         global gl_library_blacklist_code_ranges
@@ -208,6 +356,9 @@ class PersonalityGdb(personality.Personality):
             gs_inferior_name = self.s_inferior_name
         s_cur_func = ""
         if n_addr == -1:
+            d_state = self.state_snapshot()
+            if d_state != None and d_state["frame"] != None:
+                return d_state["user_code"]
             bt = self.get_backtrace()
             s_cur_func = bt.l_frames[0].s_function
             n_addr = self.parse_address(self.do_print("&'%s'" % s_cur_func))
@@ -141,7 +141,7 @@ class PersonalityMatlab(personality.Personality):
         else:
             cmd = freddebugger.fred_unknown_cmd()
                 cmd.set_native(s_command.partition(' ')[0])
-        cmd.s_args = s_command.partition(' ')[2]
+        cmd.set_args(s_command.partition(' ')[2])
         return cmd
 
     def _parse_backtrace_internal(self, backtrace):
@@ -70,6 +70,7 @@ class PersonalityPerl(personality.Personality):
         # Things like 'next 5' are allowed:
         self.b_has_count_commands = False 
         self.b_coalesce_support = False
+        self.b_coalesce_continue_support = False
         self.n_top_backtrace_frame = 0
 
     def prompt_string(self):
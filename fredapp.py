@@ -27,6 +27,7 @@ import os
 import shutil
 import signal
 import sys
+import time
 
 from fred import dmtcpmanager
 from fred import fredmanager
@@ -39,6 +40,10 @@ from fred.algorithms import reverse_step
 from fred.algorithms import reverse_finish
 from fred.algorithms import reverse_continue
 from fred.algorithms import undo
+from fred.algorithms import parallel_search
+from fred.algorithms import binary_search
+from fred.algorithms import cost_model
+from fred.algorithms import speculation
 
 '''
 STYLE CONVENTIONS
@@ -150,9 +155,13 @@ def handle_fred_command(s_command):
     elif s_command_name == "undo":
         undo.undo(g_debugger, n_count)
     elif s_command_name in ["reverse-next", "rn"]:
-        reverse_next.reverse_next(g_debugger, n_count)
+        if n_count != 1 or \
+               not speculation.use_result(g_debugger, "reverse-next"):
+            reverse_next.reverse_next(g_debugger, n_count)
     elif s_command_name in ["reverse-step", "rs"]:
-        reverse_step.reverse_step(g_debugger, n_count)
+        if n_count != 1 or \
+               not speculation.use_result(g_debugger, "reverse-step"):
+            reverse_step.reverse_step(g_debugger, n_count)
     elif s_command_name in ["reverse-finish", "rf"]:
         reverse_finish.reverse_finish(g_debugger, n_count)
     elif s_command_name in ["reverse-continue", "rc"]:
@@ -194,10 +203,13 @@ def dispatch_command(s_command, b_wait=False):
     if is_fred_command(s_command):
         handle_fred_command(s_command)
     else:
+        f_start = time.time()
         fredio.send_command(s_command)
-        g_debugger.log_command(s_command)
+        g_debugger.log_command(s_command, time.time() - f_start,
+                               fredio.last_command_output())
         if b_wait:
            fredio.wait_for_prompt()
+    g_debugger.sync_journal()
     fredutil.fred_timer_stop(s_command)
 
 def source_from_file(s_filename):
@@ -247,6 +259,36 @@ def parse_program_args():
                       help="Resume session from directory DIR containing "
                       "FReD support files: checkpoint images, "
                       "synchronization logs, etc.", metavar="DIR")
+    parser.add_option("--search-workers", dest="search_workers", type="int",
+                      default=1,
+                      help="Restart up to N checkpoints in parallel when "
+                      "searching over checkpoints. (default %default)",
+                      metavar="N")
+    parser.add_option("--history-search", dest="history_search",
+                      type="choice",
+                      choices=binary_search.GL_HISTORY_SEARCH_STRATEGIES +
+                      [cost_model.GS_AUTO_STRATEGY],
+                      default=binary_search.gs_history_search,
+                      help="How to search the history of a checkpoint: "
+                      "bisect; gallop back from the present, or forward "
+                      "from the start, first; linear; or auto, the one "
+                      "expected to be fastest from the costs measured so "
+                      "far, for the searches whose expression cannot "
+                      "change back (bisect for the others). "
+                      "(default %default)", metavar="STRATEGY")
+    parser.add_option("--reverse-watch-engine", dest="reverse_watch_engine",
+                      type="choice",
+                      choices=binary_search.GL_REVERSE_WATCH_ENGINES,
+                      default=binary_search.gs_reverse_watch_engine,
+                      help="How reverse-watch finds the last change: bisect "
+                      "the history, or replay it once with a hardware "
+                      "watchpoint (gdb only). (default %default)",
+                      metavar="ENGINE")
+    parser.add_option("--speculate", dest="speculate", default=False,
+                      action="store_true",
+                      help="While waiting at the prompt, precompute "
+                      "fred-reverse-next and fred-reverse-step in a "
+                      "background session at low priority.")
     (options, l_args) = parser.parse_args()
     # 'l_args' is the 'gdb ARGS ./a.out' list
     if len(l_args) == 0 and options.resume_dir == None:
@@ -257,6 +299,10 @@ def parse_program_args():
         g_source_script = options.source_script
     fredio.GB_FRED_DEMO = options.fred_demo
     gb_show_child_output = options.show_child_output
+    parallel_search.gn_search_workers = max(1, options.search_workers)
+    binary_search.gs_history_search = options.history_search
+    binary_search.gs_reverse_watch_engine = options.reverse_watch_engine
+    speculation.gb_speculate = options.speculate
     if options.resume_dir != None:
         # Resume session from given directory.
         gs_resume_dir_path = options.resume_dir
@@ -320,6 +366,8 @@ def interactive_debugger_setup():
         g_debugger._p.set_inferior_name()
         # Ignore SIGUSR2 (DMTCP checkpoint signal)
         g_debugger._p.execute_command("handle SIGUSR2 pass nostop")
+        # Load helper commands (batched printing of expressions).
+        g_debugger._p.load_helper()
     # If the user gave a source script file, execute it now.
     if g_source_script != None:
         source_from_file(g_source_script)
@@ -408,8 +456,12 @@ def main_io_loop(b_skip_prompt=False):
             # Special case: user entered '\n' => execute last command again.
             if s_command == '':
                 s_command = s_last_command
+            # Any command invalidates the speculation (results already
+            # computed are kept for a fred-rn/fred-rs from here).
+            speculation.cancel()
             dispatch_command(s_command)
             s_last_command = s_command
+            speculation.start(g_debugger)
         except KeyboardInterrupt:
             if g_debugger.personality_name() not in ("Pdb", "perl"):
                 g_debugger.interrupt_inferior()
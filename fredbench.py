@@ -0,0 +1,402 @@
+#!/usr/bin/python
+
+###############################################################################
+# Copyright (C) 2009, 2010, 2011, 2012 by Kapil Arya, Gene Cooperman,         #
+#                                        Tyler Denniston, and Ana-Maria Visan #
+# {kapil,gene,tyler,amvisan}@ccs.neu.edu                                      #
+#                                                                             #
+# This file is part of FReD.                                                  #
+#                                                                             #
+# FReD is free software: you can redistribute it and/or modify                #
+# it under the terms of the GNU General Public License as published by        #
+# the Free Software Foundation, either version 3 of the License, or           #
+# (at your option) any later version.                                         #
+#                                                                             #
+# FReD is distributed in the hope that it will be useful,                     #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of              #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the               #
+# GNU General Public License for more details.                                #
+#                                                                             #
+# You should have received a copy of the GNU General Public License           #
+# along with FReD.  If not, see <http://www.gnu.org/licenses/>.               #
+###############################################################################
+
+"""
+This file should be executable from the command line to run
+micro-benchmarks of FReD's internal data structures.  No debugger or DMTCP
+is needed.
+
+To add a new benchmark:
+
+1) Define the benchmark function. Follow bench_history() as a template.
+2) Add it to the gd_benchmarks dictionary.
+"""
+from optparse import OptionParser
+from random import Random
+import time
+
+import fred.debugger
+import fred.freddebugger
+import fred.fredhistory
+import fred.algorithms.binary_search
+
+gn_history_size = 100000
+gn_repeats = 20
+
+def make_cmd(s_name, n_count=1):
+    """Return a gdb-like FredCommand with the given name and count."""
+    cmd = fred.freddebugger.FredCommand(s_name)
+    cmd.set_native(s_name[0])
+    if s_name in ["next", "step"]:
+        cmd.set_count_cmd(True)
+        cmd.set_count(n_count)
+    return cmd
+
+def make_command_list(n_size, n_seed=0):
+    """Return a list of n_size logged FredCommands shaped like a long
+    reverse-watch session: long runs of 'next' with the odd 'step',
+    'continue' and 'print'."""
+    rand = Random(n_seed)
+    l_cmds = []
+    while len(l_cmds) < n_size:
+        n_run = rand.randint(1, 200)
+        l_cmds.extend([make_cmd("next")] * min(n_run, n_size - len(l_cmds)))
+        s_name = rand.choice(["step", "continue", "print"])
+        if len(l_cmds) < n_size:
+            l_cmds.append(make_cmd(s_name))
+    return l_cmds
+
+# Reference implementation: the plain list of FredCommands which
+# Checkpoint.l_history used to be.
+def list_first_n_commands(l_history, n):
+    l_result = []
+    i = j = 0
+    while i < n:
+        l_result.append(l_history[j].copy())
+        if l_history[j].b_count_cmd:
+            count = l_history[j].count()
+            if count != 1:
+                if i + count < n:
+                    i += count
+                    j += 1
+                    continue
+                else:
+                    l_result[-1].set_count(n - i)
+                    break
+        i += 1
+        j += 1
+    return l_result
+
+def list_trim_n_cmds(l_history, n):
+    while n > 0:
+        if l_history[-1].b_count_cmd:
+            n_count = l_history[-1].count()
+            if n_count != 1:
+                l_history[-1].set_count(n_count - 1)
+                n -= 1
+                continue
+        n -= 1
+        l_history.pop()
+
+def list_coalesce(l_history):
+    l_result = [cmd.copy() for cmd in l_history]
+    i = j = 0
+    while i < len(l_result):
+        if not l_result[i].b_count_cmd:
+            i += 1
+            continue
+        n_count = l_result[i].count()
+        j = i + 1
+        while j < len(l_result):
+            if l_result[j].s_name == l_result[i].s_name:
+                n_count += l_result[j].count()
+            else:
+                break
+            j += 1
+        if n_count > 1:
+            del l_result[i+1:i+n_count]
+            l_result[i].set_count(n_count)
+        i += 1
+    return l_result
+
+def list_number_non_ignore(l_history):
+    n = 0
+    for cmd in l_history:
+        if not cmd.b_ignore:
+            n += 1 if not cmd.b_count_cmd else cmd.count()
+    return n
+
+def timed(fnc, n_repeats):
+    """Return the average wall time of fnc() in seconds."""
+    f_start = time.time()
+    for i in range(n_repeats):
+        fnc()
+    return (time.time() - f_start) / n_repeats
+
+def report(s_name, f_list, f_history):
+    print "  %-28s list: %10.3f ms   History: %10.3f ms   (x%.0f)" % \
+        (s_name, f_list * 1000, f_history * 1000,
+         f_list / max(f_history, 1e-9))
+
+def bench_history(n_size, n_repeats):
+    """Compare Checkpoint history operations on a list and on a History."""
+    print "History of %d logged commands:" % n_size
+    l_cmds = make_command_list(n_size)
+    hist = fred.fredhistory.History(l_cmds)
+    print "  (%d runs)" % len(list(hist.runs()))
+    rand = Random(1)
+    l_points = [rand.randint(0, n_size) for i in range(n_repeats)]
+    def next_point():
+        l_points.append(l_points.pop(0))
+        return l_points[0]
+
+    report("build",
+           timed(lambda: [cmd.copy() for cmd in l_cmds], 1),
+           timed(lambda: fred.fredhistory.History(l_cmds), 1))
+    report("copy",
+           timed(lambda: [cmd.copy() for cmd in l_cmds], n_repeats),
+           timed(lambda: hist.copy(), n_repeats))
+    report("first n commands",
+           timed(lambda: list_first_n_commands(l_cmds, next_point()),
+                 n_repeats),
+           timed(lambda: hist.prefix(next_point()), n_repeats))
+    report("trim 1000 commands",
+           timed(lambda: list_trim_n_cmds(list(l_cmds), 1000), n_repeats),
+           timed(lambda: hist.copy().trim(1000), n_repeats))
+    report("coalesced view",
+           timed(lambda: list_coalesce(l_cmds), n_repeats),
+           timed(lambda: list(hist.coalesced()), n_repeats))
+    report("number of non-ignore cmds",
+           timed(lambda: list_number_non_ignore(l_cmds), n_repeats),
+           timed(lambda: hist.number_non_ignore(), n_repeats))
+    # What one probe of a binary search over the history does:
+    report("bisection probe",
+           timed(lambda: list_coalesce(
+                    list_first_n_commands(l_cmds, next_point())), n_repeats),
+           timed(lambda: list(hist.prefix(next_point()).coalesced()),
+                 n_repeats))
+
+def count_allocations(fnc):
+    """Call fnc() and return a dictionary of the number of FredCommand,
+    History and history run objects it created."""
+    l_classes = [fred.freddebugger.FredCommand, fred.fredhistory.History,
+                 fred.fredhistory._Run]
+    d_counts = {}
+    d_inits = {}
+    def counting_init(cls):
+        def init(self, *args, **kwargs):
+            d_counts[cls.__name__] += 1
+            d_inits[cls](self, *args, **kwargs)
+        return init
+    for cls in l_classes:
+        d_counts[cls.__name__] = 0
+        d_inits[cls] = cls.__init__
+        cls.__init__ = counting_init(cls)
+    try:
+        fnc()
+    finally:
+        for cls in l_classes:
+            cls.__init__ = d_inits[cls]
+    return d_counts
+
+def bench_history_allocations(n_size, n_repeats):
+    """Count the objects allocated by one binary search over a history
+    (log2(n) probes, each replaying a prefix), with the history kept as a
+    list of FredCommands and as a History."""
+    print "Allocations of a binary search over %d logged commands:" % n_size
+    l_cmds = make_command_list(n_size)
+    hist = fred.fredhistory.History(l_cmds)
+    def list_search():
+        l_history = [cmd.copy() for cmd in l_cmds]
+        n_min = 0
+        n_max = len(l_history)
+        while n_max - n_min > 1:
+            n_count = (n_min + n_max) / 2
+            list_coalesce(list_first_n_commands(l_history, n_count))
+            n_min = n_count
+        l_history = l_history[:n_max]
+        l_history.append(make_cmd("step"))
+    def history_search():
+        h = hist.copy()
+        n_min = 0
+        n_max = len(h)
+        while n_max - n_min > 1:
+            n_count = (n_min + n_max) / 2
+            list(h.prefix(n_count).coalesced())
+            n_min = n_count
+        h = h[:n_max]
+        h.append(make_cmd("step"))
+    d_list = count_allocations(list_search)
+    d_history = count_allocations(history_search)
+    for s_class in sorted(d_list.keys()):
+        print "  %-28s list: %10d       History: %10d" % \
+            (s_class, d_list[s_class], d_history[s_class])
+
+def bench_history_many_runs(n_size, n_repeats):
+    """Worst case for History: no two consecutive commands alike."""
+    print "History of %d logged commands, all distinct runs:" % n_size
+    l_cmds = [make_cmd(["next", "step"][i % 2]) for i in range(n_size)]
+    hist = fred.fredhistory.History(l_cmds)
+    rand = Random(2)
+    l_points = [rand.randint(0, n_size - 1) for i in range(n_repeats)]
+    def next_point():
+        l_points.append(l_points.pop(0))
+        return l_points[0]
+    report("index",
+           timed(lambda: l_cmds[next_point()].copy(), n_repeats),
+           timed(lambda: hist[next_point()], n_repeats))
+    report("first n commands",
+           timed(lambda: list_first_n_commands(l_cmds, next_point()),
+                 n_repeats),
+           timed(lambda: hist.prefix(next_point()), n_repeats))
+    report("copy and append",
+           timed(lambda: [cmd.copy() for cmd in l_cmds] + [make_cmd("next")],
+                 n_repeats),
+           timed(lambda: hist.prefix(next_point()).append(make_cmd("print")),
+                 n_repeats))
+
+def make_state(n_depth, n_line):
+    """Return a DebuggerState with a gdb-like backtrace of depth n_depth,
+    stopped at line n_line of the innermost frame."""
+    state = fred.debugger.DebuggerState()
+    bt = fred.debugger.Backtrace()
+    for i in range(n_depth):
+        frame = fred.debugger.BacktraceFrame()
+        frame.n_frame_num = i
+        frame.s_addr      = "0x%08x" % (0x400000 + 16 * (n_depth - i))
+        frame.s_function  = "f%d" % (n_depth - i)
+        frame.s_args      = "n=%d" % (n_depth - i)
+        frame.s_file      = "test.c"
+        frame.n_line      = n_line if i == 0 else 100 + n_depth - i
+        bt.add_frame(frame)
+    state.set_backtrace(bt)
+    for i in range(5):
+        bp = fred.debugger.Breakpoint()
+        bp.n_number = i + 1
+        bp.s_file = "test.c"
+        bp.n_line = 10 * i
+        state.add_breakpoint(bp)
+    return state
+
+def bench_state(n_size, n_repeats):
+    """Time the DebuggerState copies and comparisons that the reverse_*
+    algorithms do once per loop iteration."""
+    n_repeats *= 100
+    print "DebuggerState with a 50-frame backtrace (x%d):" % n_repeats
+    state = make_state(50, 1)
+    parsed = make_state(50, 1)
+    # As after an update_state(): the unchanged frames are shared.
+    moved = state.copy()
+    moved.set_backtrace(make_state(50, 2).get_backtrace())
+    print "  %-36s %8.3f us" % ("copy",
+        timed(lambda: state.copy(), n_repeats) * 1e6)
+    print "  %-36s %8.3f us" % ("compare with copy",
+        timed(lambda: state == state.copy(), n_repeats) * 1e6)
+    print "  %-36s %8.3f us" % ("compare with equal re-parsed state",
+        timed(lambda: state == parsed, n_repeats) * 1e6)
+    print "  %-36s %8.3f us" % ("compare after a 'next'",
+        timed(lambda: state == moved, n_repeats) * 1e6)
+    # As after an update_state() on a gdb with a state snapshot: the
+    # backtrace is never read.
+    frame = state.get_backtrace().get_frames()[0]
+    lazy = fred.debugger.DebuggerState()
+    lazy.set_lazy_backtrace(lambda: make_state(50, 1).get_backtrace(), 50,
+                            lambda: frame)
+    print "  %-36s %8.3f us" % ("compare unread state with copy",
+        timed(lambda: lazy == lazy.copy(), n_repeats) * 1e6)
+
+class SearchSimulator():
+    """Stands in for the ReversibleDebugger in NEW_binary_search_history():
+    the expression changes with command number n_change (0-based) of the
+    history.  Counts the restarts, the commands replayed and the evaluations
+    of the expression."""
+    def __init__(self, n_change):
+        self.n_change = n_change
+        self.n_position = 0
+        self.n_restarts = 0
+        self.n_replayed = 0
+        self.n_evaluations = 0
+
+    def do_restart(self, n_index=-1, b_clear_history=False):
+        self.n_restarts += 1
+        self.n_position = 0
+
+    def replay_history(self, l_history=[], n=-1):
+        if n == -1:
+            n = len(l_history)
+        self.n_position += n
+        self.n_replayed += n
+
+    def replay_position_key(self, l_history, n_index=-1):
+        return None
+
+    def program_is_running(self):
+        return True
+
+    def too_far(self):
+        self.n_evaluations += 1
+        return self.n_position > self.n_change
+
+def simulate_history_search(s_strategy, hist, n_change):
+    """Return (restarts, replayed commands, evaluations) of one search of
+    hist for a change at command n_change, with the given strategy."""
+    bs = fred.algorithms.binary_search
+    s_saved = bs.gs_history_search
+    bs.gs_history_search = s_strategy
+    sim = SearchSimulator(n_change)
+    try:
+        bs.NEW_binary_search_history(sim, hist, 0, sim.too_far)
+    finally:
+        bs.gs_history_search = s_saved
+    return (sim.n_restarts, sim.n_replayed, sim.n_evaluations)
+
+def bench_history_search(n_size, n_repeats):
+    """Compare the restarts, replays and evaluations made by the history
+    search strategies of binary_search.py, for changes at various distances
+    from the present."""
+    print "Searching a history of %d commands (restarts / " \
+          "replayed commands / evaluations):" % n_size
+    hist = fred.fredhistory.History([make_cmd("next")] * n_size)
+    l_distances = [1, 2, 5, 10, 100, 1000, n_size / 2, n_size]
+    for n_distance in sorted(set([x for x in l_distances
+                                  if 0 < x <= n_size])):
+        l_results = []
+        for s_strategy in \
+                fred.algorithms.binary_search.GL_HISTORY_SEARCH_STRATEGIES:
+            (n_restarts, n_replayed, n_evaluations) = \
+                simulate_history_search(s_strategy, hist, n_size - n_distance)
+            l_results.append("%s: %3d / %9d / %6d" %
+                             (s_strategy, n_restarts, n_replayed,
+                              n_evaluations))
+        print "  %-28s %s" % ("change %d commands back" % n_distance,
+                              "   ".join(l_results))
+
+gd_benchmarks = { "history" : bench_history,
+                  "state" : bench_state,
+                  "history-alloc" : bench_history_allocations,
+                  "history-runs" : bench_history_many_runs,
+                  "history-search" : bench_history_search }
+
+def parse_fredbench_args():
+    """Initialize the global variables from the command line arguments."""
+    global gn_history_size, gn_repeats
+    parser = OptionParser()
+    parser.add_option("-n", "--size", dest="size", default=gn_history_size,
+                      type="int", help="Number of commands in benchmark "
+                      "histories (default %d)." % gn_history_size)
+    parser.add_option("-r", "--repeats", dest="repeats", default=gn_repeats,
+                      type="int", help="Number of timed repetitions.")
+    parser.add_option("-b", "--benchmarks", dest="benchmarks",
+                      default=",".join(sorted(gd_benchmarks.keys())),
+                      help="Comma-separated list of benchmarks to run.")
+    (options, l_args) = parser.parse_args()
+    gn_history_size = options.size
+    gn_repeats = options.repeats
+    return options.benchmarks.split(",")
+
+def main():
+    for s_bench in sorted(parse_fredbench_args()):
+        gd_benchmarks[s_bench](gn_history_size, gn_repeats)
+
+if __name__ == "__main__":
+    main()
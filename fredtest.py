@@ -27,15 +27,32 @@ integration and unit tests on FReD.
 """
 from optparse import OptionParser
 from random import randint
+import json
 import os
+import shutil
+import struct
 import sys
+import tempfile
+import threading
+import time
 import traceback
 
 import fredapp
 import fred.fredutil
+import fred.debugger
 import fred.dmtcpmanager
+import fred.freddebugger
+import fred.fredhistory
 import fred.fredmanager
 import fred.fredio
+import fred.fredshm
+import fred.fredlog
+import fred.algorithms.thread_rank
+import fred.algorithms.speculation
+import fred.algorithms.cost_model
+import fred.algorithms.reverse_finish
+import fred.fredjournal
+import fred.personality.personalityGdb
 
 # XXX this path shouldn't be hardcoded.
 GS_TEST_PROGRAMS_DIRECTORY = "test"
@@ -96,24 +113,39 @@ def execute_commands(l_cmds):
     """Execute the given list of commands as if they were a source file."""
     fredapp.source_from_list(l_cmds)
 
+def count_restarts(l_cmds):
+    """Execute the given list of commands, and return the number of restarts
+    FReD did for them."""
+    n_restarts = fred.freddebugger.gn_total_restarts
+    execute_commands(l_cmds)
+    return fred.freddebugger.gn_total_restarts - n_restarts
+
 def evaluate_variable(s_name):
     """Evaluate given variable in debugger and return value."""
     global g_debugger
     return g_debugger.evaluate_expression(s_name)
 
-def store_variable(s_name):
-    """Evaluate given variable in debugger and store value.
+def evaluate_variables(ls_names):
+    """Evaluate given variables in debugger (in one round trip where
+    possible) and return a dict of their values."""
+    global g_debugger
+    return g_debugger.evaluate_expressions(ls_names)
+
+def store_variable(*ls_names):
+    """Evaluate given variables in debugger and store values.
     For example, if the test is for gdb, and the debugged program (a.out)
     defines some variable 'my_var', then store_variable("my_var") will execute
     gdb command "print my_var" and store the value of my_var in the
     gd_stored_variables dictionary under the key "my_var"."""
     global gd_stored_variables
-    gd_stored_variables[s_name] = evaluate_variable(s_name)
+    gd_stored_variables.update(evaluate_variables(ls_names))
 
-def check_stored_variable(s_name):
-    """Evaluate given variable in debugger and check against stored value."""
+def check_stored_variable(*ls_names):
+    """Evaluate given variables in debugger and check against stored values."""
     global gd_stored_variables
-    return gd_stored_variables[s_name] == evaluate_variable(s_name)
+    d_values = evaluate_variables(ls_names)
+    return len([x for x in ls_names
+                if gd_stored_variables[x] != d_values[x]]) == 0
 
 def check_variable(s_name, s_value):
     """Evaluate given variable in debugger and check against given value."""
@@ -484,11 +516,11 @@ def gdb_reverse_finish(n_count=1):
     for i in range(0, n_count):
         print_test_name("gdb reverse finish %d" % i)
         start_session(l_cmd)
-        execute_commands(["b main", "r", "fred-ckpt", "step",
-                          "fred-reverse-finish"])
+        execute_commands(["b main", "r", "fred-ckpt", "step"])
+        n_restarts = count_restarts(["fred-reverse-finish"])
         current_backtrace_frame = g_debugger.current_position()
         if current_backtrace_frame.line() == 22:
-            passed()
+            passed("%d restarts" % n_restarts)
         else:
             failed()
         end_session()
@@ -500,11 +532,11 @@ def gdb_reverse_finish_2(n_count=1):
     for i in range(0, n_count):
         print_test_name("gdb reverse finish-2 %d" % i)
         start_session(l_cmd)
-        execute_commands(["b main", "r", "fred-ckpt", "step", "next", "next",
-                          "fred-reverse-finish"])
+        execute_commands(["b main", "r", "fred-ckpt", "step", "next", "next"])
+        n_restarts = count_restarts(["fred-reverse-finish"])
         current_backtrace_frame = g_debugger.current_position()
         if current_backtrace_frame.line() == 22:
-            passed()
+            passed("%d restarts" % n_restarts)
         else:
             failed()
         end_session()
@@ -534,9 +566,934 @@ def run_integration_tests(n_iters):
     gdb_reverse_watch_mt_priv(n_iters)
     gdb_reverse_watch_no_log(n_iters)
 
+def unit_fred_shm(n_count=1):
+    """Test fredshm.FredShm on a fake fred-shm file, with a thread standing
+    in for the replaying inferior."""
+    shm = fred.fredshm
+    for i in range(0, n_count):
+        print_test_name("unit fred-shm %d" % i)
+        (fd, s_path) = tempfile.mkstemp(prefix="fred-shm.")
+        os.write(fd, struct.pack(shm.GS_INFO_FORMAT, 3, 17, 100, 4,
+                                 shm.GN_NO_BREAKPOINT))
+        os.close(fd)
+        client = shm.FredShm(s_path)
+        d_info = client.read_info()
+        b_ok = d_info == {"current_clone_id" : 3,
+                          "current_log_entry_index" : 17,
+                          "total_entries" : 100, "total_threads" : 4,
+                          "breakpoint_at_index" : shm.GN_NO_BREAKPOINT}
+        client.set_breakpoint(42)
+        b_ok = b_ok and client.read_info()["breakpoint_at_index"] == 42
+        b_ok = b_ok and not client.wait_on_breakpoint(f_timeout=0.01)
+        def hit_breakpoint():
+            time.sleep(0.05)
+            f = open(s_path, "r+b")
+            f.seek(shm.GN_BREAKPOINT_OFFSET)
+            f.write(struct.pack(shm.GS_BREAKPOINT_FORMAT,
+                                shm.GN_BREAKPOINT_HIT))
+            f.close()
+        inferior = threading.Thread(target=hit_breakpoint)
+        inferior.start()
+        b_ok = b_ok and client.wait_on_breakpoint(f_timeout=10)
+        inferior.join()
+        client.clear_breakpoint()
+        d_info = client.read_info()
+        b_ok = b_ok and d_info["breakpoint_at_index"] == \
+            shm.GN_NO_BREAKPOINT and d_info["total_entries"] == 100
+        os.remove(s_path)
+        b_ok = b_ok and client.read_info() == None
+        if b_ok:
+            passed()
+        else:
+            failed()
+
+def _fake_log_index(l_entries):
+    """Return a fredlog.LogIndex of a fake synchronization log holding
+    l_entries, a list of (clone id, event name, return value)."""
+    log = fred.fredlog
+    table = log.EventTable([("empty", 0, 16), ("pthread_mutex_lock", 0, 16),
+                            ("write", 1, 24), ("read", 2, 32)])
+    s_data = ""
+    for (n_clone_id, s_event, n_retval) in l_entries:
+        n_event = table.event_id(s_event)
+        b_retval_zero = n_retval == 0
+        s_data += struct.pack(log.GS_HEADER_FORMAT,
+                              n_event |
+                              (b_retval_zero << log.GN_RETVAL_ZERO_SHIFT) |
+                              (n_clone_id << log.GN_CLONE_ID_SHIFT))
+        if table.has_payload(n_event, b_retval_zero):
+            s_payload = struct.pack("@i0P", 0) + \
+                struct.pack(log.GS_RETVAL_FORMAT, n_retval)
+            s_data += s_payload.ljust(table.l_sizes[n_event], "\0")
+    (fd, s_path) = tempfile.mkstemp(prefix="synchronization-log-")
+    os.write(fd, struct.pack(log.GS_METADATA_FORMAT, 1 << 20, len(s_data),
+                             len(l_entries), 3, 0, 0)
+             .ljust(log.GN_LOG_OFFSET, "\0"))
+    # The unused tail of the log, as fredhijack.so leaves it:
+    os.write(fd, s_data + "\0" * 64)
+    os.close(fd)
+    index = log.LogIndex(s_path, table)
+    os.remove(s_path)
+    return index
+
+def unit_fred_log(n_count=1):
+    """Test fredlog.LogIndex on a fake synchronization log."""
+    l_entries = [(1, "write", 5), (2, "pthread_mutex_lock", 0),
+                 (1, "read", 0), (2, "write", -1), (3, "pthread_mutex_lock", 0),
+                 (1, "pthread_mutex_lock", 0)]
+    for i in range(0, n_count):
+        print_test_name("unit fred-log %d" % i)
+        index = _fake_log_index(l_entries)
+        b_ok = len(index) == len(l_entries)
+        b_ok = b_ok and [(index.clone_id(n), index.event_name(n),
+                          index.retval(n))
+                         for n in range(len(index))] == l_entries
+        b_ok = b_ok and index.threads() == [1, 2, 3] and \
+            index.threads(1, 4) == [1, 2]
+        b_ok = b_ok and index.events(n_clone_id=1) == [0, 2, 5]
+        b_ok = b_ok and index.events(l_event_names=["write",
+                                                    "pthread_mutex_lock"],
+                                     n_first=1, n_last=5) == [1, 3, 4]
+        b_ok = b_ok and index.events(2, ["write"]) == [3]
+        b_ok = b_ok and index.events(3, n_first=5) == []
+        if b_ok:
+            passed()
+        else:
+            failed()
+
+def unit_thread_rank(n_count=1):
+    """Test thread_rank.rank_threads() on a fake synchronization log."""
+    rank = fred.algorithms.thread_rank
+    # Threads 2-9 write in turn; at entry 40, thread 7 runs next, then
+    # thread 4, then thread 9 which takes a lock.
+    l_entries = [(2 + n % 8, "write", 1) for n in range(0, 40)]
+    l_entries += [(7, "write", 1), (4, "write", 1), (9, "pthread_mutex_lock", 0)]
+    l_entries += [(4, "write", 1) for n in range(0, 40)]
+    for i in range(0, n_count):
+        print_test_name("unit thread-rank %d" % i)
+        old_window = rank.GN_RANK_WINDOW
+        rank.GN_RANK_WINDOW = 4
+        try:
+            index = _fake_log_index(l_entries)
+            l_ranked = rank.rank_threads(index, 40, [9, 8, 7, 6, 5, 4, 3, 2])
+        finally:
+            rank.GN_RANK_WINDOW = old_window
+        if l_ranked[:3] == [7, 9, 4] and \
+               sorted(l_ranked) == [2, 3, 4, 5, 6, 7, 8, 9]:
+            passed()
+        else:
+            failed()
+
+def unit_position_trace(n_count=1):
+    """Test that the position trace of a Checkpoint, recorded as the
+    debugger moves, is found again from the prefixes of the history which
+    the reverse commands consider, and from a coalesced replay."""
+    dbg = fred.freddebugger
+    def counted(cmd, n):
+        cmd.set_count_cmd(True)
+        cmd.set_count(n)
+        return cmd
+    l_cmds = [counted(dbg.fred_next_cmd(), 1), counted(dbg.fred_next_cmd(), 1),
+              counted(dbg.fred_step_cmd(), 1), dbg.fred_print_cmd(),
+              counted(dbg.fred_next_cmd(), 2)]
+    for i in range(0, n_count):
+        print_test_name("unit position-trace %d" % i)
+        ckpt = dbg.Checkpoint(0)
+        h_typed = fred.fredhistory.History()
+        for cmd in l_cmds:
+            h_typed.append(cmd)
+            ckpt.trace_position(h_typed, {"depth" : len(h_typed),
+                                          "threads" : [1]})
+        ckpt.set_history(h_typed)
+        l_history = ckpt.get_history()
+        b_ok = [ckpt.traced_position(l_history[:n]) != None
+                for n in range(0, len(l_history) + 1)] == \
+            [False, True, True, True, True, False, True]
+        b_ok = b_ok and ckpt.traced_position(l_history[:3]) == \
+            {"depth" : 3, "running" : None, "pc" : None, "frame" : None}
+        h_replayed = fred.fredhistory.History()
+        h_replayed.append(counted(dbg.fred_next_cmd(), 2))
+        b_ok = b_ok and ckpt.traced_position(h_replayed) != None
+        h_replayed.append(dbg.fred_next_cmd())
+        b_ok = b_ok and ckpt.traced_position(h_replayed) == None
+        if b_ok:
+            passed()
+        else:
+            failed()
+
+def unit_speculation(n_count=1):
+    """Test that the results written by a speculation worker are read back
+    as Histories, and only offered at the position they were computed
+    from."""
+    dbg = fred.freddebugger
+    speculation = fred.algorithms.speculation
+    class FakeDebugger():
+        def __init__(self):
+            self.key = ("master", 0, 3, 0)
+            self.ckpt = dbg.Checkpoint(0)
+        def position_key(self):
+            return self.key
+        def current_checkpoint(self):
+            return self.ckpt
+        def copy_current_checkpoint_history(self):
+            return self.ckpt.get_history().copy()
+        def personality_name(self):
+            return "gdb"
+    h_result = fred.fredhistory.History()
+    h_result.append(dbg.fred_next_cmd())
+    h_result.append(dbg.fred_step_cmd())
+    for i in range(0, n_count):
+        print_test_name("unit speculation %d" % i)
+        s_dir = tempfile.mkdtemp()
+        d_old_environ = dict([(s, os.environ.get(s))
+                              for s in ["DMTCP_TMPDIR", "DMTCP_PORT"]])
+        os.environ["DMTCP_TMPDIR"] = os.path.join(s_dir, "dmtcp")
+        os.environ["DMTCP_PORT"] = "7779"
+        try:
+            fake = FakeDebugger()
+            spec = speculation.Speculation(fake)
+            f = open(spec.s_result_path, "w")
+            json.dump({"reverse-step" :
+                       fred.fredjournal.encode_history(h_result)}, f)
+            f.close()
+            spec.stop()
+            h = spec.result(fake, "reverse-step")
+            b_ok = h != None and \
+                   h.fingerprint() == h_result.fingerprint() and \
+                   len(h) == len(h_result)
+            b_ok = b_ok and spec.result(fake, "reverse-next") == None
+            fake.key = ("master", 0, 4, 0)
+            b_ok = b_ok and spec.result(fake, "reverse-step") == None
+        finally:
+            for (s_name, s_value) in d_old_environ.items():
+                if s_value == None:
+                    os.environ.pop(s_name, None)
+                else:
+                    os.environ[s_name] = s_value
+            shutil.rmtree(s_dir, ignore_errors=True)
+        if b_ok:
+            passed()
+        else:
+            failed()
+
+def unit_cost_model(n_count=1):
+    """Test that the cost model chooses each history search strategy where
+    it should:  linear when restarts dominate, bisect when evaluations do,
+    gallop when the change is recent and forward when it is early."""
+    cost_model = fred.algorithms.cost_model
+    h = fred.fredhistory.History([fred.freddebugger.fred_next_cmd()] * 1024)
+    # (restart, evaluation, command seconds, change distance, expected):
+    l_cases = [(1.0, 0.001, 0.001, 512, "linear"),
+               (0.01, 0.5, 0.001, 512, "bisect"),
+               (0.01, 0.5, 0.001, 1, "gallop"),
+               (0.5, 0.05, 0.001, 1000, "forward")]
+    for i in range(0, n_count):
+        print_test_name("unit cost-model %d" % i)
+        b_ok = True
+        for (f_restart, f_eval, f_cmd, n_back, s_expected) in l_cases:
+            costs = cost_model.Costs(f_restart, f_eval, 0.5,
+                                     {"next" : f_cmd}, f_cmd)
+            decision = cost_model.Decision(
+                "Test", cost_model.history_search_costs(costs, h, 0, n_back),
+                fred.algorithms.binary_search.GL_HISTORY_SEARCH_STRATEGIES)
+            b_ok = b_ok and decision.s_choice == s_expected
+        if b_ok:
+            passed()
+        else:
+            failed()
+
+def unit_side_effects(n_count=1):
+    """Test that expressions which may modify the program, including the
+    compound shift assignments, are not taken as side-effect free."""
+    is_free = fred.freddebugger._is_side_effect_free
+    l_free = ["x", "x == 1", "x != y", "x <= 1", "x >= 1", "x << 1",
+              "a[i] >> 2"]
+    l_not_free = ["x = 1", "x += 1", "x <<= 1", "x >>= 1", "i++", "--i",
+                  "f(x)"]
+    for i in range(0, n_count):
+        print_test_name("unit side-effects %d" % i)
+        if [is_free(s) for s in l_free] == [True] * len(l_free) and \
+               [is_free(s) for s in l_not_free] == [False] * len(l_not_free):
+            passed()
+        else:
+            failed()
+
+def unit_history_search(n_count=1):
+    """Test that with strategy "auto", the history search finds the same
+    change of a predicate which changes back and forth whatever the costs
+    measured, and that the strategies it chooses for a monotone predicate
+    find its one change."""
+    binary_search = fred.algorithms.binary_search
+    cost_model = fred.algorithms.cost_model
+    h = fred.fredhistory.History([fred.freddebugger.fred_next_cmd()] * 1024)
+    class FakeDebugger():
+        """The position is the number of commands replayed since the last
+        restart."""
+        def __init__(self, fnc_too_far):
+            self.fnc_too_far = fnc_too_far
+            self.n_position = 0
+        def do_restart(self, n_index=-1, b_clear_history=False):
+            self.n_position = 0
+        def replay_history(self, l_history=[], n=-1):
+            if n == -1:
+                n = len(l_history)
+            self.n_position += n
+        def replay_position_key(self, l_history, n_index=-1):
+            return None
+        def program_is_running(self):
+            return True
+        def too_far(self):
+            return self.fnc_too_far(self.n_position)
+    # Too far after commands 101 to 200, and from 1001 on:
+    fnc_toggling = lambda n: 100 < n <= 200 or n > 1000
+    fnc_monotone = lambda n: n > 1000
+    # (restart, evaluation, last change distances), for which "auto"
+    # chooses linear, bisect, gallop and forward (see unit_cost_model()):
+    l_cases = [(1.0, 0.001, []), (0.01, 0.5, []), (0.01, 0.5, [1]),
+               (0.5, 0.05, [1000])]
+    def search(fnc_too_far, s_strategy, b_monotone):
+        dbg = FakeDebugger(fnc_too_far)
+        return len(binary_search.NEW_binary_search_history(
+            dbg, h.copy(), 0, dbg.too_far, s_strategy=s_strategy,
+            b_monotone=b_monotone))
+    for i in range(0, n_count):
+        print_test_name("unit history-search %d" % i)
+        old_current_costs = cost_model.current_costs
+        old_distances = cost_model.gl_change_distances
+        old_decisions = cost_model.gl_decisions
+        cost_model.gl_decisions = []
+        n_bisect = search(fnc_toggling, "bisect", False)
+        l_toggled = []
+        l_monotone_found = []
+        try:
+            for (f_restart, f_eval, l_distances) in l_cases:
+                costs = cost_model.Costs(f_restart, f_eval, 0.5,
+                                         {"next" : 0.001}, 0.001)
+                cost_model.current_costs = lambda dbg: costs
+                cost_model.gl_change_distances = list(l_distances)
+                l_toggled.append(search(fnc_toggling, "auto", False))
+                cost_model.gl_change_distances = list(l_distances)
+                l_monotone_found.append(search(fnc_monotone, "auto", True))
+            l_chosen = [d.s_choice for d in cost_model.gl_decisions]
+        finally:
+            cost_model.current_costs = old_current_costs
+            cost_model.gl_change_distances = old_distances
+            cost_model.gl_decisions = old_decisions
+        if l_toggled == [n_bisect] * len(l_cases) and \
+               l_monotone_found == [1001] * len(l_cases) and \
+               l_chosen == ["linear", "bisect", "gallop", "forward"]:
+            passed()
+        else:
+            failed()
+
+def unit_history(n_count=1):
+    """Test History slicing, assignment, deletion, trim_non_ignore() and
+    fingerprints against a plain list of logical commands, the way
+    Checkpoint.l_history used to be."""
+    def make_cmd(s_name, n=1):
+        cmd = fred.freddebugger.FredCommand(s_name)
+        cmd.set_native(s_name[0])
+        if s_name in ["next", "step"]:
+            cmd.set_count_cmd(True)
+            if n != 1:
+                cmd.set_count(n)
+        if s_name == "print":
+            cmd.set_ignore()
+        return cmd
+    def names(l_cmds):
+        return [cmd.s_name for cmd in l_cmds]
+    l_names = ["next"] * 5 + ["step", "print", "print"] + ["next"] * 3 + \
+              ["continue", "print"]
+    for i in range(0, n_count):
+        print_test_name("unit history %d" % i)
+        hist = fred.fredhistory.History([make_cmd(s) for s in l_names])
+        b_ok = len(hist) == len(l_names) and names(hist) == l_names
+        # Slicing:
+        for (n_start, n_stop) in [(0, 4), (3, 9), (5, 6), (-4, -1), (7, 3),
+                                  (0, 100)]:
+            b_ok = b_ok and \
+                   names(hist[n_start:n_stop]) == l_names[n_start:n_stop]
+        b_ok = b_ok and hist[-2].s_name == "continue"
+        # Assignment and deletion, in the middle of a run and at the end:
+        h = hist.copy()
+        l = list(l_names)
+        h[2] = make_cmd("step")
+        l[2] = "step"
+        h[-1] = make_cmd("next")
+        l[-1] = "next"
+        b_ok = b_ok and names(h) == l and names(hist) == l_names
+        del h[3]
+        del l[3]
+        del h[4:7]
+        del l[4:7]
+        del h[-2:]
+        del l[-2:]
+        b_ok = b_ok and names(h) == l and names(hist) == l_names
+        # trim_non_ignore() also trims the ignore commands after the
+        # earliest trimmed command:
+        h = hist.copy()
+        h.trim_non_ignore(2)
+        b_ok = b_ok and names(h) == l_names[:10]
+        h.trim_non_ignore(4)
+        b_ok = b_ok and names(h) == l_names[:4] and \
+               h.number_non_ignore() == 4
+        h.trim_non_ignore(10)
+        b_ok = b_ok and len(h) == 0
+        # The same commands built in different ways have equal
+        # fingerprints:
+        h_counted = fred.fredhistory.History([make_cmd("next", 5)])
+        h_counted.extend([make_cmd(s) for s in l_names[5:]])
+        h_appended = fred.fredhistory.History()
+        for s_name in l_names:
+            h_appended.append(make_cmd(s_name))
+        h_joined = hist[:7] + hist[7:]
+        h_edited = hist.copy()
+        h_edited[5] = make_cmd("next")
+        h_edited[5] = make_cmd("step")
+        l_hists = [h_counted, h_appended, h_joined, h_edited]
+        for h in l_hists:
+            b_ok = b_ok and len(h) == len(hist) and \
+                   h.fingerprint() == hist.fingerprint()
+        b_ok = b_ok and hist[:5].fingerprint() != hist[:6].fingerprint()
+        if b_ok:
+            passed()
+        else:
+            failed()
+
+def unit_breakpoint_table(n_count=1):
+    """Test the parsing of breakpoint number arguments, and the updates of
+    the BreakpointTable from the breakpoint commands."""
+    dbg = fred.freddebugger
+    def make_breakpoint(n_number, s_file, n_line):
+        bp = fred.debugger.Breakpoint()
+        bp.n_number = n_number
+        bp.s_enable = "y"
+        bp.s_file = s_file
+        bp.n_line = n_line
+        return bp
+    for i in range(0, n_count):
+        print_test_name("unit breakpoint-table %d" % i)
+        b_ok = dbg._parse_breakpoint_numbers("2 4-6") == [2, 4, 5, 6] and \
+               dbg._parse_breakpoint_numbers("") == [] and \
+               dbg._parse_breakpoint_numbers("1 main") == None and \
+               dbg._parse_breakpoint_numbers("$bpnum") == None
+        table = fred.debugger.BreakpointTable()
+        b_ok = b_ok and table.is_stale()
+        bp1 = make_breakpoint(1, "a.c", 10)
+        bp2 = make_breakpoint(2, "a.c", 10)
+        bp3 = make_breakpoint(3, "b.c", 5)
+        table.set_breakpoints([bp1, bp2, bp3])
+        b_ok = b_ok and not table.is_stale() and \
+               table.at_location("a.c", 10) == [bp1, bp2] and \
+               table.at_location("a.c", 11) == []
+        table.set_enabled(2, False)
+        l_at = table.at_location("a.c", 10)
+        # Breakpoints are shared, so disabling replaces bp2:
+        b_ok = b_ok and [bp.s_enable for bp in l_at] == ["y", "n"] and \
+               bp2.s_enable == "y"
+        table.remove(1)
+        table.remove(7)
+        b_ok = b_ok and [bp.n_number for bp in table.get_breakpoints()] == \
+               [2, 3] and len(table.at_location("a.c", 10)) == 1
+        table.mark_stale()
+        b_ok = b_ok and table.is_stale()
+        if b_ok:
+            passed()
+        else:
+            failed()
+
+def unit_expression_cache(n_count=1):
+    """Test the LRU eviction and the invalidation of the ExpressionCache."""
+    dbg = fred.freddebugger
+    for i in range(0, n_count):
+        print_test_name("unit expression-cache %d" % i)
+        cache = dbg.ExpressionCache(2)
+        cache.put(("master", 0, 1, 11), "x", 1)
+        cache.put(("master", 1, 1, 11), "x", 2)
+        b_ok = cache.get(("master", 0, 1, 11), "x") == 1
+        # The least recently used value is evicted:
+        cache.put(("master", 1, 2, 12), "x", 3)
+        b_ok = b_ok and len(cache) == 2 and \
+               cache.get(("master", 1, 1, 11), "x") == None and \
+               cache.get(("master", 0, 1, 11), "x") == 1 and \
+               cache.get(("master", 0, 1, 11), "y") == None
+        cache.invalidate_checkpoints("master", 1)
+        b_ok = b_ok and len(cache) == 1 and \
+               cache.get(("master", 1, 2, 12), "x") == None
+        cache.invalidate_branch("master")
+        b_ok = b_ok and len(cache) == 0
+        if b_ok:
+            passed()
+        else:
+            failed()
+
+def unit_command_deadlines(n_count=1):
+    """Test the command deadlines computed from the CommandTimes, including
+    for a counted command recorded as single ones."""
+    dbg = fred.freddebugger
+    def make_next(n=1):
+        cmd = dbg.fred_next_cmd()
+        cmd.set_count_cmd(True)
+        if n != 1:
+            cmd.set_count(n)
+        return cmd
+    for i in range(0, n_count):
+        print_test_name("unit command-deadlines %d" % i)
+        rdbg = dbg.ReversibleDebugger(None)
+        b_ok = rdbg.command_deadline(make_next()) == \
+               dbg.GN_DEFAULT_COMMAND_DEADLINE
+        rdbg.t_position_base = ("master", 0)
+        rdbg.h_position = fred.fredhistory.History()
+        h = fred.fredhistory.History()
+        rdbg.command_times.record(rdbg.t_position_base, h, make_next(), 1.0)
+        h.append(make_next())
+        rdbg.command_times.record(rdbg.t_position_base, h, make_next(), 2.0)
+        b_ok = b_ok and \
+               rdbg.command_times.seconds_per_command("next") == 1.5 and \
+               rdbg.command_times.seconds_per_command("step") == None
+        # A 'next 2' takes the two recorded 'next's, a 'next 3' more:
+        b_ok = b_ok and rdbg.command_deadline(make_next(2)) == \
+               dbg.GN_DEADLINE_SAFETY_FACTOR * 3.0
+        b_ok = b_ok and rdbg.command_deadline(make_next(3)) == \
+               dbg.GN_DEADLINE_SAFETY_FACTOR * 3.0 + \
+               dbg.GN_DEFAULT_COMMAND_DEADLINE
+        b_ok = b_ok and rdbg.command_deadline(dbg.fred_step_cmd()) == \
+               dbg.GN_DEFAULT_COMMAND_DEADLINE
+        rdbg.h_position = h.copy()
+        b_ok = b_ok and rdbg.command_deadline(make_next()) == \
+               max(dbg.GN_MIN_COMMAND_DEADLINE,
+                   dbg.GN_DEADLINE_SAFETY_FACTOR * 2.0)
+        rdbg.command_times.invalidate_checkpoints("master", 0)
+        b_ok = b_ok and len(rdbg.command_times) == 0
+        if b_ok:
+            passed()
+        else:
+            failed()
+
+def unit_journal(n_count=1):
+    """Test that the histories synced to a HistoryJournal, through
+    appends, rewrites and checkpoint removals, are loaded back."""
+    dbg = fred.freddebugger
+    journal = fred.fredjournal
+    def make_cmd(s_name, n=1):
+        cmd = dbg.FredCommand(s_name)
+        cmd.set_native(s_name[0])
+        if s_name in ["next", "step"]:
+            cmd.set_count_cmd(True)
+            if n != 1:
+                cmd.set_count(n)
+        return cmd
+    def same(h1, h2):
+        return h1 != None and len(h1) == len(h2) and \
+               h1.fingerprint() == h2.fingerprint()
+    for i in range(0, n_count):
+        print_test_name("unit journal %d" % i)
+        s_dir = tempfile.mkdtemp()
+        try:
+            s_path = os.path.join(s_dir, journal.GS_JOURNAL_FILE_NAME)
+            b_ok = journal.load(s_path, dbg.fred_command_from_list) == None
+            j = journal.HistoryJournal()
+            j.open(s_path, {"name" : "master", "parent" : None})
+            j.add_checkpoint(0)
+            h0 = fred.fredhistory.History([make_cmd("next"),
+                                           make_cmd("next"),
+                                           make_cmd("step")])
+            j.sync(0, h0)
+            h0.append(make_cmd("next", 2))
+            j.sync(0, h0)
+            j.add_checkpoint(1)
+            h1 = fred.fredhistory.History([make_cmd("continue")])
+            j.sync(1, h1)
+            j.add_checkpoint(2)
+            h2 = fred.fredhistory.History([make_cmd("print")])
+            j.sync(2, h2)
+            j.set_current(1)
+            h1[0] = make_cmd("step")
+            j.sync(1, h1)
+            j.remove_checkpoint(0)
+            # Checkpoint 1 is now 0, and already journaled:
+            j.sync(0, h1)
+            j.close()
+            f = open(s_path)
+            l_ops = [json.loads(s)["op"] for s in f]
+            f.close()
+            b_ok = b_ok and l_ops == ["branch", "checkpoint", "append",
+                                      "append", "checkpoint", "append",
+                                      "checkpoint", "append", "current",
+                                      "history", "remove"]
+            t_loaded = journal.load(s_path, dbg.fred_command_from_list)
+            b_ok = b_ok and t_loaded != None
+            if b_ok:
+                (d_header, d_histories, n_current) = t_loaded
+                b_ok = d_header["name"] == "master" and n_current == 0 and \
+                       sorted(d_histories.keys()) == [0, 1] and \
+                       same(d_histories[0], h1) and \
+                       same(d_histories[1], h2)
+            # Reopened for appending, the journal goes on where it was:
+            j.open(s_path)
+            j.mark_synced(0, h1)
+            h1.append(make_cmd("next"))
+            j.sync(0, h1)
+            j.close()
+            t_loaded = journal.load(s_path, dbg.fred_command_from_list)
+            b_ok = b_ok and same(t_loaded[1][0], h1) and \
+                   same(t_loaded[1][1], h2)
+        finally:
+            shutil.rmtree(s_dir, ignore_errors=True)
+        if b_ok:
+            passed()
+        else:
+            failed()
+
+def unit_print_batch(n_count=1):
+    """Test that evaluate_expressions() prints only the uncached expressions,
+    all in one 'fred-print-values' command, and that the gdb personality
+    falls back to single prints when the batch output is malformed."""
+    dbg = fred.freddebugger
+    class FakeGdb(fred.personality.personalityGdb.PersonalityGdb):
+        def __init__(self):
+            fred.personality.personalityGdb.PersonalityGdb.__init__(self)
+            self.b_helper_loaded = True
+            self.l_commands = []
+            self.d_outputs = {}
+        def execute_command(self, s_cmd, **kwargs):
+            self.l_commands.append(s_cmd)
+            return self.d_outputs.get(s_cmd, "garbage") + "\n(gdb) "
+    for i in range(0, n_count):
+        print_test_name("unit print-batch %d" % i)
+        fake = FakeGdb()
+        fake.d_outputs = {
+            "fred-print-values a;;b;;x = 1" :
+                "FRED-VALUE 0: 1\n"
+                "FRED-VALUE 1: No symbol \"b\" in current context.\n"
+                "FRED-VALUE 2: 1",
+            "print x = 1" : "$3 = 1",
+            "print c" : "$4 = 5",
+            "print d" : "$5 = 6" }
+        rdbg = dbg.ReversibleDebugger(fake)
+        rdbg.t_position_base = ("master", 0)
+        rdbg.h_position = fred.fredhistory.History()
+        d_values = rdbg.evaluate_expressions(["a", "b", "x = 1", "a"])
+        b_ok = d_values == {"a" : "1", "b" : dbg.GS_NO_SYMBOL_ERROR,
+                            "x = 1" : "1"}
+        # Only the assignment is evaluated again:
+        d_values = rdbg.evaluate_expressions(["a", "b", "x = 1"])
+        b_ok = b_ok and d_values["a"] == "1" and d_values["x = 1"] == "1"
+        b_ok = b_ok and rdbg.evaluate_expressions(["c", "d"]) == \
+               {"c" : "5", "d" : "6"}
+        b_ok = b_ok and fake.l_commands == ["fred-print-values a;;b;;x = 1",
+                                            "print x = 1",
+                                            "fred-print-values c;;d",
+                                            "print c", "print d"]
+        if b_ok:
+            passed()
+        else:
+            failed()
+
+def unit_replay_timeout(n_count=1):
+    """Test that a command timing out during an incremental replay is
+    retried from the position the replay started from, and that no
+    deadlines are used when that position is not known."""
+    dbg = fred.freddebugger
+    class FakeDebugger(dbg.ReversibleDebugger):
+        """Executes nothing, but times out on the first n_timeouts 'step's
+        given a deadline."""
+        def __init__(self):
+            dbg.ReversibleDebugger.__init__(
+                self, fred.personality.personalityGdb.PersonalityGdb())
+            self.ckpt = dbg.Checkpoint(0)
+            self.l_executed = []
+            self.n_timeouts = 1
+            self.n_restarts = 0
+        def current_checkpoint(self):
+            return self.ckpt
+        def do_restart(self, n_index=-1, b_clear_history=False):
+            self.l_executed = []
+            self.n_restarts += 1
+            self._reset_position()
+        def execute_fred_command(self, cmd, b_update=True, n_timeout=None):
+            if cmd.s_name == "step" and n_timeout != None and \
+               self.n_timeouts > 0:
+                self.n_timeouts -= 1
+                raise fred.fredutil.PromptTimeoutException()
+            self.l_executed.append(str(cmd))
+            self._advance_position(cmd)
+        def update_state(self):
+            pass
+    def make_cmd(s_name):
+        cmd = dbg.FredCommand(s_name)
+        cmd.set_native(s_name)
+        cmd.set_count_cmd(True)
+        return cmd
+    for i in range(0, n_count):
+        print_test_name("unit replay-timeout %d" % i)
+        rdbg = FakeDebugger()
+        rdbg.do_restart()
+        rdbg.replay_history([make_cmd("next"), make_cmd("next")])
+        rdbg.replay_history([make_cmd("step")])
+        h_expected = fred.fredhistory.History([make_cmd("next"),
+                                               make_cmd("next"),
+                                               make_cmd("step")])
+        b_ok = rdbg.n_timeouts == 0 and rdbg.n_restarts == 2 and \
+               rdbg.l_executed == ["next 2", "step"] and \
+               rdbg.h_position.fingerprint() == h_expected.fingerprint()
+        rdbg._forget_position()
+        rdbg.n_timeouts = 1
+        rdbg.replay_history([make_cmd("next"), make_cmd("step")])
+        b_ok = b_ok and rdbg.n_timeouts == 1 and rdbg.n_restarts == 2 and \
+               rdbg.l_executed == ["next 2", "step", "next", "step"]
+        if b_ok:
+            passed()
+        else:
+            failed()
+
+def unit_stop_breakpoint(n_count=1):
+    """Test that a 'continue' records the breakpoint it stopped at only when
+    gdb reports stopping there, and only if the breakpoint has no ignore
+    count, and that only such continues are replayed as 'continue N'."""
+    dbg = fred.freddebugger
+    s_info = "Num     Type           Disp Enb Address            What\n" \
+             "1       breakpoint     keep y   0x0000000000401136 in main " \
+             "at t.c:5\n" \
+             "\tbreakpoint already hit 1 time\n" \
+             "2       breakpoint     keep y   0x0000000000401140 in f " \
+             "at t.c:9\n" \
+             "\tbreakpoint already hit 4 times\n" \
+             "\tWill ignore next 3 crossings of breakpoint.\n" \
+             "3       breakpoint     keep y   0x0000000000401150 in g " \
+             "at t.c:12\n" \
+             "4       breakpoint     keep y   0x0000000000401150 in g " \
+             "at t.c:12\n"
+    class FakeGdb(fred.personality.personalityGdb.PersonalityGdb):
+        def execute_command(self, s_cmd, **kwargs):
+            return s_info + "(gdb) "
+    def stopped(s_output):
+        cmd = dbg.fred_continue_cmd()
+        cmd.set_native("continue")
+        rdbg._set_stop_breakpoint(cmd, s_output)
+        return cmd
+    for i in range(0, n_count):
+        print_test_name("unit stop-breakpoint %d" % i)
+        rdbg = dbg.ReversibleDebugger(FakeGdb())
+        b_ok = [bp.n_ignore_count for bp in rdbg.get_breakpoints()] == \
+               [0, 3, 0, 0]
+        l_numbers = [stopped(s).n_stop_breakpoint for s in [
+            "\nBreakpoint 1, main () at t.c:5\n5\t  f();\n",
+            "Thread 2 \"a\" hit Breakpoint 1, main () at t.c:5\n",
+            # An ignore count, which 'continue N' would overwrite:
+            "\nBreakpoint 2, f () at t.c:9\n",
+            # Two breakpoints at the same location:
+            "\nBreakpoint 3, g () at t.c:12\n",
+            "\nTemporary breakpoint 5, main () at t.c:5\n",
+            "\nProgram received signal SIGUSR1, User defined signal 1.\n"
+            "main () at t.c:5\n",
+            "\nHardware watchpoint 6: x\n\nOld value = 0\nNew value = 1\n"
+            "main () at t.c:5\n",
+            "Run till exit from #0  f () at t.c:9\nmain () at t.c:5\n"]]
+        b_ok = b_ok and l_numbers == [1, 1, -1, -1, -1, -1, -1, -1]
+        h = fred.fredhistory.History(
+            [stopped("\nBreakpoint 1, main () at t.c:5\n")] * 4 +
+            [stopped("\nBreakpoint 2, f () at t.c:9\n")] * 3)
+        b_ok = b_ok and [str(cmd) for cmd in h.coalesced(True, True)] == \
+               ["continue", "continue 3", "continue", "continue", "continue"]
+        if b_ok:
+            passed()
+        else:
+            failed()
+
+def unit_lazy_state(n_count=1):
+    """Test that copies and comparisons of a DebuggerState with a lazy
+    backtrace only read its location, not its backtrace, and that states
+    whose backtraces were both read are compared by backtrace."""
+    dbg = fred.debugger
+    def make_frame(s_function, n_line):
+        frame = dbg.BacktraceFrame()
+        frame.s_function = s_function
+        frame.s_file = "t.c"
+        frame.n_line = n_line
+        return frame
+    def make_backtrace(l_frames):
+        bt = dbg.Backtrace()
+        for frame in l_frames:
+            bt.add_frame(frame)
+        return bt
+    l_calls = []
+    def lazy_state(n_depth, frame):
+        state = dbg.DebuggerState()
+        def get_backtrace():
+            l_calls.append("backtrace")
+            return make_backtrace([frame] + [make_frame("main", 3)] *
+                                  (n_depth - 1))
+        def get_location():
+            l_calls.append("location")
+            return frame
+        state.set_lazy_backtrace(get_backtrace, n_depth, get_location)
+        return state
+    for i in range(0, n_count):
+        print_test_name("unit lazy-state %d" % i)
+        del l_calls[:]
+        state = lazy_state(2, make_frame("f", 9))
+        copy = state.copy()
+        b_ok = l_calls == ["location"] and copy.level() == 2 and \
+               copy.location() == ("f", "t.c", 9)
+        b_ok = b_ok and copy == state and state == copy and \
+               copy.copy() == state
+        b_ok = b_ok and copy != lazy_state(3, make_frame("f", 9)) and \
+               copy != lazy_state(2, make_frame("f", 10))
+        b_ok = b_ok and "backtrace" not in l_calls
+        # Once read, backtraces are compared in full:
+        other = lazy_state(2, make_frame("f", 9))
+        other.get_backtrace()
+        state.get_backtrace()
+        b_ok = b_ok and state == other and state.copy() == other
+        other.set_backtrace(make_backtrace([make_frame("f", 9),
+                                            make_frame("g", 4)]))
+        b_ok = b_ok and state != other and copy == other
+        if b_ok:
+            passed()
+        else:
+            failed()
+
+def unit_side_effect_probes(n_count=1):
+    """Test that the history search only replays forward from a probe
+    without restarting when its predicate has no side effects:  evaluating
+    one which calls a function or assigns may change the program state, so
+    that the replay would no longer be the execution searched."""
+    binary_search = fred.algorithms.binary_search
+    h = fred.fredhistory.History([fred.freddebugger.fred_next_cmd()] * 1024)
+    class FakeDebugger():
+        """The position is the number of commands replayed since the last
+        restart.  Expressions are too far from command 701 on."""
+        def __init__(self):
+            self.n_position = 0
+            self.n_restarts = 0
+        def do_restart(self, n_index=-1, b_clear_history=False):
+            self.n_position = 0
+            self.n_restarts += 1
+        def replay_history(self, l_history=[], n=-1):
+            if n == -1:
+                n = len(l_history)
+            self.n_position += n
+        def replay_position_key(self, l_history, n_index=-1):
+            return None
+        def cached_expression_value(self, key, s_expr):
+            return None
+        def program_is_running(self):
+            return True
+        def test_expression(self, s_expr, s_expr_val):
+            return self.n_position > 700
+        def state(self):
+            state = fred.debugger.DebuggerState()
+            state.set_lazy_backtrace(None, 5, None)
+            return state
+    def search(s_expr, b_shallower):
+        dbg = FakeDebugger()
+        testIfTooFar = binary_search.ExpressionTest(dbg, s_expr, "1")
+        if b_shallower:
+            testIfTooFar = binary_search.ShallowerOrTest(dbg, 2,
+                                                         testIfTooFar)
+        n_len = len(binary_search.NEW_binary_search_history(
+            dbg, h.copy(), 0, testIfTooFar, s_strategy="bisect"))
+        return (n_len, dbg.n_restarts)
+    for i in range(0, n_count):
+        print_test_name("unit side-effect-probes %d" % i)
+        l_results = [search(s_expr, b_shallower)
+                     for b_shallower in [False, True]
+                     for s_expr in ["n > 10", "list_len(head) < 10",
+                                    "n++ > 10"]]
+        # Bisecting 1024 commands takes 10 probes, and the debugger is
+        # brought back to the last one found not too far:
+        n_free = l_results[0][1]
+        if [n_len for (n_len, n_restarts) in l_results] == [701] * 6 and \
+               n_free < 10 and \
+               [n_restarts for (n_len, n_restarts) in l_results] == \
+               [n_free, 11, 11] * 2:
+            passed()
+        else:
+            failed()
+
+def unit_reverse_finish_search(n_count=1):
+    """Test that reverse-finish finds the last position before the end of
+    the history where the stack was shallower, also when it was shallower
+    and deeper again before that, with about log2(d) restarts for a call
+    site d commands back, and none for positions in the position trace
+    but the one to go back there."""
+    reverse_finish = fred.algorithms.reverse_finish
+    def make_cmd(s_name):
+        cmd = fred.freddebugger.FredCommand(s_name)
+        cmd.set_native(s_name)
+        cmd.set_count_cmd(True)
+        return cmd
+    class FakeDebugger():
+        """The position is the number of commands replayed since the last
+        restart, and l_levels the stack level at each position."""
+        def __init__(self, l_levels, b_traced):
+            self.l_levels = l_levels
+            self.b_traced = b_traced
+            self.n_position = len(l_levels) - 1
+            self.n_restarts = 0
+        def state(self):
+            state = fred.debugger.DebuggerState()
+            state.set_lazy_backtrace(None, self.l_levels[self.n_position],
+                                     None)
+            return state
+        def at_breakpoint(self):
+            return False
+        def do_restart(self, n_index=-1, b_clear_history=False):
+            self.n_position = 0
+            self.n_restarts += 1
+        def replay_history(self, l_history=[], n=-1):
+            if n == -1:
+                n = len(l_history)
+            self.n_position += n
+        def traced_level(self, l_history):
+            if self.b_traced:
+                return self.l_levels[len(l_history)]
+            return None
+        def traced_at_breakpoint(self, l_history):
+            if self.b_traced:
+                return False
+            return None
+    def search(l_levels, b_traced):
+        h = fred.fredhistory.History(
+            [make_cmd("next") for n_level in l_levels[1:]])
+        dbg = FakeDebugger(l_levels, b_traced)
+        n_found = len(reverse_finish._search_shallower_level(dbg, h, 2))
+        return (n_found, dbg.n_position, dbg.n_restarts)
+    for i in range(0, n_count):
+        print_test_name("unit reverse-finish-search %d" % i)
+        # A call site 29 commands back, and a step into another call at the
+        # same depth before it:
+        l_results = [search(l_levels, b_traced)
+                     for l_levels in [[1] * 10 + [2] * 29,
+                                      [1, 1, 2, 2, 1, 1, 1] + [2] * 6]
+                     for b_traced in [False, True]]
+        if l_results == [(9, 9, 6), (9, 9, 1), (6, 6, 4), (6, 6, 1)]:
+            passed()
+        else:
+            failed()
+
 def run_unit_tests():
     """Run all available unit tests."""
-    pass
+    unit_fred_shm()
+    unit_fred_log()
+    unit_thread_rank()
+    unit_position_trace()
+    unit_speculation()
+    unit_cost_model()
+    unit_side_effects()
+    unit_history_search()
+    unit_history()
+    unit_breakpoint_table()
+    unit_expression_cache()
+    unit_command_deadlines()
+    unit_journal()
+    unit_print_batch()
+    unit_replay_timeout()
+    unit_stop_breakpoint()
+    unit_lazy_state()
+    unit_side_effect_probes()
+    unit_reverse_finish_search()
 
 def run_tests(ls_test_list):
     """Run given list of tests, or all tests if None."""
@@ -638,7 +1595,26 @@ def initialize_tests():
                  "gdb-reverse-step"  : gdb_reverse_step,
                  "gdb-reverse-continue"  : gdb_reverse_continue,
                  "gdb-reverse-finish"  : gdb_reverse_finish,
-                 "gdb-reverse-finish-2"  : gdb_reverse_finish_2 }
+                 "gdb-reverse-finish-2"  : gdb_reverse_finish_2,
+                 "unit-fred-shm" : unit_fred_shm,
+                 "unit-fred-log" : unit_fred_log,
+                 "unit-thread-rank" : unit_thread_rank,
+                 "unit-position-trace" : unit_position_trace,
+                 "unit-speculation" : unit_speculation,
+                 "unit-cost-model" : unit_cost_model,
+                 "unit-side-effects" : unit_side_effects,
+                 "unit-history-search" : unit_history_search,
+                 "unit-history" : unit_history,
+                 "unit-breakpoint-table" : unit_breakpoint_table,
+                 "unit-expression-cache" : unit_expression_cache,
+                 "unit-command-deadlines" : unit_command_deadlines,
+                 "unit-journal" : unit_journal,
+                 "unit-print-batch" : unit_print_batch,
+                 "unit-replay-timeout" : unit_replay_timeout,
+                 "unit-stop-breakpoint" : unit_stop_breakpoint,
+                 "unit-lazy-state" : unit_lazy_state,
+                 "unit-side-effect-probes" : unit_side_effect_probes,
+                 "unit-reverse-finish-search" : unit_reverse_finish_search }
 
 def main():
     """Program execution starts here."""
@@ -0,0 +1,167 @@
+#!/usr/bin/python
+
+###############################################################################
+# Copyright (C) 2009, 2010, 2011, 2012 by Kapil Arya, Gene Cooperman,         #
+#                                        Tyler Denniston, and Ana-Maria Visan #
+# {kapil,gene,tyler,amvisan}@ccs.neu.edu                                      #
+#                                                                             #
+# This file is part of FReD.                                                  #
+#                                                                             #
+# FReD is free software: you can redistribute it and/or modify                #
+# it under the terms of the GNU General Public License as published by        #
+# the Free Software Foundation, either version 3 of the License, or           #
+# (at your option) any later version.                                         #
+#                                                                             #
+# FReD is distributed in the hope that it will be useful,                     #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of              #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the               #
+# GNU General Public License for more details.                                #
+#                                                                             #
+# You should have received a copy of the GNU General Public License           #
+# along with FReD.  If not, see <http://www.gnu.org/licenses/>.               #
+###############################################################################
+
+"""
+Search worker, started by fred/algorithms/parallel_search.py (never by
+the user).  It restarts one checkpoint of the parent FReD session under its
+own DMTCP coordinator, evaluates an expression, writes the result as JSON
+({"value": ..., "seconds": ...}) to the result file, and kills everything
+it started.
+
+With --speculate HISTORY-FILE, it is instead the speculation worker of
+fred/algorithms/speculation.py:  it replays the given history from the
+checkpoint, performs each speculated reverse command, and writes the
+resulting histories as JSON ({command: encoded history, ...}) to the
+result file as each one finishes.
+"""
+from optparse import OptionParser
+import json
+import os
+import re
+import shutil
+import signal
+import sys
+import time
+
+import fredapp
+from fred import dmtcpmanager
+from fred import freddebugger
+from fred import fredio
+from fred import fredjournal
+from fred import fredmanager
+from fred import fredutil
+from fred.algorithms import speculation
+
+GS_WORKER_USAGE = "USAGE: %prog [options] xdb CHECKPOINT-INDEX [EXPRESSION]"
+
+def parse_worker_args():
+    """Parse the command line.  Return (options, debugger name, checkpoint
+    index, expression)."""
+    parser = OptionParser(usage=GS_WORKER_USAGE)
+    parser.add_option("-p", "--port", dest="dmtcp_port", type="int",
+                      help="Use PORT for DMTCP port number.", metavar="PORT")
+    parser.add_option("--tmpdir", dest="tmpdir",
+                      help="Use DIR as DMTCP_TMPDIR.", metavar="DIR")
+    parser.add_option("--checkpoint-dir", dest="checkpoint_dir",
+                      help="Restart checkpoint images from DIR.",
+                      metavar="DIR")
+    parser.add_option("--result", dest="result",
+                      help="Write the result to FILE.", metavar="FILE")
+    parser.add_option("--speculate", dest="speculate",
+                      help="Speculate reverse commands after the history "
+                      "in FILE instead of evaluating an expression.",
+                      metavar="FILE")
+    parser.add_option("--enable-debug", dest="debug", default=False,
+                      action="store_true",
+                      help="Enable FReD debugging messages.")
+    (options, l_args) = parser.parse_args()
+    n_args = 2 if options.speculate != None else 3
+    if len(l_args) != n_args or None in (options.dmtcp_port, options.tmpdir,
+                                         options.checkpoint_dir,
+                                         options.result):
+        parser.print_help()
+        sys.exit(1)
+    return (options, l_args[0], int(l_args[1]),
+            l_args[2] if n_args == 3 else None)
+
+def write_json(s_path, obj):
+    """Write obj to s_path as JSON atomically, so the parent never reads
+    half of it."""
+    f = open(s_path + ".tmp", "w")
+    json.dump(obj, f)
+    f.close()
+    os.rename(s_path + ".tmp", s_path)
+
+def write_result(s_path, s_val, f_seconds):
+    """Write the result file of an evaluation."""
+    write_json(s_path, {"value" : s_val, "seconds" : f_seconds})
+
+def evaluate(dbg, options, n_index, s_expr):
+    """Restart checkpoint n_index and write the value of s_expr there."""
+    f_start = time.time()
+    dmtcpmanager.restart_files(
+        dmtcpmanager.get_checkpoint_files(n_index, options.checkpoint_dir))
+    dbg.set_real_debugger_pid(fredio.get_child_pid())
+    if dbg.personality_name() == "gdb":
+        fredmanager.reset_real_inferior_pid(dbg.get_real_debugger_pid())
+    s_val = dbg.evaluate_expression(s_expr)
+    write_result(options.result, s_val, time.time() - f_start)
+
+def speculate(dbg, options, n_index):
+    """Make checkpoint n_index of the parent the only checkpoint of this
+    session, and write the result of each speculated command after the
+    history in the --speculate file."""
+    # The reverse commands restart as often as they need to, so the images
+    # are linked in as this session's checkpoint 0.
+    for f in dmtcpmanager.get_checkpoint_files(n_index,
+                                               options.checkpoint_dir):
+        s_name = re.search("(ckpt_.*\.dmtcp)\..*",
+                           os.path.basename(f)).group(1)
+        os.symlink(f, os.path.join(options.tmpdir, s_name + ".0"))
+    ckpt = freddebugger.Checkpoint()
+    dbg.branch.add_checkpoint(ckpt)
+    dbg.branch.set_current_checkpoint(ckpt)
+    f = open(options.speculate)
+    l_history = fredjournal.decode_history(json.load(f),
+                                           freddebugger.fred_command_from_list)
+    f.close()
+    d_results = {}
+    for (s_command, l_result) in speculation.speculate(dbg, l_history):
+        d_results[s_command] = fredjournal.encode_history(l_result)
+        write_json(options.result, d_results)
+
+def _terminate(n_signal, frame):
+    """SIGTERM handler:  exit through the cleanup of main()."""
+    sys.exit(1)
+
+def main():
+    (options, s_debugger, n_index, s_expr) = parse_worker_args()
+    # The speculation worker is cancelled with SIGTERM.
+    signal.signal(signal.SIGTERM, _terminate)
+    # The environment is inherited from the parent session: override it.
+    fredutil.GB_DEBUG = options.debug
+    os.environ["DMTCP_PORT"] = str(options.dmtcp_port)
+    os.environ["DMTCP_TMPDIR"] = options.tmpdir
+    os.environ["DMTCP_CHECKPOINT_DIR"] = options.tmpdir
+    os.makedirs(options.tmpdir, 0755)
+    fredapp.setup_debugger(s_debugger)
+    dbg = fredapp.g_debugger
+    fredapp.setup_fredio([s_debugger], False)
+    if not dmtcpmanager.start_coordinator(options.dmtcp_port):
+        fredutil.fred_fatal("Cannot start coordinator on port %d." %
+                            options.dmtcp_port)
+    try:
+        if options.speculate != None:
+            speculate(dbg, options, n_index)
+        else:
+            evaluate(dbg, options, n_index, s_expr)
+    finally:
+        fredmanager.kill_inferior()
+        dmtcpmanager.kill_peers()
+        fredio.kill_child()
+        dmtcpmanager.kill_coordinator(options.dmtcp_port)
+        shutil.rmtree(options.tmpdir, ignore_errors=True)
+    fredutil.fred_quit(0)
+
+if __name__ == '__main__':
+    main()
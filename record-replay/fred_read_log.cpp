@@ -30,6 +30,7 @@
 #include <stdio.h>
 #include <unistd.h>
 #include <stdlib.h>
+#include <string.h>
 #include <assert.h>
 #include <string>
 #include <map>
@@ -84,6 +85,18 @@ void rewriteLog(char *log_path)
   }
 }
 
+/* Print one line per event: "<event id> <name> <number of actual fields>
+ * <payload size>".  fred/fredlog.py reads this table to walk the log
+ * without linking against the wrappers. */
+void printEventTable()
+{
+  log_entry_t entry = EMPTY_LOG_ENTRY;
+  for (int i = 0; i < numTotalWrappers; i++) {
+    entry.setEventId((event_code_t) i);
+    printf("%d %s %zu %zu\n", i, log_event_str[i],
+           getNumActualFieldsInLogEvent(&entry), getLogEventSize(&entry));
+  }
+}
 
 void initializeJalib()
 {
@@ -127,9 +140,14 @@ void initializeJalib()
 
 int main(int argc, char **argv) {
   if (argc < 2) {
-    fprintf(stderr, "USAGE: %s /path/to/sync-log\n", argv[0]);
+    fprintf(stderr, "USAGE: %s /path/to/sync-log\n"
+                    "       %s --event-table\n", argv[0], argv[0]);
     return 1;
   }
+  if (strcmp(argv[1], "--event-table") == 0) {
+    printEventTable();
+    return 0;
+  }
   initializeJalib();
   rewriteLog(argv[1]);
   return 0;